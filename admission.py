@@ -0,0 +1,163 @@
+"""
+Admission Control
+Antrian terbatas untuk request mahal (POST /ask): batas concurrency, deadline per
+request, kelas prioritas, dan penolakan cepat (load shedding) saat antrian melambat,
+supaya kapasitas tidak habis untuk jawaban yang tidak akan diterima client
+"""
+
+import os
+import math
+import heapq
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ASK_MAX_CONCURRENT = int(os.getenv("ASK_MAX_CONCURRENT", "8"))  # Request /ask yang diproses bersamaan
+ASK_MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "64"))  # Request yang boleh menunggu
+ASK_TARGET_QUEUE_DELAY = float(os.getenv("ASK_TARGET_QUEUE_DELAY", "2.0"))  # Detik; di atas ini request baru ditolak
+ASK_DEFAULT_DEADLINE = float(os.getenv("ASK_DEFAULT_DEADLINE", "30"))  # Detik sejak request diterima
+BATCH_QUEUE_SHARE = 0.5  # Porsi antrian maksimum untuk kelas batch
+SERVICE_TIME_ALPHA = 0.2  # Bobot EWMA durasi proses
+INITIAL_SERVICE_TIME = 3.0  # Detik; estimasi awal sebelum ada sampel
+
+PRIORITY_CLASSES = ("interactive", "batch")  # Urutan = prioritas
+
+
+class AdmissionRejected(Exception):
+    """Request ditolak atau kedaluwarsa; status_code 429/503 dengan retry_after (detik)"""
+
+    def __init__(self, reason: str, status_code: int = 503, retry_after: int = 1):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Maksimal `max_concurrent` request diproses; sisanya menunggu di antrian prioritas
+    (interactive sebelum batch, FIFO di dalam kelas). Request baru langsung ditolak jika:
+    - antrian penuh (503), atau kelas batch melebihi porsinya (429)
+    - request tertua sudah menunggu lebih lama dari `target_delay` (429 untuk batch,
+      503 untuk interactive), tanda antrian tidak lagi terkuras
+    - estimasi waktu tunggu melewati deadline request (503)
+    Request yang masih menunggu saat deadline lewat dikeluarkan dari antrian (503).
+    Semua method dipanggil dari event loop, sehingga tidak perlu lock.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ASK_MAX_CONCURRENT,
+        max_queue: int = ASK_MAX_QUEUE,
+        target_delay: float = ASK_TARGET_QUEUE_DELAY,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.target_delay = target_delay
+        self.in_flight = 0
+        self.service_time = INITIAL_SERVICE_TIME
+        self._heap = []  # (prioritas, urutan, future)
+        self._enqueued_at: Dict[asyncio.Future, float] = {}
+        self._batch_waiting = 0
+        self._sequence = itertools.count()
+        self.counters = {"admitted": 0, "rejected": 0, "expired": 0, "cancelled": 0}
+
+    def queue_delay(self) -> float:
+        """Umur request tertua yang masih menunggu (0 jika antrian kosong)"""
+        if not self._enqueued_at:
+            return 0.0
+        return time.monotonic() - min(self._enqueued_at.values())
+
+    def estimated_wait(self, position: int) -> float:
+        return position * self.service_time / self.max_concurrent
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait(len(self._enqueued_at) + 1)))
+
+    def _reject(self, reason: str, status_code: int = 503):
+        self.counters["rejected"] += 1
+        logger.warning(f"🚫 Request /ask ditolak ({status_code}): {reason}")
+        raise AdmissionRejected(reason, status_code, self._retry_after())
+
+    async def _acquire(self, priority: str, deadline: float):
+        if self.in_flight < self.max_concurrent and not self._enqueued_at:
+            self.in_flight += 1
+            return
+
+        batch = priority == "batch"
+        waiting = len(self._enqueued_at)
+        if waiting >= self.max_queue:
+            self._reject("admission queue is full")
+        if batch and self._batch_waiting >= self.max_queue * BATCH_QUEUE_SHARE:
+            self._reject("batch share of the admission queue is full", 429)
+        if self.queue_delay() > self.target_delay:
+            self._reject("queue delay exceeds target", 429 if batch else 503)
+        now = time.monotonic()
+        if now + self.estimated_wait(waiting + 1) > deadline:
+            self._reject("deadline cannot be met at the current queue length")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (PRIORITY_CLASSES.index(priority), next(self._sequence), future))
+        self._enqueued_at[future] = now
+        self._batch_waiting += batch
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - now))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self._release()  # Slot sudah diberikan tepat saat menyerah; kembalikan
+            else:
+                future.cancel()  # Dilewati saat slot berikutnya dibagikan
+            if isinstance(e, asyncio.CancelledError):
+                self.counters["cancelled"] += 1
+                raise
+            self.counters["expired"] += 1
+            raise AdmissionRejected("deadline exceeded while queued", 503, self._retry_after())
+        finally:
+            self._enqueued_at.pop(future, None)
+            self._batch_waiting -= batch
+
+    def _release(self):
+        self.in_flight -= 1
+        while self._heap and self.in_flight < self.max_concurrent:
+            _, _, future = heapq.heappop(self._heap)
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            future.set_result(True)
+
+    async def run(
+        self, fn: Callable[[], Awaitable[Any]], priority: str = "interactive", deadline: Optional[float] = None
+    ) -> Any:
+        """
+        Menunggu slot lalu menjalankan fn(). deadline adalah waktu time.monotonic()
+        absolut; default ASK_DEFAULT_DEADLINE detik dari sekarang.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"priority harus salah satu dari {PRIORITY_CLASSES}")
+        if deadline is None:
+            deadline = time.monotonic() + ASK_DEFAULT_DEADLINE
+
+        await self._acquire(priority, deadline)
+        self.counters["admitted"] += 1
+        started = time.monotonic()
+        try:
+            return await fn()
+        finally:
+            elapsed = time.monotonic() - started
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": len(self._enqueued_at),
+            "queue_delay_seconds": round(self.queue_delay(), 3),
+            "service_time_seconds": round(self.service_time, 3),
+            **self.counters
+        }
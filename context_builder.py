@@ -0,0 +1,201 @@
+"""
+Context Builder
+Menyusun dokumen referensi dan conversation history untuk prompt dalam batas
+token tertentu, beserta laporan pemakaian token per request
+"""
+
+import os
+import logging
+from typing import List, Dict, Any, Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken biasanya ikut terpasang bersama langchain-openai
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))  # Batas token prompt (tanpa jawaban)
+HISTORY_MIN_TOKENS = int(os.getenv("HISTORY_MIN_TOKENS", "300"))  # Jatah minimum history saat dokumen penuh
+HISTORY_ANSWER_MAX_TOKENS = int(os.getenv("HISTORY_ANSWER_MAX_TOKENS", "150"))  # Jawaban lama dipotong ke N token
+MIN_PARTIAL_DOCUMENT_TOKENS = 100  # Sisa budget di bawah ini tidak dipakai untuk potongan dokumen
+CHARS_PER_TOKEN = 4  # Aproksimasi jika tiktoken tidak tersedia
+
+DOCUMENT_SEPARATOR = "\n\n---\n\n"
+
+_encoders = {}
+
+
+def _get_encoder(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encoders[model] = tiktoken.get_encoding("cl100k_base")
+    return _encoders[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Menghitung jumlah token teks dengan tiktoken, atau aproksimasi len/4 jika tidak tersedia
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder(model)
+    if encoder is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """
+    Memotong teks menjadi maksimal max_tokens token
+    """
+    if max_tokens <= 0:
+        return ""
+    encoder = _get_encoder(model)
+    if encoder is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars] + "..."
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens]) + "..."
+
+
+def format_document(doc: Dict) -> str:
+    """Format satu chunk dokumen untuk bagian DOKUMEN REFERENSI"""
+    header = doc.get('filename', 'Unknown')
+    if doc.get("section_path"):
+        header = f"{header} | {doc['section_path']}"
+    return f"[File: {header}]\n{doc.get('text', '')}"
+
+
+def format_conversation_context(history: List[Dict], num_recent: int = 3) -> str:
+    """
+    Mengubah history percakapan (list of {question, answer}) menjadi teks context
+    """
+    if not history or num_recent <= 0:
+        return ""
+
+    context_parts = []
+    for i, exchange in enumerate(history[-num_recent:], 1):
+        context_parts.append(f"Q{i}: {exchange['question']}")
+        context_parts.append(f"A{i}: {exchange['answer']}")
+
+    return "\n".join(context_parts)
+
+
+class ContextBuilder:
+    """
+    Mengisi budget token prompt dengan urutan prioritas:
+    1. bagian tetap prompt (instruksi + pertanyaan), dihitung oleh pemanggil sebagai reserved_tokens
+    2. dokumen sesuai urutan ranking; dokumen terakhir yang tidak muat dipotong
+    3. history percakapan (terbaru dulu) dengan jawaban lama dipadatkan
+
+    History dikorbankan lebih dulu: saat dokumen memenuhi budget, history hanya
+    mendapat jatah HISTORY_MIN_TOKENS.
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        history_min_tokens: int = HISTORY_MIN_TOKENS,
+        history_answer_max_tokens: int = HISTORY_ANSWER_MAX_TOKENS,
+    ):
+        self.model = model
+        self.budget = budget
+        self.history_min_tokens = history_min_tokens
+        self.history_answer_max_tokens = history_answer_max_tokens
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def _compress_history(self, history: List[Dict]) -> List[Dict]:
+        """Memotong jawaban lama supaya history tidak mendominasi prompt"""
+        return [
+            {
+                "question": exchange["question"],
+                "answer": truncate_to_tokens(exchange["answer"], self.history_answer_max_tokens, self.model)
+            }
+            for exchange in history
+        ]
+
+    def _fit_history(self, history: List[Dict], allowance: int):
+        """Mengambil turn terbaru sebanyak mungkin yang muat dalam allowance token"""
+        selected = []
+        for exchange in reversed(history):
+            candidate = [exchange] + selected
+            text = format_conversation_context(candidate, len(candidate))
+            if self.count(text) > allowance:
+                break
+            selected = candidate
+        text = format_conversation_context(selected, len(selected))
+        return text, len(selected)
+
+    def build(self, documents: List[Dict], history: Optional[List[Dict]] = None, reserved_tokens: int = 0) -> Dict[str, Any]:
+        """
+        Memilih dokumen dan history yang muat dalam budget.
+        Mengembalikan dict {document_context, conversation_context, documents, usage}
+        dengan `documents` berisi chunk yang benar-benar masuk prompt (urut ranking).
+        """
+        available = max(0, self.budget - reserved_tokens)
+        history = self._compress_history(history or [])
+        full_history_tokens = self.count(format_conversation_context(history, len(history)))
+        separator_tokens = self.count(DOCUMENT_SEPARATOR)
+
+        # Dokumen diisi dulu, dengan menyisakan jatah minimum untuk history
+        document_allowance = available - min(full_history_tokens, self.history_min_tokens)
+        included = []
+        document_tokens = 0
+        truncated = 0
+
+        for doc in documents:
+            cost = self.count(format_document(doc)) + (separator_tokens if included else 0)
+            if document_tokens + cost <= document_allowance:
+                included.append(doc)
+                document_tokens += cost
+                continue
+
+            remaining = document_allowance - document_tokens - (separator_tokens if included else 0)
+            header_tokens = self.count(format_document({**doc, "text": ""}))
+            if remaining - header_tokens >= MIN_PARTIAL_DOCUMENT_TOKENS:
+                partial = {**doc, "text": truncate_to_tokens(doc.get("text", ""), remaining - header_tokens, self.model), "truncated": True}
+                included.append(partial)
+                document_tokens += self.count(format_document(partial)) + (separator_tokens if len(included) > 1 else 0)
+                truncated += 1
+            break
+
+        document_context = DOCUMENT_SEPARATOR.join(format_document(doc) for doc in included)
+        conversation_context, history_turns = self._fit_history(history, available - document_tokens)
+        history_tokens = self.count(conversation_context)
+
+        usage = {
+            "budget": self.budget,
+            "reserved_tokens": reserved_tokens,
+            "document_tokens": document_tokens,
+            "history_tokens": history_tokens,
+            "estimated_prompt_tokens": reserved_tokens + document_tokens + history_tokens,
+            "documents_included": len(included),
+            "documents_truncated": truncated,
+            "documents_dropped": len(documents) - len(included),
+            "history_turns_included": history_turns,
+            "history_turns_dropped": len(history) - history_turns,
+            "tokenizer": "tiktoken" if tiktoken is not None else "approx"
+        }
+
+        if usage["documents_dropped"] or usage["history_turns_dropped"]:
+            logger.info(
+                f"✂️ Context dipangkas ke budget {self.budget} token: "
+                f"{usage['documents_dropped']} dokumen dan {usage['history_turns_dropped']} turn history tidak dipakai"
+            )
+
+        return {
+            "document_context": document_context,
+            "conversation_context": conversation_context,
+            "documents": included,
+            "usage": usage
+        }
@@ -0,0 +1,160 @@
+"""
+Corpus Generation
+Counter versi korpus per tenant di MongoDB yang naik setiap kali ingest, delete
+atau swap index. Cache di komponen mana pun dapat memakai generation sebagai
+bagian key, dan setiap worker mengetahui perubahan lewat polling atau change stream
+"""
+
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+try:
+    from pymongo import ReturnDocument
+    from pymongo.errors import PyMongoError
+except ImportError:  # pragma: no cover - pymongo selalu terpasang bersama engine
+    ReturnDocument = None
+    PyMongoError = ()
+
+logger = logging.getLogger(__name__)
+
+CORPUS_COLLECTION_NAME = "pdf_corpus_state"
+CORPUS_POLL_INTERVAL = float(os.getenv("CORPUS_POLL_INTERVAL", "2"))  # Detik antar polling generation
+CORPUS_CHANGE_STREAM = os.getenv("CORPUS_CHANGE_STREAM", "auto")  # auto | true | false
+
+
+class CorpusGeneration:
+    """
+    Satu dokumen per tenant di `pdf_corpus_state`: {tenant_id, generation, reason, updated_at}.
+
+    - bump() menaikkan generation secara atomik ($inc) dan bisa ikut transaksi ingest/delete
+    - current() membaca nilai lokal yang selalu diperbarui watcher; tanpa watcher dibaca
+      langsung dari MongoDB
+    - subscribe(callback) dipanggil dengan (tenant_id, generation) setiap kali berubah,
+      termasuk perubahan dari worker lain
+    """
+
+    def __init__(self, collection, poll_interval: float = CORPUS_POLL_INTERVAL,
+                 change_stream: str = CORPUS_CHANGE_STREAM):
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.change_stream = change_stream
+        self._generations: Dict[str, int] = {}
+        self._listeners: List[Callable[[str, int], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.mode = None  # "change_stream" atau "polling" saat watcher berjalan
+
+    def ensure_indexes(self):
+        self.collection.create_index("tenant_id", unique=True)
+
+    def bump(self, tenant_id: str, reason: str, session=None) -> int:
+        """Menaikkan generation tenant dan mengembalikan nilai barunya"""
+        state = self.collection.find_one_and_update(
+            {"tenant_id": tenant_id},
+            {"$inc": {"generation": 1}, "$set": {"reason": reason, "updated_at": datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 0, "generation": 1},
+            session=session
+        )
+        generation = state["generation"]
+        if session is None:
+            # Dalam transaksi, pemanggil memanggil observe() setelah commit
+            self.observe(tenant_id, generation)
+        logger.info(f"🔢 Corpus generation tenant '{tenant_id}' -> {generation} ({reason})")
+        return generation
+
+    def current(self, tenant_id: str) -> int:
+        """Generation korpus tenant saat ini (0 jika belum pernah berubah)"""
+        if self.is_watching():
+            with self._lock:
+                if tenant_id in self._generations:
+                    return self._generations[tenant_id]
+        state = self.collection.find_one({"tenant_id": tenant_id}, {"_id": 0, "generation": 1})
+        generation = state["generation"] if state else 0
+        self.observe(tenant_id, generation)
+        return generation
+
+    def subscribe(self, callback: Callable[[str, int], None]):
+        """Mendaftarkan callback(tenant_id, generation) yang dipanggil saat generation berubah"""
+        self._listeners.append(callback)
+
+    def observe(self, tenant_id: str, generation: int):
+        """Mencatat generation yang diketahui (misalnya setelah transaksi commit) dan memberi tahu listener"""
+        with self._lock:
+            previous = self._generations.get(tenant_id)
+            if previous is not None and generation <= previous:
+                return  # Nilai lama (urutan polling/commit); generation tidak pernah turun
+            self._generations[tenant_id] = generation
+        if previous is None:
+            return
+        for callback in list(self._listeners):
+            try:
+                callback(tenant_id, generation)
+            except Exception as e:
+                logger.warning(f"⚠️ Listener corpus generation gagal: {e}")
+
+    def refresh(self):
+        """Membaca generation semua tenant sekaligus (satu query kecil)"""
+        for state in self.collection.find({}, {"_id": 0, "tenant_id": 1, "generation": 1}):
+            self.observe(state["tenant_id"], state.get("generation", 0))
+
+    # === Watcher ===
+    def is_watching(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Menjalankan watcher di background thread (change stream jika tersedia, selain itu polling)"""
+        if self.is_watching():
+            return
+        self._stop.clear()
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="corpus-generation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def _run(self):
+        if self.change_stream != "false":
+            try:
+                self._watch_change_stream()
+                return
+            except PyMongoError as e:
+                # Change stream butuh replica set; MongoDB standalone memakai polling
+                if self.change_stream == "true":
+                    logger.error(f"❌ Change stream corpus generation gagal: {e}")
+                    return
+                logger.info(f"ℹ️ Change stream tidak tersedia ({e}), corpus generation memakai polling")
+        self._poll()
+
+    def _watch_change_stream(self):
+        self.mode = "change_stream"
+        logger.info("👀 Corpus generation dipantau lewat change stream")
+        with self.collection.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                document = (change or {}).get("fullDocument")
+                if document:
+                    self.observe(document["tenant_id"], document.get("generation", 0))
+
+    def _poll(self):
+        self.mode = "polling"
+        logger.info(f"👀 Corpus generation dipantau lewat polling setiap {self.poll_interval} detik")
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except PyMongoError as e:
+                logger.warning(f"⚠️ Polling corpus generation gagal: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            generations = dict(self._generations)
+        return {"mode": self.mode if self.is_watching() else None, "generations": generations}
@@ -0,0 +1,174 @@
+"""
+Embedding Cache
+Cache embedding persisten berbasis SQLite dengan key (model, hash teks),
+eviction LRU berdasarkan ukuran file dan statistik hit/miss
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+EVICTION_TARGET_RATIO = 0.9  # Setelah eviction, ukuran cache turun ke 90% dari batas
+
+
+def get_text_hash(text: str) -> str:
+    """Hash sha256 dari teks persis seperti yang dikirim ke model embedding"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding di file SQLite. Vector disimpan sebagai float32 (BLOB) sehingga
+    satu embedding 1536 dimensi memakan ~6 KB. Aman dipakai dari banyak thread.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_mb: float = EMBEDDING_CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Mengambil embedding untuk banyak teks. Teks yang tidak ada di cache menghasilkan None.
+        """
+        hashes = [get_text_hash(text) for text in texts]
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            # SQLite membatasi jumlah parameter per query, jadi lookup dipecah per 500
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """
+        Menyimpan embedding ke cache. Embedding kosong (gagal dibuat) diabaikan.
+        """
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            if not embedding:
+                continue
+            blob = array("f", embedding).tobytes()
+            rows.append((model, get_text_hash(text), blob, len(blob), now))
+
+        if not rows:
+            return
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            inserted = self._conn.total_changes - before
+            if inserted == len(rows):
+                self._size_bytes += sum(row[3] for row in rows)
+            elif inserted:
+                self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        self.put_many(model, [text], [embedding])
+
+    def _evict(self):
+        """Menghapus entry yang paling lama tidak diakses sampai ukuran di bawah target"""
+        target = int(self.max_bytes * EVICTION_TARGET_RATIO)
+        removed = 0
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM embeddings ORDER BY last_access LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+
+            to_delete = []
+            for rowid, size in rows:
+                to_delete.append((rowid,))
+                self._size_bytes -= size
+                if self._size_bytes <= target:
+                    break
+
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", to_delete)
+            removed += len(to_delete)
+
+        self._conn.commit()
+        self.evictions += removed
+        logger.info(f"🧹 Embedding cache: {removed} entry di-evict (ukuran {self._size_bytes / 1024 / 1024:.1f} MB)")
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistik hit/miss dan ukuran cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "size_mb": round(self._size_bytes / 1024 / 1024, 2),
+                "max_size_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
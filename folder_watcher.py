@@ -0,0 +1,183 @@
+"""
+Folder Watcher
+Memantau folder PDF (polling + debounce) dan memasukkan file baru, berubah,
+atau terhapus ke pipeline ingest RagEngine secara otomatis
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from rag_engine import RagEngine
+
+logger = logging.getLogger(__name__)
+
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2"))  # Detik antar scan stat()
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "3"))  # File harus stabil selama N detik
+
+EVENT_UPSERT = "upsert"
+EVENT_DELETE = "delete"
+
+
+class FolderWatcher:
+    """
+    Watcher berbasis polling stat() (mtime, size) sehingga tidak perlu hashing atau
+    ekstraksi seluruh folder setiap siklus. Perubahan baru dikirim ke antrian setelah
+    file tidak berubah selama `debounce` detik (upload/copy yang belum selesai tidak
+    ikut diproses). Satu worker thread memproses antrian secara berurutan.
+    """
+
+    def __init__(
+        self,
+        engine: "RagEngine",
+        folders: List[str],
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        debounce: float = WATCH_DEBOUNCE,
+        initial_sync: bool = True,
+    ):
+        self.engine = engine
+        self.folders = folders
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.initial_sync = initial_sync
+        self.events = queue.Queue()
+        self.processed = 0
+        self._snapshot: Dict[str, Tuple[float, int]] = {}
+        self._pending: Dict[str, Tuple[str, Tuple[float, int], float]] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        """
+        Snapshot (mtime, size) untuk semua PDF di folder yang dipantau; os.scandir
+        mengambil listing dan stat sekaligus
+        """
+        snapshot = {}
+        for folder in self.folders:
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.name.lower().endswith(".pdf"):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        """
+        Satu siklus polling: bandingkan snapshot dengan state terakhir yang sudah
+        dikirim ke antrian, catat perubahan sebagai pending, lalu kirim perubahan
+        yang sudah stabil selama `debounce` detik
+        """
+        now = time.monotonic()
+        current = self._scan()
+
+        for path, signature in current.items():
+            if self._snapshot.get(path) == signature:
+                self._pending.pop(path, None)
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[1] != signature:
+                self._pending[path] = (EVENT_UPSERT, signature, now)
+
+        for path in set(self._snapshot) | set(self._pending):
+            if path in current:
+                continue
+            if path not in self._snapshot:
+                self._pending.pop(path, None)  # Muncul lalu hilang sebelum sempat diproses
+            elif self._pending.get(path, (None,))[0] != EVENT_DELETE:
+                self._pending[path] = (EVENT_DELETE, None, now)
+
+        for path, (event, signature, changed_at) in list(self._pending.items()):
+            if now - changed_at < self.debounce:
+                continue
+            del self._pending[path]
+            if event == EVENT_UPSERT:
+                self._snapshot[path] = signature
+            else:
+                self._snapshot.pop(path, None)
+            self.events.put((event, path))
+
+    def handle(self, event: str, path: str):
+        """Memproses satu event: ingest incremental atau hapus file dari database dan index"""
+        filename = os.path.basename(path)
+        if event == EVENT_DELETE:
+            if any(os.path.exists(os.path.join(folder, filename)) for folder in self.folders):
+                return  # File dengan nama sama masih ada di folder lain
+            deleted = self.engine.delete_file(filename)
+            logger.info(f"🗑️ [watch] {filename} dihapus ({deleted} chunks)")
+        else:
+            started = time.monotonic()
+            result = self.engine.ingest_pdf_file(path)
+            logger.info(
+                f"👀 [watch] {filename}: {result['status']}, {result['chunks']} chunks "
+                f"({time.monotonic() - started:.1f}s)"
+            )
+        self.processed += 1
+
+    def _poll_loop(self):
+        if self.initial_sync:
+            for path in sorted(self._scan()):
+                self.events.put((EVENT_UPSERT, path))
+        self._snapshot = self._scan()
+
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"❌ [watch] Error scanning folders: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                event, path = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.handle(event, path)
+            except Exception as e:
+                logger.error(f"❌ [watch] Error processing {path}: {e}")
+            finally:
+                self.events.task_done()
+
+    def start(self):
+        """Menjalankan polling dan worker di background thread"""
+        for folder in self.folders:
+            os.makedirs(folder, exist_ok=True)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._poll_loop, name="folder-watcher-poll", daemon=True),
+            threading.Thread(target=self._worker_loop, name="folder-watcher-worker", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"👀 Memantau folder: {', '.join(self.folders)} (poll {self.poll_interval}s, debounce {self.debounce}s)")
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def run_forever(self):
+        """Menjalankan watcher di foreground sampai Ctrl+C"""
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
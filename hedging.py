@@ -0,0 +1,189 @@
+"""
+Hedged Requests
+Memangkas tail latency panggilan OpenAI di jalur jawaban: jika panggilan belum selesai
+setelah delay persentil latensi, kirim duplikat dan pakai yang selesai lebih dulu
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"  # Opt-in
+HEDGE_CALL_SITES = tuple(
+    site.strip() for site in os.getenv("HEDGE_CALL_SITES", "query_embedding,chat").split(",") if site.strip()
+)
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))  # Hedge dikirim setelah latensi p95
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))  # Maksimal 5% panggilan mendapat duplikat
+HEDGE_BURST = 5  # Hedge yang boleh dipakai sebelum budget persentase terkumpul
+HEDGE_MIN_SAMPLES = 20  # Sampel latensi minimum sebelum delay persentil dipakai
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2.0"))  # Detik, selama sampel belum cukup
+HEDGE_MIN_DELAY = 0.05  # Detik; hedge lebih cepat dari ini hampir selalu pemborosan
+HEDGE_WINDOW = 500  # Jumlah sampel latensi terakhir per call site
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "32"))
+
+
+class CallSiteStats:
+    """Sampel latensi dan counter hedge untuk satu call site"""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.latency_saved = 0.0
+        self.lock = threading.Lock()
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+
+class Hedger:
+    """
+    Panggilan pertama dijalankan di thread pool; jika belum selesai setelah delay
+    persentil (HEDGE_PERCENTILE dari latensi terbaru call site tersebut), duplikat dikirim
+    dan hasil pertama yang sukses dipakai. Duplikat yang kalah dibatalkan jika belum
+    mulai; panggilan HTTP yang sudah berjalan tidak dapat dihentikan, hasilnya diabaikan.
+    Jumlah hedge dibatasi HEDGE_BUDGET dari total panggilan per call site.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGE_REQUESTS,
+        call_sites=HEDGE_CALL_SITES,
+        percentile: float = HEDGE_PERCENTILE,
+        budget: float = HEDGE_BUDGET,
+        default_delay: float = HEDGE_DEFAULT_DELAY,
+        max_workers: int = HEDGE_MAX_WORKERS,
+    ):
+        self.enabled = enabled
+        self.call_sites = set(call_sites)
+        self.percentile = percentile
+        self.budget = budget
+        self.default_delay = default_delay
+        self.max_workers = max_workers
+        self._sites: Dict[str, CallSiteStats] = {}
+        self._sites_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _site(self, call_site: str) -> CallSiteStats:
+        with self._sites_lock:
+            if call_site not in self._sites:
+                self._sites[call_site] = CallSiteStats()
+            return self._sites[call_site]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._sites_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+            return self._executor
+
+    def hedge_delay(self, call_site: str) -> float:
+        observed = self._site(call_site).percentile(self.percentile)
+        return max(HEDGE_MIN_DELAY, observed if observed is not None else self.default_delay)
+
+    def _within_budget(self, site: CallSiteStats) -> bool:
+        with site.lock:
+            return site.hedged < HEDGE_BURST + self.budget * site.calls
+
+    def _submit(self, fn: Callable[[], Any], site: CallSiteStats):
+        started = time.monotonic()
+
+        def _record(future):
+            if not future.cancelled() and future.exception() is None:
+                site.record_latency(time.monotonic() - started)
+
+        future = self._get_executor().submit(fn)
+        future.add_done_callback(_record)
+        return future
+
+    def call(self, call_site: str, fn: Callable[[], Any]) -> Any:
+        """Menjalankan fn() dengan hedging jika diaktifkan untuk call site ini"""
+        if not self.enabled or call_site not in self.call_sites:
+            return fn()
+
+        site = self._site(call_site)
+        with site.lock:
+            site.calls += 1
+
+        primary = self._submit(fn, site)
+        done, _ = wait([primary], timeout=self.hedge_delay(call_site))
+        if done or not self._within_budget(site):
+            return primary.result()
+
+        with site.lock:
+            site.hedged += 1
+        hedge = self._submit(fn, site)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is hedge:
+                    self._record_hedge_win(site, primary)
+                return future.result()
+        raise error
+
+    @staticmethod
+    def _record_hedge_win(site: CallSiteStats, primary):
+        """Latency saved = kapan primary akhirnya selesai dikurangi kapan hedge selesai"""
+        won_at = time.monotonic()
+        with site.lock:
+            site.hedge_wins += 1
+
+        def _saved(_future):
+            with site.lock:
+                site.latency_saved += time.monotonic() - won_at
+
+        if primary.cancelled():
+            return
+        primary.add_done_callback(_saved)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._sites_lock:
+            sites = dict(self._sites)
+        call_sites = {}
+        for name, site in sites.items():
+            delay = self.hedge_delay(name)
+            with site.lock:
+                call_sites[name] = {
+                    "calls": site.calls,
+                    "hedged": site.hedged,
+                    "hedge_rate": round(site.hedged / site.calls, 4) if site.calls else 0.0,
+                    "hedge_wins": site.hedge_wins,
+                    "latency_saved_seconds": round(site.latency_saved, 3),
+                    "hedge_delay_seconds": round(delay, 3)
+                }
+        return {"enabled": self.enabled, "percentile": self.percentile, "budget": self.budget, "call_sites": call_sites}
+
+
+_default_hedger: Optional[Hedger] = None
+_default_lock = threading.Lock()
+
+
+def get_default_hedger() -> Hedger:
+    """Hedger bersama untuk seluruh proses (sampel latensi dan budget dibagi semua tenant)"""
+    global _default_hedger
+    with _default_lock:
+        if _default_hedger is None:
+            _default_hedger = Hedger()
+        return _default_hedger
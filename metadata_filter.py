@@ -0,0 +1,81 @@
+"""
+Metadata Filter
+Facet dokumen (tahun, revisi) dan konversi facet filter pencarian menjadi `where`
+ChromaDB, sehingga penyaringan terjadi di dalam index sebelum pencarian vector
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+# Facet metadata yang bisa dipakai sebagai pre-filter di vector index
+FILTER_FIELDS = (
+    "filename", "kategori", "page_from", "page_to",
+    "ingested_after", "ingested_before", "doc_year", "doc_revision"
+)
+REVISION_ORDINALS = {
+    "pertama": 1, "kedua": 2, "ketiga": 3, "keempat": 4, "kelima": 5,
+    "keenam": 6, "ketujuh": 7, "kedelapan": 8, "kesembilan": 9, "kesepuluh": 10
+}
+
+
+def extract_document_facets(filename: str, text: str = "") -> Dict[str, int]:
+    """
+    Tahun dan revisi dokumen dari nama file atau halaman awal, misalnya
+    "Peraturan Rektor Nomor 5 Tahun 2023" atau "Perubahan Kedua atas ...".
+    Nilai 0 berarti tidak diketahui (metadata ChromaDB tidak boleh None).
+    """
+    year = re.search(r"\bTAHUN\s+((?:19|20)\d{2})\b", text, re.IGNORECASE) \
+        or re.search(r"(?<!\d)((?:19|20)\d{2})(?!\d)", filename)
+    revision = 0
+    match = re.search(r"rev(?:isi)?[\s_-]*(\d+)", filename, re.IGNORECASE)
+    if match:
+        revision = int(match.group(1))
+    else:
+        match = re.search(r"\bPERUBAHAN\s+(\w+)\s+ATAS\b", text, re.IGNORECASE)
+        if match:
+            revision = REVISION_ORDINALS.get(match.group(1).lower(), 1)
+        elif re.search(r"\bPERUBAHAN\s+ATAS\b", text, re.IGNORECASE):
+            revision = 1
+    return {"doc_year": int(year.group(1)) if year else 0, "doc_revision": revision}
+
+
+def to_timestamp(value) -> int:
+    """Epoch detik dari datetime atau angka (format ingested_at di metadata ChromaDB)"""
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def build_metadata_filter(filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Mengubah facet filter menjadi `where` ChromaDB sehingga penyaringan terjadi di
+    dalam index sebelum pencarian vector, bukan setelah hasil didapat.
+    filename/kategori/doc_year/doc_revision menerima satu nilai atau list;
+    page_from/page_to dan ingested_after/ingested_before (datetime atau epoch) adalah rentang.
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value is not None and value != []}
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Filter tidak dikenal: {sorted(unknown)}")
+
+    conditions = []
+    for field in ("filename", "kategori", "doc_year", "doc_revision"):
+        if field in filters:
+            value = filters[field]
+            if isinstance(value, (list, tuple, set)):
+                conditions.append({field: {"$in": list(value)}})
+            else:
+                conditions.append({field: value})
+    if "page_from" in filters:
+        conditions.append({"page": {"$gte": int(filters["page_from"])}})
+    if "page_to" in filters:
+        conditions.append({"page": {"$lte": int(filters["page_to"])}})
+    if "ingested_after" in filters:
+        conditions.append({"ingested_at": {"$gte": to_timestamp(filters["ingested_after"])}})
+    if "ingested_before" in filters:
+        conditions.append({"ingested_at": {"$lte": to_timestamp(filters["ingested_before"])}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
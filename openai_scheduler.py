@@ -0,0 +1,216 @@
+"""
+OpenAI Scheduler
+Penjadwal bersama untuk semua panggilan OpenAI (embedding dan chat): token bucket
+untuk batas request dan token per menit, concurrency adaptif (AIMD) yang mundur saat
+kena 429, dan retry dengan jittered exponential backoff
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from openai import APIConnectionError, APITimeoutError
+except ImportError:  # pragma: no cover - openai selalu terpasang bersama engine
+    APIConnectionError = APITimeoutError = ()
+
+logger = logging.getLogger(__name__)
+
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "3000"))  # Request per menit (0 = tanpa batas)
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "1000000"))  # Token per menit (0 = tanpa batas)
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))  # Detik
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30"))  # Detik
+AIMD_DECREASE_FACTOR = 0.5  # Limit concurrency dikali faktor ini saat kena 429
+AIMD_COOLDOWN = 1.0  # Detik; 429 beruntun dalam jendela ini hanya menurunkan limit sekali
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Token bucket dengan kapasitas `per_minute` yang terisi merata; per_minute <= 0 = nonaktif"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Menunggu sampai `amount` token tersedia; mengembalikan lama menunggu (detik)"""
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)  # Request lebih besar dari kapasitas tetap bisa lewat
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AIMDLimiter:
+    """
+    Batas concurrency adaptif: naik +1 per `limit` panggilan sukses (additive increase),
+    turun x AIMD_DECREASE_FACTOR saat rate limit (multiplicative decrease)
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(max(self.minimum, self.maximum // 2))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                if now - self._last_decrease >= AIMD_COOLDOWN:
+                    self.limit = max(self.minimum, self.limit * AIMD_DECREASE_FACTOR)
+                    self._last_decrease = now
+                    logger.warning(f"🐢 Rate limit OpenAI, concurrency diturunkan ke {int(self.limit)}")
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Nilai header retry-after(-ms) dari respons error OpenAI, jika ada"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class OpenAIScheduler:
+    """
+    Semua panggilan OpenAI lewat call(): menunggu token bucket request (RPM) dan token
+    (TPM), mengambil slot concurrency AIMD, lalu menjalankan panggilan. Error sementara
+    (429, 5xx, timeout, koneksi) di-retry dengan full-jitter backoff atau retry-after dari
+    server; error lain langsung diteruskan. Metrik dicatat per call site.
+    """
+
+    def __init__(
+        self,
+        rpm: int = OPENAI_RPM,
+        tpm: int = OPENAI_TPM,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        base_delay: float = OPENAI_RETRY_BASE_DELAY,
+        max_delay: float = OPENAI_RETRY_MAX_DELAY,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limiter = AIMDLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._metrics_lock = threading.Lock()
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        if isinstance(error, (APIConnectionError, APITimeoutError)):
+            return True
+        return _status_code(error) in RETRYABLE_STATUS
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _record(self, call_site: str, **increments: float):
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(call_site, {
+                "calls": 0, "retries": 0, "rate_limited": 0, "failures": 0,
+                "queue_seconds": 0.0, "latency_seconds": 0.0
+            })
+            for key, value in increments.items():
+                metrics[key] += value
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0, call_site: str = "default") -> Any:
+        """Menjalankan fn() di bawah batas rate dan concurrency, dengan retry"""
+        for attempt in range(self.max_retries + 1):
+            queued = time.monotonic()
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = _status_code(e) == 429
+                self.limiter.release(throttled=throttled)
+                self._record(
+                    call_site, calls=1, rate_limited=int(throttled),
+                    queue_seconds=started - queued, latency_seconds=time.monotonic() - started
+                )
+                if not self.is_retryable(e) or attempt == self.max_retries:
+                    self._record(call_site, failures=1)
+                    raise
+                delay = self._backoff(attempt, e)
+                self._record(call_site, retries=1)
+                logger.warning(
+                    f"🔁 OpenAI {call_site} gagal ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} "
+                    f"dalam {delay:.1f} detik"
+                )
+                time.sleep(delay)
+                continue
+
+            self.limiter.release()
+            self._record(
+                call_site, calls=1,
+                queue_seconds=started - queued, latency_seconds=time.monotonic() - started
+            )
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            call_sites = {site: dict(metrics) for site, metrics in self._metrics.items()}
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "call_sites": call_sites
+        }
+
+
+_default_scheduler: Optional[OpenAIScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_default_scheduler() -> OpenAIScheduler:
+    """Scheduler bersama untuk seluruh proses (batas RPM/TPM berlaku per API key)"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = OpenAIScheduler()
+        return _default_scheduler
@@ -1,43 +1,46 @@
 import os
-import hashlib
-from pathlib import Path
+import sys
+import logging
 from pymongo import MongoClient
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
 from openai import OpenAI
-import PyPDF2
-import fitz  # PyMuPDF
 from typing import List, Dict, Any
-import json
 from datetime import datetime
 
+import rag_engine
+from rag_engine import RagEngine
+from folder_watcher import FolderWatcher
+
 # Load environment variables
 load_dotenv()
 
+# Progress ingest/search dari engine ditampilkan langsung ke console
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
 # === Konfigurasi ===
 client_openai = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_API_BASE")
+    base_url=os.getenv("OPENAI_API_BASE"),
+    max_retries=0  # Retry dan rate limit ditangani OpenAIScheduler di engine
 )
 
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_URI_LOCAL = "mongodb://localhost:27017"
-DB_NAME = "RAG_PDF_Demo"
-COLLECTION_NAME = "pdf_docs"
+DB_NAME = rag_engine.DB_NAME
+COLLECTION_NAME = rag_engine.COLLECTION_NAME
+CHROMA_DIR = rag_engine.CHROMA_DIR
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
 MODEL_TEMPERATURE = float(os.getenv("MODEL_TEMPERATURE", "0"))
 MODEL_MAX_TOKENS = int(os.getenv("MODEL_MAX_TOKENS", "2048"))
 
 # PDF Configuration
 PDF_FOLDER = "pdf_documents"  # Folder yang berisi file PDF
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+CHUNK_SIZE = rag_engine.CHUNK_SIZE
+CHUNK_OVERLAP = rag_engine.CHUNK_OVERLAP
 
 # Conversation Configuration
 MAX_CONVERSATION_HISTORY = 10  # Maximum number of previous Q&A pairs to remember
-CONVERSATION_CONTEXT_WINDOW = 3  # Number of recent exchanges to include in context
+CONVERSATION_CONTEXT_WINDOW = rag_engine.CONVERSATION_CONTEXT_WINDOW  # Number of recent exchanges to include in context
 
 # === Koneksi MongoDB ===
 def connect_mongodb():
@@ -218,34 +221,24 @@ class ConversationManager:
 # Create global conversation manager
 conversation_manager = ConversationManager()
 
+# === RAG Engine (shared dengan API) ===
+engine = RagEngine(
+    collection=collection,
+    openai_client=client_openai,
+    persist_directory=CHROMA_DIR,
+    model_name=MODEL_NAME,
+    temperature=MODEL_TEMPERATURE,
+    max_tokens=MODEL_MAX_TOKENS,
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+)
+
 # === Fungsi Ekstraksi PDF ===
 def extract_text_from_pdf(pdf_path: str, method: str = "pymupdf") -> str:
     """
     Ekstrak teks dari file PDF menggunakan PyMuPDF atau PyPDF2
     """
-    try:
-        if method == "pymupdf":
-            # Menggunakan PyMuPDF (fitz) - lebih baik untuk OCR dan layout kompleks
-            doc = fitz.open(pdf_path)
-            text = ""
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text() + "\n"
-            doc.close()
-            return text
-        
-        elif method == "pypdf2":
-            # Menggunakan PyPDF2 - lebih cepat untuk PDF sederhana
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-            
-    except Exception as e:
-        print(f"❌ Error extracting text from {pdf_path}: {e}")
-        return ""
+    return engine.extract_text_from_pdf(pdf_path, method)
 
 def get_pdf_files(folder_path: str) -> List[str]:
     """
@@ -255,64 +248,21 @@ def get_pdf_files(folder_path: str) -> List[str]:
         print(f"❌ Folder {folder_path} tidak ditemukan.")
         return []
     
-    pdf_files = []
-    for file in os.listdir(folder_path):
-        if file.lower().endswith('.pdf'):
-            pdf_files.append(os.path.join(folder_path, file))
-    
-    return pdf_files
-
-def get_file_hash(file_path: str) -> str:
-    """
-    Generate hash untuk file untuk mendeteksi perubahan
-    """
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    return rag_engine.get_pdf_files(folder_path)
 
 # === Fungsi Text Splitting ===
 def split_text_into_chunks(text: str, filename: str) -> List[Dict[str, Any]]:
     """
     Membagi teks menjadi chunk-chunk kecil
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
-    )
-    
-    chunks = text_splitter.split_text(text)
-    
-    # Create documents with metadata
-    documents = []
-    for i, chunk in enumerate(chunks):
-        doc = {
-            "text": chunk,
-            "filename": filename,
-            "chunk_id": i,
-            "source": "pdf",
-            "chunk_size": len(chunk)
-        }
-        documents.append(doc)
-    
-    return documents
+    return engine.split_text_into_chunks(text, filename)
 
 # === Fungsi Membuat Embedding ===
 def get_embedding(text: str) -> List[float]:
     """
     Membuat embedding untuk teks menggunakan OpenAI
     """
-    try:
-        result = client_openai.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
-        )
-        return result.data[0].embedding
-    except Exception as e:
-        print(f"❌ Error creating embedding: {e}")
-        return []
+    return engine.get_embedding(text)
 
 # === Fungsi Ingest PDF Documents ===
 def ingest_pdf_documents(folder_path: str = PDF_FOLDER):
@@ -336,66 +286,44 @@ def ingest_pdf_documents(folder_path: str = PDF_FOLDER):
     for pdf_file in pdf_files:
         print(f"   - {os.path.basename(pdf_file)}")
     
-    total_chunks = 0
-    processed_files = 0
+    results = engine.ingest_pdf_documents(folder_path)
+    processed = [r for r in results if r["status"] == "processed"]
+    total_chunks = sum(r["chunks"] for r in processed)
     
-    for pdf_path in pdf_files:
-        filename = os.path.basename(pdf_path)
-        file_hash = get_file_hash(pdf_path)
-        
-        # Cek apakah file sudah diproses sebelumnya
-        existing_doc = collection.find_one({"filename": filename, "file_hash": file_hash})
-        if existing_doc:
-            print(f"⏭️ File {filename} sudah diproses sebelumnya, skip...")
-            continue
-        
-        print(f"📖 Memproses file: {filename}")
-        
-        # Extract text from PDF
-        text = extract_text_from_pdf(pdf_path)
-        if not text.strip():
-            print(f"⚠️ Tidak ada teks yang dapat diekstrak dari {filename}")
-            continue
-        
-        # Split text into chunks
-        documents = split_text_into_chunks(text, filename)
-        
-        # Process each chunk
-        chunk_count = 0
-        for doc in documents:
-            # Create embedding
-            embedding = get_embedding(doc["text"])
-            if not embedding:
-                continue
-            
-            # Prepare document for MongoDB
-            mongo_doc = {
-                "doc_id": f"{filename}_chunk_{doc['chunk_id']}",
-                "filename": filename,\
-                "file_hash": file_hash,
-                "text": doc["text"],
-                "chunk_id": doc["chunk_id"],
-                "source": doc["source"],
-                "chunk_size": doc["chunk_size"],
-                "embedding": embedding,
-                "kategori": "pdf_document"
-            }
-            
-            # Insert to MongoDB
-            try:
-                collection.insert_one(mongo_doc)
-                chunk_count += 1
-            except Exception as e:
-                print(f"❌ Error inserting chunk {doc['chunk_id']} from {filename}: {e}")
-        
-        if chunk_count > 0:
-            processed_files += 1
-            total_chunks += chunk_count
-            print(f"✅ {filename}: {chunk_count} chunks berhasil disimpan")
-        else:
-            print(f"❌ {filename}: Gagal memproses file")
-    
-    print(f"\n🎉 Selesai! {processed_files} file PDF diproses, total {total_chunks} chunks disimpan.")
+    print(f"\n🎉 Selesai! {len(processed)} file PDF diproses, total {total_chunks} chunks disimpan.")
+
+def migrate_legacy_embeddings():
+    """
+    Memindahkan embedding lama yang masih tersimpan di pdf_docs ke pdf_chunk_vectors,
+    sehingga ingest berikutnya memakai ulang vector tersebut
+    """
+    try:
+        migrated = engine.migrate_legacy_embeddings()
+        if migrated:
+            print(f"📦 {migrated} embedding lama dipindahkan ke pdf_chunk_vectors")
+    except Exception as e:
+        print(f"❌ Error migrasi embedding lama: {e}")
+
+def recover_incomplete_ingests():
+    """
+    Melanjutkan ingest yang terputus pada sesi sebelumnya (file sumber dicari di PDF_FOLDER);
+    ingest yang masih berjalan di proses lain (API, watcher) dilewati
+    """
+    try:
+        incomplete = engine.list_incomplete_ingests(stale_only=True)
+        if not incomplete:
+            return
+        print(f"⏯️ {len(incomplete)} ingest belum selesai dari sesi sebelumnya:")
+        for entry in incomplete:
+            print(f"   - {entry['filename']} ({entry['ingest'].get('status')})")
+        summary = engine.recover_incomplete_ingests([PDF_FOLDER])
+        print(
+            f"✅ Recovery selesai: {summary['resumed']} dilanjutkan, {summary['retried']} diulang, "
+            f"{summary['cleaned']} dibersihkan, {summary['failed']} gagal, "
+            f"{summary['busy']} sedang dikerjakan proses lain"
+        )
+    except Exception as e:
+        print(f"❌ Error recovery ingest: {e}")
 
 # === Fungsi Build ChromaDB ===
 def build_chroma_vectorstore():
@@ -403,164 +331,69 @@ def build_chroma_vectorstore():
     Membangun ChromaDB dari dokumen yang ada di MongoDB
     """
     try:
-        docs = list(collection.find({}, {"doc_id": 1, "text": 1, "filename": 1, "kategori": 1}))
-        if not docs:
+        count = engine.build_vectorstore()
+        if not count:
             print("❌ Tidak ada dokumen ditemukan di MongoDB.")
-            return
-        
-        print(f"📊 Membangun ChromaDB dari {len(docs)} dokumen...")
-        
-        texts = [doc["text"] for doc in docs]
-        metadatas = [
-            {
-                "doc_id": doc["doc_id"], 
-                "filename": doc["filename"],
-                "kategori": doc["kategori"]
-            } for doc in docs
-        ]
-        
-        # Set OpenAI API key untuk embeddings
-        os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        
-        # Create ChromaDB
-        Chroma.from_texts(
-            texts, 
-            embeddings, 
-            metadatas=metadatas, 
-            persist_directory="chroma_pdf_db"
-        )
-        
-        print("✅ ChromaDB telah dibuat dan disimpan di 'chroma_pdf_db'.")
-        
     except Exception as e:
         print(f"❌ Error building ChromaDB: {e}")
 
 # === Fungsi Search dan Answer ===
-def search_similar_documents(query: str, top_k: int = 3, filename_filter: str = None):
+def search_similar_documents(query: str, top_k: int = 3, filename_filter: str = None, search_mode: str = rag_engine.SEARCH_MODE):
     """
-    Mencari dokumen yang mirip berdasarkan query
+    Mencari dokumen yang mirip berdasarkan query (search_mode: "similarity" atau "mmr")
     """
-    try:
-        os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        
-        if not os.path.exists("chroma_pdf_db"):
-            print("❌ ChromaDB belum dibuat. Jalankan build_chroma_vectorstore() terlebih dahulu.")
-            return []
-        
-        chroma = Chroma(persist_directory="chroma_pdf_db", embedding_function=embeddings)
-        
-        # Apply filename filter if specified
-        filter_dict = {"filename": filename_filter} if filename_filter else None
-        
-        results = chroma.similarity_search(query, k=top_k, filter=filter_dict)
-        
-        return results
-        
-    except Exception as e:
-        print(f"❌ Error searching documents: {e}")
-        return []
+    return engine.search_similar_documents(query, top_k, filename_filter, search_mode=search_mode)
+
+def ask_search_mode() -> str:
+    """
+    Menanyakan mode pencarian ke user (Enter = default)
+    """
+    mode = input(f"Mode pencarian (similarity/mmr, tekan Enter untuk {rag_engine.SEARCH_MODE}): ").strip().lower()
+    if mode not in rag_engine.SEARCH_MODES:
+        if mode:
+            print(f"⚠️ Mode '{mode}' tidak dikenal, memakai {rag_engine.SEARCH_MODE}.")
+        return rag_engine.SEARCH_MODE
+    return mode
 
-def answer_question_with_context(query: str, top_k: int = 3, filename_filter: str = None):
+def answer_question_with_context(query: str, top_k: int = 3, filename_filter: str = None, search_mode: str = rag_engine.SEARCH_MODE):
     """
     Menjawab pertanyaan berdasarkan dokumen PDF dengan conversation context
     """
     try:
-        print(f"🔍 Mencari dokumen relevan untuk: '{query}'")
-        
-        # Check for conversation context
-        conversation_context = conversation_manager.get_conversation_context()
-        
-        # Enhanced query with conversation context
-        enhanced_query = query
-        if conversation_context:
-            # Check if this is a follow-up question
-            follow_up_indicators = [
-                "lanjut", "selanjutnya", "lebih detail", "contoh", "bagaimana", 
-                "jelaskan lebih", "detail", "itu", "tersebut", "tadi", "sebelumnya"
-            ]
-            
-            is_follow_up = any(indicator in query.lower() for indicator in follow_up_indicators)
-            
-            if is_follow_up:
-                last_question = conversation_manager.get_last_question()
-                enhanced_query = f"Berdasarkan pertanyaan sebelumnya '{last_question}', {query}"
-                print("🔗 Detected follow-up question, enhancing context...")
+        result = engine.answer_question(
+            query,
+            history=conversation_manager.conversation_history,
+            top_k=top_k,
+            filename_filter=filename_filter,
+            context_window=conversation_manager.context_window,
+            search_mode=search_mode,
+        )
         
-        # Search similar documents
-        results = search_similar_documents(enhanced_query, top_k, filename_filter)
+        answer = result["answer"]
+        conversation_manager.add_exchange(query, answer, result["source_files"])
         
-        if not results:
-            answer = "❌ Tidak ada dokumen relevan ditemukan untuk pertanyaan Anda."
-            conversation_manager.add_exchange(query, answer, [])
+        if not result["sources"]:
             print(answer)
             return
         
-        # Get document IDs and fetch full documents from MongoDB
-        doc_ids = [res.metadata["doc_id"] for res in results]
-        full_docs = list(collection.find({"doc_id": {"$in": doc_ids}}))
-        
-        # Prepare context
-        context_parts = []
-        source_files = set()
-        
-        for doc in full_docs:
-            filename = doc.get("filename", "Unknown")
-            text = doc.get("text", "")
-            context_parts.append(f"[File: {filename}]\n{text}")
-            source_files.add(filename)
-        
-        document_context = "\n\n---\n\n".join(context_parts)
-        
-        # Build comprehensive prompt with conversation context
-        prompt_parts = []
-        
-        if conversation_context:
-            prompt_parts.append("CONVERSATION HISTORY:")
-            prompt_parts.append(conversation_context)
-            prompt_parts.append("\n" + "="*50 + "\n")
-        
-        prompt_parts.append("DOKUMEN REFERENSI:")
-        prompt_parts.append(document_context)
-        prompt_parts.append("\n" + "="*50 + "\n")
-        
-        if conversation_context:
-            prompt_parts.append(f"PERTANYAAN SAAT INI: {query}")
-            prompt_parts.append("\nInstruksi: Jawab pertanyaan saat ini dengan mempertimbangkan konteks percakapan sebelumnya. Jika pertanyaan ini adalah lanjutan dari pertanyaan sebelumnya, berikan jawaban yang konsisten dan terhubung. Gunakan informasi dari dokumen referensi untuk memberikan jawaban yang akurat dan lengkap.")
-        else:
-            prompt_parts.append(f"PERTANYAAN: {query}")
-            prompt_parts.append("\nInstruksi: Berdasarkan dokumen referensi di atas, jawab pertanyaan dengan akurat dan lengkap.")
-        
-        prompt_parts.append("\nJAWABAN:")
-        
-        full_prompt = "\n".join(prompt_parts)
-        
-        # Generate answer using OpenAI
-        response = client_openai.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": full_prompt}],
-            temperature=MODEL_TEMPERATURE,
-            max_tokens=MODEL_MAX_TOKENS
-        )
-        
-        answer = response.choices[0].message.content
-        
-        # Store in conversation history
-        sources = list(source_files)
-        conversation_manager.add_exchange(query, answer, sources)
-        
         print("\n🤖 Jawaban:")
         print(f"{answer}")
         
         print("\n📚 Sumber dokumen:")
-        for doc in full_docs:
-            filename = doc.get("filename", "Unknown")
-            chunk_id = doc.get("chunk_id", 0)
-            print(f"   - {filename} (chunk {chunk_id})")
+        for source in result["sources"]:
+            chunks = "-".join(str(chunk_id) for chunk_id in (source["chunk_ids"][0], source["chunk_ids"][-1])) if len(source["chunk_ids"]) > 1 else source["chunk_id"]
+            section = f" — {source['section_path']}" if source.get("section_path") else ""
+            print(f"   - {source['filename']} (halaman {source['page']}, chunk {chunks}){section}")
+        
+        usage = result["token_usage"]
+        if usage:
+            print(
+                f"\n🧮 Token: prompt {usage.get('prompt_tokens', usage['estimated_prompt_tokens'])}"
+                f" (budget {usage['budget']}), jawaban {usage.get('completion_tokens', '-')}"
+            )
         
         # Show conversation context info
-        if conversation_context:
+        if result["used_context"]:
             print(f"\n💬 Context: Menggunakan {len(conversation_manager.conversation_history)} percakapan sebelumnya")
             
     except Exception as e:
@@ -580,16 +413,7 @@ def list_processed_files():
     Menampilkan daftar file PDF yang sudah diproses
     """
     try:
-        pipeline = [
-            {"$group": {
-                "_id": "$filename",
-                "chunks": {"$sum": 1},
-                "file_hash": {"$first": "$file_hash"}
-            }},
-            {"$sort": {"_id": 1}}
-        ]
-        
-        files = list(collection.aggregate(pipeline))
+        files = engine.list_processed_files()
         
         if not files:
             print("📭 Belum ada file PDF yang diproses.")
@@ -598,10 +422,9 @@ def list_processed_files():
         print(f"📚 File PDF yang sudah diproses ({len(files)} file):")
         total_chunks = 0
         for file_info in files:
-            filename = file_info["_id"]
-            chunks = file_info["chunks"]
-            total_chunks += chunks
-            print(f"   - {filename}: {chunks} chunks")
+            total_chunks += file_info["chunks"]
+            pages = f", {file_info['pages']} halaman" if file_info.get("pages") else ""
+            print(f"   - {file_info['filename']}: {file_info['chunks']} chunks{pages}")
         
         print(f"📊 Total chunks: {total_chunks}")
         
@@ -613,14 +436,24 @@ def delete_file_from_db(filename: str):
     Menghapus semua chunks dari file tertentu
     """
     try:
-        result = collection.delete_many({"filename": filename})
-        if result.deleted_count > 0:
-            print(f"✅ {result.deleted_count} chunks dari file '{filename}' telah dihapus.")
+        deleted_count = engine.delete_file(filename)
+        if deleted_count > 0:
+            print(f"✅ {deleted_count} chunks dari file '{filename}' telah dihapus.")
         else:
             print(f"❌ File '{filename}' tidak ditemukan dalam database.")
     except Exception as e:
         print(f"❌ Error deleting file: {e}")
 
+def watch_pdf_folder(folders: List[str] = None):
+    """
+    Memantau folder PDF dan meng-ingest file baru/berubah/terhapus secara otomatis
+    """
+    folders = folders or [PDF_FOLDER]
+    print(f"👀 Watch mode aktif untuk: {', '.join(folders)}")
+    print("💡 File baru langsung di-ingest dan di-index (jika ChromaDB sudah dibuat). Tekan Ctrl+C untuk berhenti.")
+    FolderWatcher(engine, folders).run_forever()
+    print("\n🛑 Watch mode dihentikan.")
+
 # === Menu Interface ===
 def show_menu():
     """
@@ -636,6 +469,7 @@ def show_menu():
     print("5. 🗑️  Hapus File dari Database")
     print("6. 🔍 Cari Dokumen Mirip")
     print("7. 💬 Kelola Conversation")
+    print("8. 👀 Watch Folder (auto-ingest)")
     print("0. 🚪 Keluar")
     print("="*50)
 
@@ -670,10 +504,19 @@ if __name__ == "__main__":
     print(f"🗄️ Database: {DB_NAME}")
     print(f"📊 Collection: {COLLECTION_NAME}")
     
+    migrate_legacy_embeddings()
+    recover_incomplete_ingests()
+    
+    # python rag-db-pdf.py --watch [folder ...] menjalankan watcher tanpa menu
+    if len(sys.argv) > 1 and sys.argv[1] == "--watch":
+        watch_pdf_folder(sys.argv[2:])
+        mongo_client.close()
+        exit(0)
+    
     try:
         while True:
             show_menu()
-            choice = input("Pilih menu (0-6): ").strip()
+            choice = input("Pilih menu (0-8): ").strip()
             
             if choice == "1":
                 print("\n📚 Memproses file PDF...")
@@ -704,7 +547,9 @@ if __name__ == "__main__":
                         filename_filter = input("Filter by filename (optional, tekan Enter untuk skip): ").strip()
                         filename_filter = filename_filter if filename_filter else None
                         
-                        answer_question_with_context(query, top_k=3, filename_filter=filename_filter)
+                        search_mode = ask_search_mode()
+                        
+                        answer_question_with_context(query, top_k=3, filename_filter=filename_filter, search_mode=search_mode)
                         
             elif choice == "4":
                 print("\n📋 File yang sudah diproses:")
@@ -723,7 +568,7 @@ if __name__ == "__main__":
                 print("\n🔍 Cari dokumen mirip")
                 query = input("Masukkan query pencarian: ").strip()
                 if query:
-                    results = search_similar_documents(query, top_k=5)
+                    results = search_similar_documents(query, top_k=5, search_mode=ask_search_mode())
                     if results:
                         print(f"\n📄 Ditemukan {len(results)} dokumen mirip:")
                         for i, result in enumerate(results, 1):
@@ -784,12 +629,16 @@ if __name__ == "__main__":
                     else:
                         print("❌ Pilihan tidak valid. Silakan pilih 0-5.")
                         
+            elif choice == "8":
+                print("\n👀 Watch Folder")
+                watch_pdf_folder()
+                
             elif choice == "0":
                 print("👋 Terima kasih! Program selesai.")
                 break
                 
             else:
-                print("❌ Pilihan tidak valid. Silakan pilih 0-6.")
+                print("❌ Pilihan tidak valid. Silakan pilih 0-8.")
                 
     except KeyboardInterrupt:
         print("\n\n🛑 Program dihentikan oleh user.")
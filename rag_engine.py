@@ -0,0 +1,1933 @@
+"""
+RAG Engine
+Logika inti ingest, search dan answer yang dipakai bersama oleh CLI (rag-db-pdf.py)
+dan RESTful API (rag_pdf_api.py)
+"""
+
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import socket
+import shutil
+import hashlib
+import logging
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Callable, Optional
+
+import fitz  # PyMuPDF
+import PyPDF2
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from openai import OpenAI
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from corpus_generation import CorpusGeneration, CORPUS_COLLECTION_NAME
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_PATH
+from hedging import Hedger, get_default_hedger
+from openai_scheduler import OpenAIScheduler, get_default_scheduler
+from context_builder import ContextBuilder, count_tokens, format_conversation_context
+from metadata_filter import build_metadata_filter, extract_document_facets, to_timestamp
+from retrieval import drop_near_duplicates, expand_to_parents, merge_adjacent_chunks, NEAR_DUPLICATE_THRESHOLD
+from rerank import Reranker, create_reranker, RERANK_FETCH_K
+from repository import (
+    DocumentRepository, VectorRepository, decode_embedding,
+    HYDRATE_FIELDS, INDEX_FIELDS, PAGE_HASH_FIELDS, FACET_FIELDS, PARENT_FIELDS, CATALOG_FIELDS
+)
+from structure_chunker import (
+    StructureChunker, CHUNKING_STRATEGY, CHUNKING_STRATEGIES, extract_layout_lines, layout_text
+)
+
+logger = logging.getLogger(__name__)
+
+# === Konfigurasi Default ===
+DB_NAME = "RAG_PDF_Demo"
+COLLECTION_NAME = "pdf_docs"
+VECTOR_COLLECTION_NAME = "pdf_chunk_vectors"  # Content-addressed store: chunk_hash -> embedding
+PARENT_COLLECTION_NAME = "pdf_parents"  # Parent section (halaman penuh) untuk small-to-big retrieval
+FILE_COLLECTION_NAME = "pdf_files"  # Katalog per file: jumlah chunk, halaman, ukuran, waktu ingest
+VECTOR_TOMBSTONE_COLLECTION_NAME = "pdf_vector_tombstones"  # doc_id yang dihapus tetapi vector-nya belum di-compact
+CHROMA_DIR = "chroma_pdf_db"
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")  # Tenant untuk data lama tanpa tenant_id
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+EMBEDDING_MODEL = "text-embedding-3-small"
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+MODEL_TEMPERATURE = float(os.getenv("MODEL_TEMPERATURE", "0"))
+MODEL_MAX_TOKENS = int(os.getenv("MODEL_MAX_TOKENS", "2048"))
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))  # Jumlah teks per request embedding
+CONVERSATION_CONTEXT_WINDOW = 3  # Number of recent exchanges to include in context
+MERGE_ADJACENT_CHUNKS = os.getenv("MERGE_ADJACENT_CHUNKS", "true").lower() == "true"
+RETRIEVAL_OVERFETCH = 2  # Faktor kandidat tambahan saat near-duplicate dibuang
+
+# Search mode: "similarity" (top-k biasa) atau "mmr" (maximal marginal relevance)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "similarity")
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))  # Kandidat yang diambil sebelum re-ranking MMR
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))  # 1 = relevansi murni, 0 = keragaman maksimum
+SEARCH_MODES = ("similarity", "mmr")
+
+# Compaction vector index: rebuild di background jika proporsi tombstone melewati ambang
+COMPACTION_TOMBSTONE_RATIO = float(os.getenv("COMPACTION_TOMBSTONE_RATIO", "0.2"))
+COMPACTION_MIN_TOMBSTONES = int(os.getenv("COMPACTION_MIN_TOMBSTONES", "100"))
+VECTOR_BUILD_BATCH_SIZE = 1000  # Chunk per add_texts saat rebuild
+
+# Parent-child (small-to-big): chunk kecil di-embed, parent (halaman) dikirim ke LLM
+PARENT_CHILD_CHUNKS = os.getenv("PARENT_CHILD_CHUNKS", "false").lower() == "true"
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "400"))
+CHILD_CHUNK_OVERLAP = int(os.getenv("CHILD_CHUNK_OVERLAP", "80"))
+PARENT_CHILD_FANOUT = 3  # Child yang diambil per parent yang diminta
+
+FOLLOW_UP_INDICATORS = [
+    "lanjut", "selanjutnya", "lebih detail", "contoh", "bagaimana",
+    "jelaskan lebih", "detail", "itu", "tersebut", "tadi", "sebelumnya"
+]
+
+# Status ingest per file di katalog pdf_files (field `ingest.status`)
+INGEST_PENDING = "pending"      # File mulai diproses, belum ada embedding baru
+INGEST_EMBEDDING = "embedding"  # Embedding dibuat per batch; setiap batch langsung disimpan
+INGEST_WRITING = "writing"      # Chunk sedang ditulis ke MongoDB
+INGEST_WRITTEN = "written"      # Chunk tersimpan, vector index belum diperbarui
+INGEST_INDEXED = "indexed"      # Selesai
+INGEST_FAILED = "failed"
+INGEST_ABANDONED = "abandoned"  # File sumber tidak ditemukan saat recovery; versi sebelumnya tetap dipakai
+INGEST_COMPLETE_STATES = (INGEST_WRITTEN, INGEST_INDEXED)
+
+# Lease per file: proses yang sedang meng-ingest memperbarui `ingest.heartbeat_at`; lease
+# tanpa heartbeat selama INGEST_LEASE_SECONDS dianggap milik proses yang sudah mati
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "120"))
+
+NO_RESULTS_ANSWER = "❌ Tidak ada dokumen relevan ditemukan untuk pertanyaan Anda."
+
+
+def get_file_hash(file_path: str) -> str:
+    """
+    Generate hash untuk file untuk mendeteksi perubahan
+    """
+    hash_md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+def normalize_chunk_text(text: str) -> str:
+    """
+    Normalisasi teks chunk sebelum hashing: Unicode NFKC dan whitespace diseragamkan,
+    sehingga perbedaan line break hasil ekstraksi PDF tidak menghasilkan hash berbeda
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def get_chunk_hash(text: str) -> str:
+    """
+    Content hash dari teks chunk yang sudah dinormalisasi
+    """
+    return hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+
+
+def get_page_hash(text: str, section_path: str = "") -> str:
+    """
+    Content hash dari teks satu halaman PDF, dipakai untuk diff halaman saat re-ingest.
+    Dengan structure chunking, hierarchy path di awal halaman ikut di-hash karena
+    metadata chunk halaman ini bergantung pada heading di halaman sebelumnya.
+    """
+    return get_chunk_hash(f"{section_path}\n{text}" if section_path else text)
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """Tenant id dipakai di nama direktori, jadi hanya huruf, angka, '_' dan '-'"""
+    if not tenant_id or not TENANT_ID_PATTERN.match(tenant_id):
+        raise ValueError(f"Tenant id tidak valid: {tenant_id!r}")
+    return tenant_id
+
+
+def tenant_persist_directory(base_directory: str, tenant_id: str) -> str:
+    """Direktori ChromaDB per tenant; tenant default memakai direktori lama"""
+    if tenant_id == DEFAULT_TENANT:
+        return base_directory
+    return f"{base_directory}_{tenant_id}"
+
+
+def get_pdf_files(folder_path: str) -> List[str]:
+    """
+    Mendapatkan daftar semua file PDF dalam folder
+    """
+    if not os.path.exists(folder_path):
+        return []
+
+    pdf_files = []
+    for file in sorted(os.listdir(folder_path)):
+        if file.lower().endswith('.pdf'):
+            pdf_files.append(os.path.join(folder_path, file))
+
+    return pdf_files
+
+
+def is_follow_up_question(query: str) -> bool:
+    """
+    Mendeteksi apakah pertanyaan merupakan lanjutan dari pertanyaan sebelumnya
+    """
+    query_lower = query.lower()
+    return any(indicator in query_lower for indicator in FOLLOW_UP_INDICATORS)
+
+
+class RequestCancelled(Exception):
+    """answer_question dihentikan karena pemanggil sudah tidak menunggu hasilnya"""
+
+
+class EngineEmbeddings(Embeddings):
+    """
+    Embedding function untuk ChromaDB yang melewati RagEngine.get_embeddings,
+    sehingga build vector store dan query ikut memakai embedding cache
+    """
+
+    def __init__(self, engine: "RagEngine"):
+        self.engine = engine
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.engine.get_embeddings(texts)
+        if any(not embedding for embedding in embeddings):
+            raise RuntimeError("Gagal membuat embedding untuk sebagian dokumen")
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self.engine.get_embedding(text, call_site="query_embedding")
+        if not embedding:
+            raise RuntimeError("Gagal membuat embedding untuk query")
+        return embedding
+
+
+class RagEngine:
+    """
+    Engine RAG dengan store dan provider yang dapat di-inject.
+
+    - collection: MongoDB collection untuk chunk dokumen
+    - vector_collection: MongoDB collection content-addressed (chunk_hash -> embedding),
+      default `pdf_chunk_vectors` di database yang sama
+    - parent_collection: MongoDB collection parent section (default `pdf_parents`)
+    - file_collection: MongoDB collection katalog file (default `pdf_files`)
+    - tombstone_collection: MongoDB collection tombstone vector index
+      (default `pdf_vector_tombstones`)
+    - openai_client: client OpenAI untuk embedding dan chat completion
+    - scheduler: penjadwal panggilan OpenAI (rate limit, concurrency, retry); default
+      scheduler bersama satu proses
+    - hedger: hedged request untuk query embedding dan chat di jalur jawaban (opt-in,
+      HEDGE_REQUESTS=true); default hedger bersama satu proses
+    - embeddings: embedding function untuk ChromaDB (default EngineEmbeddings)
+    - embedding_cache: cache embedding persisten (default EmbeddingCache di
+      EMBEDDING_CACHE_PATH; kosongkan path untuk menonaktifkan)
+    - vectorstore_factory: callable(persist_directory, embedding_function) -> vector store
+    - corpus_generation: counter versi korpus per tenant (default CorpusGeneration di
+      `pdf_corpus_state`), naik setiap ingest, delete dan swap index
+    - tenant_id: namespace data. Semua dokumen MongoDB diberi tenant_id dan setiap tenant
+      memiliki direktori ChromaDB sendiri; gunakan for_tenant() untuk tenant lain
+    - context_builder: penyusun context prompt dengan budget token (default ContextBuilder)
+    - reranker: re-ranker setelah retrieval (default dari env RERANKER, "none" = nonaktif)
+    - ingest_lease_seconds: lease ingest per file tanpa heartbeat selama ini boleh diambil
+      alih (recovery, ingest ulang)
+    """
+
+    def __init__(
+        self,
+        collection,
+        vector_collection=None,
+        parent_collection=None,
+        file_collection=None,
+        tombstone_collection=None,
+        openai_client: Optional[OpenAI] = None,
+        scheduler: Optional[OpenAIScheduler] = None,
+        hedger: Optional[Hedger] = None,
+        embeddings=None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        vectorstore_factory=None,
+        persist_directory: str = CHROMA_DIR,
+        embedding_model: str = EMBEDDING_MODEL,
+        model_name: str = MODEL_NAME,
+        temperature: float = MODEL_TEMPERATURE,
+        max_tokens: int = MODEL_MAX_TOKENS,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        context_builder: Optional[ContextBuilder] = None,
+        near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        merge_adjacent: bool = MERGE_ADJACENT_CHUNKS,
+        reranker: Optional[Reranker] = None,
+        rerank_fetch_k: int = RERANK_FETCH_K,
+        parent_child: bool = PARENT_CHILD_CHUNKS,
+        child_chunk_size: int = CHILD_CHUNK_SIZE,
+        child_chunk_overlap: int = CHILD_CHUNK_OVERLAP,
+        chunking_strategy: str = CHUNKING_STRATEGY,
+        corpus_generation: Optional[CorpusGeneration] = None,
+        tenant_id: str = DEFAULT_TENANT,
+        ingest_lease_seconds: float = INGEST_LEASE_SECONDS,
+    ):
+        self.collection = collection
+        self.vector_collection = (
+            vector_collection if vector_collection is not None
+            else collection.database[VECTOR_COLLECTION_NAME]
+        )
+        self.parent_collection = (
+            parent_collection if parent_collection is not None
+            else collection.database[PARENT_COLLECTION_NAME]
+        )
+        self.file_collection = (
+            file_collection if file_collection is not None
+            else collection.database[FILE_COLLECTION_NAME]
+        )
+        self.tombstone_collection = (
+            tombstone_collection if tombstone_collection is not None
+            else collection.database[VECTOR_TOMBSTONE_COLLECTION_NAME]
+        )
+        # Semua query baca lewat repository supaya selalu memakai projection
+        self.chunks = DocumentRepository(self.collection)
+        self.parents = DocumentRepository(self.parent_collection)
+        self.files = DocumentRepository(self.file_collection)
+        self.tombstones = DocumentRepository(self.tombstone_collection)
+        # Dibagi semua engine tenant (for_tenant) supaya satu watcher melayani semuanya
+        self.corpus = corpus_generation or CorpusGeneration(collection.database[CORPUS_COLLECTION_NAME])
+        self.vectors = VectorRepository(self.vector_collection, embedding_model)
+        # Retry ditangani scheduler, bukan client, supaya backoff dan limit konsisten
+        self.openai_client = openai_client or OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE"),
+            max_retries=0
+        )
+        self.scheduler = scheduler or get_default_scheduler()
+        self.hedger = hedger or get_default_hedger()
+        self.embedding_model = embedding_model
+        if embedding_cache is None and EMBEDDING_CACHE_PATH:
+            embedding_cache = EmbeddingCache()
+        self.embedding_cache = embedding_cache
+        self.embeddings = embeddings or EngineEmbeddings(self)
+        self.vectorstore_factory = vectorstore_factory or (
+            lambda directory, embedding_function: Chroma(
+                persist_directory=directory, embedding_function=embedding_function
+            )
+        )
+        self.tenant_id = validate_tenant_id(tenant_id)
+        self.base_persist_directory = persist_directory
+        self.persist_directory = tenant_persist_directory(persist_directory, self.tenant_id)
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # Dengan parent-child, chunk yang di-embed adalah child kecil; parent = halaman penuh
+        self.parent_child = parent_child
+        if parent_child:
+            chunk_size, chunk_overlap = child_chunk_size, child_chunk_overlap
+        self.chunk_overlap = chunk_overlap
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.merge_adjacent = merge_adjacent
+        self.reranker = reranker if reranker is not None else create_reranker()
+        self.rerank_fetch_k = rerank_fetch_k
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+        if chunking_strategy not in CHUNKING_STRATEGIES:
+            raise ValueError(f"CHUNKING_STRATEGY tidak dikenal: {chunking_strategy}")
+        self.chunking_strategy = chunking_strategy
+        self.structure_chunker = (
+            StructureChunker(chunk_size, chunk_overlap) if chunking_strategy == "structure" else None
+        )
+        self.context_builder = context_builder or ContextBuilder(model=model_name)
+        self._vectorstore = None
+        self._vectorstore_directory = None
+        self._index_pointer = (None, None)  # (mtime_ns, isi pointer) supaya pointer tidak dibaca per query
+        self._index_lock = threading.RLock()  # Serialisasi penulisan vector index dan swap versi index
+        self._index_build_thread = None
+        self._transactions_supported = True
+        self.ingest_lease_seconds = ingest_lease_seconds
+        self._leases = threading.local()  # Lease ingest yang dipegang thread ini: filename -> owner
+        self._tenant_engines = {self.tenant_id: self}
+        self._tenant_lock = threading.Lock()
+        self.ensure_indexes()
+
+    def for_tenant(self, tenant_id: Optional[str]) -> "RagEngine":
+        """
+        Engine untuk tenant lain yang berbagi client OpenAI, embedding cache, re-ranker
+        dan collection MongoDB, tetapi dengan filter tenant_id dan ChromaDB sendiri.
+        Instance di-cache sehingga vector store setiap tenant hanya dibuka sekali.
+        """
+        tenant_id = validate_tenant_id(tenant_id or DEFAULT_TENANT)
+        with self._tenant_lock:
+            engine = self._tenant_engines.get(tenant_id)
+            if engine is None:
+                engine = copy.copy(self)
+                engine.tenant_id = tenant_id
+                engine.persist_directory = tenant_persist_directory(self.base_persist_directory, tenant_id)
+                engine._vectorstore = None
+                engine._vectorstore_directory = None
+                engine._index_pointer = (None, None)
+                engine._index_lock = threading.RLock()
+                engine._index_build_thread = None
+                engine._leases = threading.local()
+                self._tenant_engines[tenant_id] = engine
+                logger.info(f"🏢 Engine tenant '{tenant_id}' dibuat (ChromaDB: {engine.persist_directory})")
+            return engine
+
+    def tenant_filter(self) -> Dict[str, Any]:
+        """Filter MongoDB tenant ini; tenant default juga mencakup dokumen lama tanpa tenant_id"""
+        if self.tenant_id == DEFAULT_TENANT:
+            return {"tenant_id": {"$in": [DEFAULT_TENANT, None]}}
+        return {"tenant_id": self.tenant_id}
+
+    def _scoped(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        return {**self.tenant_filter(), **query}
+
+    def corpus_generation(self) -> int:
+        """Versi korpus tenant ini; naik setiap ingest, delete dan swap index"""
+        return self.corpus.current(self.tenant_id)
+
+    def ensure_indexes(self):
+        """Membuat index MongoDB yang dipakai oleh ingest dan hydration"""
+        try:
+            self._ensure_unique_doc_id_index()
+            self.collection.create_index([("tenant_id", 1), ("filename", 1), ("file_hash", 1)])
+            self.collection.create_index("chunk_hash")
+            self.collection.create_index([("tenant_id", 1), ("filename", 1), ("page", 1)])
+            self.collection.create_index([("tenant_id", 1), ("file_hash", 1)])
+            self.collection.create_index([("tenant_id", 1), ("doc_year", 1), ("doc_revision", 1)])
+            self.collection.create_index([("tenant_id", 1), ("ingested_at", 1)])
+            self.vector_collection.create_index([("chunk_hash", 1), ("embedding_model", 1)], unique=True)
+            # parent_id hanya unik per tenant (nama file yang sama bisa ada di banyak tenant)
+            if "parent_id_1" in self.parent_collection.index_information():
+                self.parent_collection.drop_index("parent_id_1")
+            self.parent_collection.create_index([("tenant_id", 1), ("parent_id", 1)], unique=True)
+            self.parent_collection.create_index([("tenant_id", 1), ("filename", 1), ("page", 1)])
+            self.file_collection.create_index([("tenant_id", 1), ("filename", 1)], unique=True)
+            self.tombstone_collection.create_index([("tenant_id", 1), ("doc_id", 1)], unique=True)
+            self.tombstone_collection.create_index([("tenant_id", 1), ("deleted_at", 1)])
+            self.corpus.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"⚠️ Gagal membuat index MongoDB: {e}")
+
+    def _ensure_unique_doc_id_index(self):
+        """
+        doc_id unik per tenant, sehingga dua ingest file yang sama tidak pernah
+        menghasilkan chunk ganda. Index lama yang tidak unik diganti; jika data lama
+        sudah berisi duplikat, index unik gagal dibuat dan peringatan dicatat.
+        """
+        existing = self.collection.index_information().get("tenant_id_1_doc_id_1")
+        if existing is not None and not existing.get("unique"):
+            self.collection.drop_index("tenant_id_1_doc_id_1")
+        try:
+            self.collection.create_index([("tenant_id", 1), ("doc_id", 1)], unique=True)
+        except OperationFailure as e:
+            logger.warning(f"⚠️ Index unik doc_id gagal dibuat (ada chunk ganda?): {e}")
+            self.collection.create_index([("tenant_id", 1), ("doc_id", 1)])
+
+    # === Ekstraksi dan Chunking ===
+    def extract_text_from_pdf(self, pdf_path: str, method: str = "pymupdf") -> str:
+        """
+        Ekstrak teks dari file PDF menggunakan PyMuPDF atau PyPDF2
+        """
+        try:
+            if method == "pymupdf":
+                # Menggunakan PyMuPDF (fitz) - lebih baik untuk OCR dan layout kompleks
+                doc = fitz.open(pdf_path)
+                text = ""
+                for page_num in range(len(doc)):
+                    page = doc.load_page(page_num)
+                    text += page.get_text() + "\n"
+                doc.close()
+                return text
+
+            elif method == "pypdf2":
+                # Menggunakan PyPDF2 - lebih cepat untuk PDF sederhana
+                with open(pdf_path, 'rb') as file:
+                    pdf_reader = PyPDF2.PdfReader(file)
+                    text = ""
+                    for page in pdf_reader.pages:
+                        text += page.extract_text() + "\n"
+                return text
+
+        except Exception as e:
+            logger.error(f"❌ Error extracting text from {pdf_path}: {e}")
+        return ""
+
+    def extract_pages(self, pdf_path: str = None, stream: bytes = None) -> List[str]:
+        """
+        Ekstrak teks per halaman dari file PDF (path) atau langsung dari bytes (stream)
+        menggunakan PyMuPDF
+        """
+        try:
+            if stream is not None:
+                doc = fitz.open(stream=stream, filetype="pdf")
+            else:
+                doc = fitz.open(pdf_path)
+            with doc:
+                return [page.get_text() for page in doc]
+        except Exception as e:
+            logger.error(f"❌ Error extracting pages from {pdf_path or 'stream'}: {e}")
+            return []
+
+    def extract_layouts(self, pdf_path: str = None, stream: bytes = None) -> List[List]:
+        """
+        Ekstrak baris teks per halaman beserta info block dan font (PyMuPDF) untuk
+        structure-aware chunking
+        """
+        try:
+            if stream is not None:
+                doc = fitz.open(stream=stream, filetype="pdf")
+            else:
+                doc = fitz.open(pdf_path)
+            with doc:
+                return [extract_layout_lines(page) for page in doc]
+        except Exception as e:
+            logger.error(f"❌ Error extracting layout from {pdf_path or 'stream'}: {e}")
+            return []
+
+    def _extract_for_ingest(self, pdf_path: str = None, stream: bytes = None):
+        """Teks per halaman, plus layout jika structure chunking aktif"""
+        if self.structure_chunker is None:
+            return self.extract_pages(pdf_path, stream), None
+        layouts = self.extract_layouts(pdf_path, stream)
+        return [layout_text(lines) for lines in layouts], layouts
+
+    def split_text_into_chunks(self, text: str, filename: str) -> List[Dict[str, Any]]:
+        """
+        Membagi teks menjadi chunk-chunk kecil
+        """
+        chunks = self.text_splitter.split_text(text)
+
+        documents = []
+        for i, chunk in enumerate(chunks):
+            documents.append({
+                "text": chunk,
+                "filename": filename,
+                "chunk_id": i,
+                "source": "pdf",
+                "chunk_size": len(chunk)
+            })
+
+        return documents
+
+    def split_pages_into_chunks(
+        self, pages: Dict[int, str], filename: str, structure=None
+    ) -> List[Dict[str, Any]]:
+        """
+        Membagi setiap halaman menjadi chunk. chunk_id dihitung per halaman sehingga
+        perubahan satu halaman tidak menggeser doc_id halaman lain. `structure` adalah
+        hasil StructureChunker.chunk_pages (path awal halaman, chunk per halaman);
+        jika None dipakai RecursiveCharacterTextSplitter.
+        """
+        documents = []
+        for page_num in sorted(pages):
+            text = pages[page_num]
+            if not text.strip():
+                continue
+            if structure is None:
+                page_hash = get_page_hash(text)
+                page_chunks = self.split_text_into_chunks(text, filename)
+            else:
+                page_paths, chunks_by_page = structure
+                page_hash = get_page_hash(text, page_paths[page_num - 1])
+                page_chunks = [
+                    {
+                        **chunk,
+                        "filename": filename,
+                        "chunk_id": i,
+                        "source": "pdf",
+                        "chunk_size": len(chunk["text"])
+                    }
+                    for i, chunk in enumerate(chunks_by_page.get(page_num, []))
+                ]
+            for doc in page_chunks:
+                doc["page"] = page_num
+                doc["page_hash"] = page_hash
+                doc["chunk_hash"] = get_chunk_hash(doc["text"])
+                documents.append(doc)
+        return documents
+
+    # === Embedding ===
+    def get_embedding(self, text: str, call_site: str = "embedding") -> List[float]:
+        """
+        Membuat embedding untuk teks menggunakan OpenAI
+        """
+        return self.get_embeddings([text], call_site=call_site)[0]
+
+    def get_embeddings(self, texts: List[str], call_site: str = "embedding") -> List[List[float]]:
+        """
+        Membuat embedding untuk banyak teks sekaligus. Embedding cache dicek dulu,
+        sisanya dikirim ke OpenAI per EMBEDDING_BATCH_SIZE lewat scheduler (rate limit
+        dan retry) lalu disimpan ke cache. Batch yang tetap gagal setelah semua retry
+        menghasilkan list kosong untuk setiap teksnya; pemanggil wajib memeriksanya.
+        call_site menentukan metrik scheduler dan apakah panggilan di-hedge.
+        """
+        if self.embedding_cache is not None:
+            embeddings = self.embedding_cache.get_many(self.embedding_model, texts)
+        else:
+            embeddings = [None] * len(texts)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch_idx = missing[start:start + EMBEDDING_BATCH_SIZE]
+            batch = [texts[i] for i in batch_idx]
+            try:
+                tokens = sum(count_tokens(text, self.model_name) for text in batch)
+                result = self.hedger.call(call_site, lambda: self.scheduler.call(
+                    lambda: self.openai_client.embeddings.create(input=batch, model=self.embedding_model),
+                    tokens=tokens,
+                    call_site=call_site
+                ))
+                batch_embeddings = [item.embedding for item in sorted(result.data, key=lambda d: d.index)]
+            except Exception as e:
+                logger.error(f"❌ Error creating embeddings for batch of {len(batch)}: {e}")
+                batch_embeddings = [[] for _ in batch]
+
+            for i, embedding in zip(batch_idx, batch_embeddings):
+                embeddings[i] = embedding
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many(self.embedding_model, batch, batch_embeddings)
+
+        return embeddings
+
+    def embed_chunks(self, documents: List[Dict[str, Any]], on_batch=None) -> Dict[str, List[float]]:
+        """
+        Mengembalikan mapping chunk_hash -> embedding untuk semua chunk.
+        Hash yang sudah ada di vector_collection dipakai ulang; hanya teks baru
+        (unik per hash) yang dikirim ke OpenAI. Setiap batch langsung disimpan ke store
+        (checkpoint), sehingga ingest yang terputus tidak mengulang batch yang selesai.
+        on_batch(batches_done, batches_total) dipanggil setelah setiap batch.
+        """
+        texts_by_hash = {}
+        for doc in documents:
+            texts_by_hash.setdefault(doc["chunk_hash"], doc["text"])
+
+        vectors = self.vectors.get_many(texts_by_hash)
+
+        missing = [h for h in texts_by_hash if h not in vectors]
+        new_count = 0
+        batches_total = -(-len(missing) // EMBEDDING_BATCH_SIZE)
+        for batch_no, start in enumerate(range(0, len(missing), EMBEDDING_BATCH_SIZE), 1):
+            batch_hashes = missing[start:start + EMBEDDING_BATCH_SIZE]
+            # get_embeddings mengecek embedding cache dulu sebelum memanggil OpenAI
+            embeddings = self.get_embeddings([texts_by_hash[h] for h in batch_hashes])
+            new_entries = {h: embedding for h, embedding in zip(batch_hashes, embeddings) if embedding}
+            self.vectors.insert_many(new_entries)
+            vectors.update(new_entries)
+            new_count += len(new_entries)
+            if on_batch is not None:
+                on_batch(batch_no, batches_total)
+
+        logger.info(
+            f"♻️ {len(texts_by_hash) - len(missing)} chunk unik dipakai ulang, "
+            f"{new_count} embedding baru dibuat"
+        )
+        return vectors
+
+    # === Ingest ===
+    def is_file_processed(self, filename: str, file_hash: str) -> bool:
+        """
+        Cek apakah file dengan hash yang sama sudah selesai ditulis. Katalog pdf_files
+        hanya mendapat file_hash baru di akhir penulisan chunk, sehingga file yang
+        ingest-nya terputus tidak dianggap selesai.
+        """
+        entry = self.files.find_one(self._catalog_key(filename), ["file_hash", "ingest"])
+        if entry is None:
+            # Data lama sebelum ada katalog
+            return self.chunks.exists(self._scoped({"filename": filename, "file_hash": file_hash}))
+        status = entry.get("ingest", {}).get("status", INGEST_INDEXED)
+        return entry.get("file_hash") == file_hash and status in INGEST_COMPLETE_STATES
+
+    def _skip_if_processed(self, filename: str, file_hash: str, resume: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Hasil "skipped" jika file sudah selesai; file yang berhenti setelah chunk ditulis
+        tetapi sebelum vector index diperbarui dilanjutkan dari checkpoint tersebut
+        (resume=False: None, supaya dilanjutkan di bawah lease)
+        """
+        if not self.is_file_processed(filename, file_hash):
+            return None
+        state = self.get_ingest_state(filename)
+        if state.get("status") == INGEST_WRITTEN:
+            if not resume:
+                return None
+            logger.info(f"⏯️ {filename}: melanjutkan ingest dari checkpoint '{INGEST_WRITTEN}'")
+            self.finish_indexing(filename)
+            return {"filename": filename, "status": "resumed", "chunks": 0}
+        logger.info(f"⏭️ File {filename} sudah diproses sebelumnya, skip...")
+        return {"filename": filename, "status": "skipped", "chunks": 0}
+
+    def find_filename_by_hash(self, file_hash: str) -> Optional[str]:
+        """Nama file yang sudah di-ingest dengan hash konten yang sama, atau None"""
+        doc = self.chunks.find_one(self._scoped({"file_hash": file_hash}), ["filename"])
+        return doc["filename"] if doc else None
+
+    def ingest_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
+        """
+        Memproses satu file PDF dan menyimpan chunk-nya ke MongoDB.
+        Mengembalikan dict {filename, status, chunks} dengan status
+        "processed", "skipped", "resumed", "empty", "busy" atau "failed".
+        """
+        filename = os.path.basename(pdf_path)
+        file_hash = get_file_hash(pdf_path)
+
+        def _ingest():
+            logger.info(f"📖 Memproses file: {filename}")
+            started = time.monotonic()
+            pages, layouts = self._extract_for_ingest(pdf_path)
+            file_info = {"size_bytes": os.path.getsize(pdf_path), "started": started}
+            return self._ingest_pages(filename, file_hash, pages, layouts, file_info)
+
+        return self._ingest_under_lease(filename, file_hash, _ingest)
+
+    def ingest_pdf_bytes(self, data: bytes, filename: str, file_hash: str = None) -> Dict[str, Any]:
+        """
+        Memproses PDF langsung dari bytes (misalnya hasil upload) tanpa menulis ke disk.
+        file_hash (md5) boleh diberikan jika sudah dihitung saat menerima data.
+        """
+        file_hash = file_hash or hashlib.md5(data).hexdigest()
+
+        def _ingest():
+            logger.info(f"📖 Memproses file (stream): {filename}")
+            started = time.monotonic()
+            pages, layouts = self._extract_for_ingest(stream=data)
+            file_info = {"size_bytes": len(data), "started": started}
+            return self._ingest_pages(filename, file_hash, pages, layouts, file_info)
+
+        return self._ingest_under_lease(filename, file_hash, _ingest)
+
+    def _ingest_under_lease(
+        self, filename: str, file_hash: str, ingest: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Menjalankan ingest satu file di bawah lease per file. File yang sudah selesai
+        di-skip tanpa mengambil lease; file yang sedang di-ingest proses lain (API worker
+        lain, CLI atau folder watcher) menghasilkan status "busy".
+        """
+        self._ensure_file_catalog()
+        skipped = self._skip_if_processed(filename, file_hash, resume=False)
+        if skipped:
+            return skipped
+
+        with self.ingest_lease(filename) as leased:
+            if not leased:
+                logger.info(f"⏳ {filename}: sedang di-ingest oleh proses lain, dilewati")
+                return {"filename": filename, "status": "busy", "chunks": 0}
+            # Dicek ulang di bawah lease: proses lain bisa saja baru selesai
+            skipped = self._skip_if_processed(filename, file_hash)
+            if skipped:
+                return skipped
+            return ingest()
+
+    def _ingest_pages(
+        self, filename: str, file_hash: str, pages: List[str], layouts: List[List] = None, file_info: Dict = None
+    ) -> Dict[str, Any]:
+        """
+        Diff halaman terhadap page_hash yang tersimpan, lalu hanya halaman baru/berubah
+        yang di-chunk dan di-embed. Chunk halaman tersebut diganti secara atomik di
+        MongoDB dan vector index; chunk halaman yang hilang ikut dihapus.
+        Jika layouts diberikan, chunk dibuat oleh StructureChunker. file_info
+        ({size_bytes, started}) dicatat di katalog pdf_files.
+
+        Progres dicatat di `ingest` pada katalog (pending -> embedding -> writing ->
+        written -> indexed), sehingga ingest yang terputus dapat dilanjutkan tanpa
+        mengulang batch embedding yang sudah tersimpan.
+        """
+        file_info = file_info or {}
+        started = file_info.get("started", time.monotonic())
+        structure = self.structure_chunker.chunk_pages(layouts) if layouts is not None else None
+        page_paths = structure[0] if structure else [""] * len(pages)
+        new_hashes = {
+            i: get_page_hash(text, page_paths[i - 1]) for i, text in enumerate(pages, 1) if text.strip()
+        }
+        if not new_hashes:
+            logger.warning(f"⚠️ Tidak ada teks yang dapat diekstrak dari {filename}")
+            return {"filename": filename, "status": "empty", "chunks": 0}
+
+        previous = self.get_ingest_state(filename)
+        self._set_ingest_state(
+            filename, file_hash=file_hash, status=INGEST_PENDING, started_at=datetime.now(),
+            batches_done=0, batches_total=0, error=None, in_place=False
+        )
+
+        existing_hashes = self.get_page_hashes(filename)
+        if previous.get("status") == INGEST_WRITING and previous.get("file_hash") == file_hash:
+            # Penulisan sebelumnya terputus (MongoDB tanpa transaksi): halaman yang
+            # sedang ditulis bisa setengah jadi, jadi ditulis ulang
+            for page in previous.get("pages", []):
+                existing_hashes[page] = None
+            logger.info(f"⏯️ {filename}: melanjutkan ingest yang terputus saat menulis chunk")
+        facets = extract_document_facets(filename, "\n".join(pages[:2]))
+        stored = self.chunks.find_one(self._scoped({"filename": filename}), FACET_FIELDS)
+        if stored and any(stored.get(key) != value for key, value in facets.items()):
+            existing_hashes = {page: None for page in existing_hashes}  # Facet berubah: semua halaman ditulis ulang
+        changed_pages = {page for page, page_hash in new_hashes.items() if existing_hashes.get(page) != page_hash}
+        removed_pages = {page for page in existing_hashes if page not in new_hashes}
+        if existing_hashes:
+            logger.info(
+                f"🔄 {filename}: {len(changed_pages)} dari {len(new_hashes)} halaman berubah, "
+                f"{len(removed_pages)} halaman dihapus"
+            )
+
+        documents = self.split_pages_into_chunks(
+            {page: pages[page - 1] for page in changed_pages}, filename, structure
+        )
+        def _checkpoint(batches_done: int, batches_total: int):
+            self._set_ingest_state(
+                filename, status=INGEST_EMBEDDING, batches_done=batches_done, batches_total=batches_total
+            )
+
+        vectors = self.embed_chunks(documents, on_batch=_checkpoint) if documents else {}
+
+        failed_pages = {doc["page"] for doc in documents if not vectors.get(doc["chunk_hash"])}
+        if failed_pages:
+            # Tidak menulis apa pun supaya file tidak dianggap selesai; embedding yang
+            # sudah berhasil tersimpan di pdf_chunk_vectors sehingga retry murah
+            error = f"embedding gagal untuk halaman {sorted(failed_pages)}"
+            logger.error(f"❌ {filename}: Gagal membuat embedding untuk halaman {sorted(failed_pages)}")
+            self._set_ingest_state(filename, status=INGEST_FAILED, error=error)
+            return {"filename": filename, "status": "failed", "chunks": 0, "error": error}
+
+        ingested_at = datetime.now()
+        mongo_docs = [
+            {
+                "doc_id": f"{filename}_page_{doc['page']}_chunk_{doc['chunk_id']}",
+                **({"parent_id": f"{filename}_page_{doc['page']}"} if self.parent_child else {}),
+                "tenant_id": self.tenant_id,
+                "filename": filename,
+                "file_hash": file_hash,
+                "text": doc["text"],
+                "page": doc["page"],
+                "page_hash": doc["page_hash"],
+                "chunk_id": doc["chunk_id"],
+                "chunk_hash": doc["chunk_hash"],
+                "source": doc["source"],
+                "chunk_size": doc["chunk_size"],
+                "section_path": doc.get("section_path", ""),
+                "section": doc.get("section", ""),
+                "kategori": "pdf_document",
+                "ingested_at": ingested_at,
+                **facets
+            }
+            for doc in documents
+        ]
+
+        # Parent (halaman penuh) hanya ditulis dalam mode parent-child; tanpa parent_id,
+        # return_parents=True mengembalikan child apa adanya
+        parent_docs = [
+            {
+                "parent_id": f"{filename}_page_{page}",
+                "tenant_id": self.tenant_id,
+                "filename": filename,
+                "file_hash": file_hash,
+                "page": page,
+                "page_hash": new_hashes[page],
+                "text": pages[page - 1],
+                "kategori": "pdf_document"
+            }
+            for page in sorted(changed_pages)
+        ] if self.parent_child else []
+
+        catalog_entry = {
+            "file_hash": file_hash,
+            "pages": len(new_hashes),
+            "size_bytes": file_info.get("size_bytes"),
+            "ingested_at": ingested_at,
+            "ingest_seconds": round(time.monotonic() - started, 3),
+            "pages_changed": len(changed_pages),
+            **facets
+        }
+
+        replaced_pages = changed_pages | removed_pages
+        self._set_ingest_state(
+            filename, status=INGEST_WRITING, pages=sorted(page for page in replaced_pages if page is not None)
+        )
+        stale_ids = self.replace_pages(
+            filename, file_hash, replaced_pages, mongo_docs, parent_docs, catalog_entry
+        )
+        self.update_vector_index(mongo_docs, stale_ids)
+        self._set_ingest_state(filename, status=INGEST_INDEXED, stale_ids=[], finished_at=datetime.now())
+
+        logger.info(f"✅ {filename}: {len(mongo_docs)} chunks berhasil disimpan ({len(changed_pages)} halaman)")
+        return {
+            "filename": filename,
+            "status": "processed",
+            "chunks": len(mongo_docs),
+            "pages_changed": len(changed_pages),
+            "pages_total": len(pages)
+        }
+
+    def get_page_hashes(self, filename: str) -> Dict[Optional[int], str]:
+        """
+        Mapping halaman -> page_hash dari chunk yang tersimpan untuk file ini.
+        Chunk lama tanpa page_hash (format sebelum ingest per halaman) dipetakan ke key None
+        sehingga selalu dianggap halaman yang harus dihapus.
+        """
+        hashes = {}
+        for doc in self.chunks.find(self._scoped({"filename": filename}), PAGE_HASH_FIELDS):
+            if doc.get("page_hash") is None:
+                hashes[None] = ""
+            else:
+                hashes[doc["page"]] = doc["page_hash"]
+        return hashes
+
+    def replace_pages(
+        self, filename: str, file_hash: str, pages, new_docs: List[Dict], new_parents: List[Dict] = (),
+        catalog_entry: Dict = None
+    ) -> List[str]:
+        """
+        Mengganti chunk dan parent untuk halaman-halaman tertentu dalam satu transaksi
+        MongoDB (jika server mendukung), memperbarui file_hash seluruh chunk file, dan
+        menulis entry katalog pdf_files di transaksi yang sama. Entry katalog sekaligus
+        menandai checkpoint "written" beserta doc_id lama yang masih harus dihapus dari
+        vector index, sehingga langkah indexing dapat diulang setelah crash.
+        Mengembalikan doc_id lama yang tidak lagi ada setelah penggantian.
+        """
+        new_ids = {doc["doc_id"] for doc in new_docs}
+        page_numbers = sorted(page for page in pages if page is not None)
+        page_filter = {
+            **self.tenant_filter(),
+            "filename": filename,
+            "$or": [
+                {"page": {"$in": page_numbers}},
+                {"page_hash": {"$exists": False}}
+            ]
+        }
+
+        def _replace(session):
+            if session is None and catalog_entry is not None:
+                # Tanpa transaksi halaman ditulis di tempat: jika terputus, halaman lama
+                # dan baru bisa bercampur (lihat _abandon_ingest)
+                self._set_ingest_state(filename, in_place=True)
+            old_ids = self.chunks.distinct_ids(page_filter, session=session)
+            self.collection.delete_many(page_filter, session=session)
+            if new_docs:
+                self.collection.insert_many([dict(doc) for doc in new_docs], session=session)
+            self.parent_collection.delete_many(
+                self._scoped({"filename": filename, "page": {"$in": page_numbers}}), session=session
+            )
+            if new_parents:
+                self.parent_collection.insert_many([dict(doc) for doc in new_parents], session=session)
+            self.collection.update_many(
+                self._scoped({"filename": filename}), {"$set": {"file_hash": file_hash}}, session=session
+            )
+            stale_ids = [doc_id for doc_id in old_ids if doc_id not in new_ids]
+            generation = (
+                self.corpus.bump(self.tenant_id, f"ingest:{filename}", session=session)
+                if new_docs or old_ids else None
+            )
+            if catalog_entry is not None:
+                chunk_count = self.collection.count_documents(self._scoped({"filename": filename}), session=session)
+                self.update_file_catalog(filename, {
+                    **catalog_entry,
+                    "chunks": chunk_count,
+                    "ingest.status": INGEST_WRITTEN,
+                    "ingest.stale_ids": stale_ids
+                }, session=session)
+            return stale_ids, generation
+
+        stale_ids, generation = self._run_in_transaction(_replace)
+        if generation is not None:
+            self.corpus.observe(self.tenant_id, generation)
+        return stale_ids
+
+    def _run_in_transaction(self, callback):
+        """
+        Menjalankan callback(session) di dalam transaksi. MongoDB standalone (tanpa
+        replica set) tidak mendukung transaksi, sehingga callback dijalankan tanpa session.
+        """
+        client = getattr(self.collection.database, "client", None)
+        if client is None or not self._transactions_supported:
+            return callback(None)
+
+        try:
+            with client.start_session() as session:
+                return session.with_transaction(callback)
+        except OperationFailure as e:
+            # 20 = IllegalOperation: "Transaction numbers are only allowed on a replica set member or mongos"
+            if e.code != 20:
+                raise
+            logger.info("ℹ️ MongoDB tidak mendukung transaksi, penggantian chunk dijalankan tanpa transaksi")
+            self._transactions_supported = False
+            return callback(None)
+
+    def ingest_pdf_documents(self, folder_path: str) -> List[Dict[str, Any]]:
+        """
+        Memproses semua file PDF dalam folder dan menyimpannya ke MongoDB
+        """
+        results = []
+        for pdf_path in get_pdf_files(folder_path):
+            result = self.ingest_pdf_file(pdf_path)
+            result["path"] = pdf_path
+            results.append(result)
+        return results
+
+    # === Vector Store ===
+    # Index dibangun blue/green: setiap build ditulis ke `<persist_directory>.versions/<versi>`
+    # dan pointer `<persist_directory>.current.json` menunjuk versi aktif. Tanpa pointer
+    # (data lama), persist_directory sendiri yang dipakai.
+    @property
+    def index_versions_directory(self) -> str:
+        return f"{self.persist_directory}.versions"
+
+    @property
+    def index_pointer_path(self) -> str:
+        return f"{self.persist_directory}.current.json"
+
+    def read_index_pointer(self) -> Optional[Dict[str, Any]]:
+        """Isi pointer versi aktif; dibaca ulang hanya jika file berubah (mtime)"""
+        try:
+            mtime = os.stat(self.index_pointer_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached_mtime, pointer = self._index_pointer
+        if cached_mtime != mtime:
+            with open(self.index_pointer_path, "r", encoding="utf-8") as f:
+                pointer = json.load(f)
+            self._index_pointer = (mtime, pointer)
+        return pointer
+
+    def _write_index_pointer(self, pointer: Dict[str, Any]):
+        """Menulis pointer secara atomik (file sementara + os.replace)"""
+        tmp_path = f"{self.index_pointer_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pointer, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_pointer_path)
+
+    def active_vector_directory(self) -> str:
+        pointer = self.read_index_pointer()
+        return pointer["directory"] if pointer else self.persist_directory
+
+    def vectorstore_exists(self) -> bool:
+        return os.path.exists(self.active_vector_directory())
+
+    def get_vectorstore(self):
+        """
+        Mengembalikan instance vector store yang di-cache. Jika pointer berpindah ke versi
+        lain (build atau rollback, juga dari proses lain), versi baru dibuka otomatis.
+        """
+        directory = self.active_vector_directory()
+        if self._vectorstore is None or self._vectorstore_directory != directory:
+            self._vectorstore = self.vectorstore_factory(directory, self.embeddings)
+            self._vectorstore_directory = directory
+            logger.info(f"🔁 Vector index dimuat dari '{directory}'")
+        return self._vectorstore
+
+    @staticmethod
+    def _vector_metadata(doc: Dict) -> Dict[str, Any]:
+        """Metadata chunk yang disimpan di ChromaDB"""
+        return {
+            "doc_id": doc["doc_id"],
+            "filename": doc["filename"],
+            "kategori": doc.get("kategori", "pdf_document"),
+            "page": doc.get("page", 0),
+            "chunk_id": doc.get("chunk_id", 0),
+            "section_path": doc.get("section_path", ""),
+            "ingested_at": to_timestamp(doc["ingested_at"]) if doc.get("ingested_at") else 0,
+            "doc_year": doc.get("doc_year", 0),
+            "doc_revision": doc.get("doc_revision", 0)
+        }
+
+    def update_vector_index(self, docs: List[Dict], stale_ids: List[str]):
+        """
+        Upsert chunk baru ke vector index lalu hapus doc_id yang sudah tidak ada.
+        doc_id yang dihapus dicatat sebagai tombstone di MongoDB lebih dulu, sehingga
+        langsung tersaring dari hasil search di semua worker walaupun delete di
+        ChromaDB gagal atau worker lain masih memegang index lama. Ruang vector yang
+        dihapus baru kembali setelah compaction (lihat maybe_compact_vector_index).
+        Jika index belum pernah dibangun, perubahan akan ikut saat build_vectorstore().
+        """
+        if not self.vectorstore_exists() or not (docs or stale_ids):
+            return
+
+        with self._index_lock:
+            vectorstore = self.get_vectorstore()
+            if docs:
+                vectorstore.add_texts(
+                    [doc["text"] for doc in docs],
+                    metadatas=[self._vector_metadata(doc) for doc in docs],
+                    ids=[doc["doc_id"] for doc in docs]
+                )
+                # doc_id yang ditulis ulang (file di-upload lagi setelah dihapus) hidup kembali
+                self.tombstone_collection.delete_many(
+                    self._scoped({"doc_id": {"$in": [doc["doc_id"] for doc in docs]}})
+                )
+            if stale_ids:
+                self.record_tombstones(stale_ids)
+                try:
+                    vectorstore.delete(ids=stale_ids)
+                except Exception as e:
+                    logger.warning(f"⚠️ Gagal menghapus {len(stale_ids)} vector dari ChromaDB, disaring lewat tombstone: {e}")
+
+        if stale_ids:
+            self.maybe_compact_vector_index()
+
+    # === Tombstone dan Compaction ===
+    def record_tombstones(self, doc_ids: List[str]):
+        """Mencatat doc_id yang sudah dihapus dari MongoDB tetapi vector-nya mungkin masih ada"""
+        now = datetime.now()
+        self.tombstone_collection.bulk_write([
+            UpdateOne(
+                {"tenant_id": self.tenant_id, "doc_id": doc_id},
+                {"$set": {"deleted_at": now}},
+                upsert=True
+            )
+            for doc_id in doc_ids
+        ], ordered=False)
+
+    def drop_tombstoned(self, results: List) -> List:
+        """Membuang hasil vector search yang doc_id-nya sudah dihapus (satu query ber-index)"""
+        doc_ids = [res.metadata.get("doc_id") for res in results]
+        if not doc_ids:
+            return results
+        dead = set(self.tombstones.distinct_ids(self._scoped({"doc_id": {"$in": doc_ids}})))
+        if not dead:
+            return results
+        return [res for res in results if res.metadata.get("doc_id") not in dead]
+
+    def vector_index_stats(self) -> Dict[str, Any]:
+        """
+        Jumlah vector hidup, tombstone, dan proporsi tombstone di vector index tenant ini.
+        Vector hidup dijumlahkan dari katalog pdf_files (O(jumlah file)), bukan count pdf_docs,
+        karena dipanggil di setiap delete/re-ingest dan /stats.
+        """
+        live = self._catalog_totals().get("chunks", 0)
+        tombstones = self.tombstones.count(self.tenant_filter())
+        total = live + tombstones
+        return {
+            "live_vectors": live,
+            "tombstones": tombstones,
+            "tombstone_ratio": round(tombstones / total, 4) if total else 0.0,
+            "version": (self.read_index_pointer() or {}).get("version"),
+            "building": self.is_index_building()
+        }
+
+    def is_index_building(self) -> bool:
+        return self._index_build_thread is not None and self._index_build_thread.is_alive()
+
+    def _start_index_build(self, target, name: str) -> bool:
+        """Menjalankan build/compaction di background thread; satu build per tenant"""
+        with self._index_lock:
+            if self.is_index_building():
+                return False
+
+            def _run():
+                try:
+                    target()
+                except Exception as e:
+                    logger.error(f"❌ {name} vector index gagal: {e}")
+
+            self._index_build_thread = threading.Thread(target=_run, name=f"{name}-{self.tenant_id}", daemon=True)
+            self._index_build_thread.start()
+            return True
+
+    def start_vectorstore_build(self) -> bool:
+        """build_vectorstore() di background; False jika build lain sedang berjalan"""
+        return self._start_index_build(self.build_vectorstore, "build")
+
+    def maybe_compact_vector_index(self, force: bool = False) -> bool:
+        """
+        Menjalankan compaction di background thread jika tombstone melewati
+        COMPACTION_MIN_TOMBSTONES dan COMPACTION_TOMBSTONE_RATIO (atau force=True).
+        Mengembalikan True jika compaction dimulai.
+        """
+        if self.is_index_building() or not self.vectorstore_exists():
+            return False
+        stats = self.vector_index_stats()
+        below_threshold = (
+            stats["tombstones"] < COMPACTION_MIN_TOMBSTONES or stats["tombstone_ratio"] < COMPACTION_TOMBSTONE_RATIO
+        )
+        if below_threshold and not force:
+            return False
+
+        logger.info(
+            f"🧹 Tombstone {stats['tombstones']} ({stats['tombstone_ratio']:.0%}) melewati ambang, "
+            f"compaction vector index dimulai"
+        )
+        return self._start_index_build(self.compact_vector_index, "compaction")
+
+    def _fill_vectorstore(self, vectorstore, docs: List[Dict]):
+        for start in range(0, len(docs), VECTOR_BUILD_BATCH_SIZE):
+            batch = docs[start:start + VECTOR_BUILD_BATCH_SIZE]
+            vectorstore.add_texts(
+                [doc["text"] for doc in batch],
+                metadatas=[self._vector_metadata(doc) for doc in batch],
+                ids=[doc["doc_id"] for doc in batch]
+            )
+
+    def compact_vector_index(self) -> int:
+        """
+        Compaction = build blue/green baru hanya dari chunk yang masih hidup; setelah
+        versi baru aktif, tombstone yang sudah tidak relevan dibersihkan.
+        Mengembalikan jumlah vector di index baru.
+        """
+        started = datetime.now()
+        count = self.build_vectorstore()
+        removed = self.tombstone_collection.delete_many(self._scoped({"deleted_at": {"$lt": started}}))
+        logger.info(f"✅ Compaction selesai: {count} vector hidup, {removed.deleted_count} tombstone dibersihkan")
+        return count
+
+    def warm_embedding_cache(self, docs: List[Dict]):
+        """
+        Mengisi embedding cache dari vector store MongoDB (pdf_chunk_vectors) untuk
+        teks yang belum ada di cache, supaya build ChromaDB tidak memanggil OpenAI lagi
+        """
+        if self.embedding_cache is None:
+            return
+
+        texts = [doc["text"] for doc in docs]
+        cached = self.embedding_cache.get_many(self.embedding_model, texts)
+        uncached = [doc for doc, embedding in zip(docs, cached) if embedding is None and doc.get("chunk_hash")]
+        if not uncached:
+            return
+
+        vectors = self.vectors.get_many({doc["chunk_hash"] for doc in uncached})
+        warm = [doc for doc in uncached if doc["chunk_hash"] in vectors]
+        self.embedding_cache.put_many(
+            self.embedding_model,
+            [doc["text"] for doc in warm],
+            [vectors[doc["chunk_hash"]] for doc in warm]
+        )
+        logger.info(f"♨️ {len(warm)} embedding dimuat dari MongoDB ke embedding cache")
+
+    def build_vectorstore(self) -> int:
+        """
+        Membangun ChromaDB dari dokumen MongoDB secara blue/green: index ditulis ke
+        direktori versi baru sementara query tetap dilayani versi aktif, perubahan yang
+        terjadi selama build disusulkan, lalu pointer dipindahkan secara atomik.
+        Versi sebelumnya disimpan untuk rollback_vectorstore().
+        Mengembalikan jumlah dokumen yang di-index.
+        """
+        docs = list(self.chunks.find(self.tenant_filter(), INDEX_FIELDS))
+        if not docs:
+            return 0
+
+        self.warm_embedding_cache(docs)
+
+        version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        directory = os.path.join(self.index_versions_directory, version)
+        logger.info(f"📊 Membangun ChromaDB versi {version} dari {len(docs)} dokumen...")
+        fresh = self.vectorstore_factory(directory, self.embeddings)
+        self._fill_vectorstore(fresh, docs)
+
+        with self._index_lock:
+            # Susulkan ingest dan delete yang terjadi selama build (dibandingkan per chunk_hash)
+            built = {doc["doc_id"]: doc.get("chunk_hash") for doc in docs}
+            current = {
+                doc["doc_id"]: doc.get("chunk_hash")
+                for doc in self.chunks.find(self.tenant_filter(), ["doc_id", "chunk_hash"])
+            }
+            changed_ids = [doc_id for doc_id, chunk_hash in current.items() if built.get(doc_id) != chunk_hash]
+            if changed_ids:
+                self._fill_vectorstore(fresh, self.chunks.find_by_ids(self.tenant_filter(), changed_ids, INDEX_FIELDS))
+            late_dead = [doc_id for doc_id in built if doc_id not in current]
+            if late_dead:
+                fresh.delete(ids=late_dead)
+
+            previous = self.read_index_pointer()
+            self._write_index_pointer({
+                "version": version,
+                "directory": directory,
+                "previous": previous["directory"] if previous else (
+                    self.persist_directory if os.path.exists(self.persist_directory) else None
+                ),
+                "built_at": datetime.now(),
+                "chunks": len(current),
+                "embedding_model": self.embedding_model
+            })
+            # Versi baru sudah dibuka oleh build ini; tidak perlu dibuka ulang
+            self._vectorstore = fresh
+            self._vectorstore_directory = directory
+            self.corpus.bump(self.tenant_id, f"index_swap:{version}")
+
+        self._prune_index_versions()
+        logger.info(f"✅ ChromaDB versi {version} aktif ({len(current)} dokumen) di '{directory}'.")
+        return len(current)
+
+    def rollback_vectorstore(self) -> str:
+        """
+        Mengaktifkan kembali versi index sebelumnya. Chunk yang dihapus setelah versi itu
+        dibangun ikut dihapus dari index tersebut. Mengembalikan direktori yang aktif.
+        """
+        with self._index_lock:
+            pointer = self.read_index_pointer()
+            if not pointer or not pointer.get("previous") or not os.path.exists(pointer["previous"]):
+                raise ValueError("Tidak ada versi index sebelumnya untuk rollback")
+
+            directory = pointer["previous"]
+            vectorstore = self.vectorstore_factory(directory, self.embeddings)
+            live_ids = set(self.chunks.distinct_ids(self.tenant_filter()))
+            dead = [doc_id for doc_id in vectorstore.get(include=[])["ids"] if doc_id not in live_ids]
+            if dead:
+                vectorstore.delete(ids=dead)
+
+            self._write_index_pointer({
+                **pointer,
+                "version": os.path.basename(directory),
+                "directory": directory,
+                "previous": pointer["directory"],
+                "rolled_back_at": datetime.now()
+            })
+            self._vectorstore = vectorstore
+            self._vectorstore_directory = directory
+            self.corpus.bump(self.tenant_id, f"index_rollback:{os.path.basename(directory)}")
+
+        logger.info(f"⏪ Vector index di-rollback ke '{directory}' ({len(dead)} vector terhapus disusulkan)")
+        return directory
+
+    def _prune_index_versions(self):
+        """Menghapus versi index selain versi aktif dan versi rollback"""
+        if not os.path.isdir(self.index_versions_directory):
+            return
+        pointer = self.read_index_pointer() or {}
+        keep = {pointer.get("directory"), pointer.get("previous")}
+        for version in os.listdir(self.index_versions_directory):
+            directory = os.path.join(self.index_versions_directory, version)
+            if directory not in keep:
+                shutil.rmtree(directory, ignore_errors=True)
+                logger.info(f"🗑️ Versi index lama dihapus: {directory}")
+
+    # === Search dan Answer ===
+    def search_similar_documents(
+        self,
+        query: str,
+        top_k: int = 3,
+        filename_filter: str = None,
+        search_mode: str = SEARCH_MODE,
+        fetch_k: int = MMR_FETCH_K,
+        mmr_lambda: float = MMR_LAMBDA,
+        filters: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Mencari dokumen yang mirip berdasarkan query.
+        search_mode="mmr" mengambil fetch_k kandidat lalu memilih top_k dengan maximal
+        marginal relevance (vectorized, numpy) sehingga chunk dari satu bagian yang
+        hampir identik tidak memenuhi semua slot.
+        filters berisi facet FILTER_FIELDS yang diterapkan di dalam vector index.
+        """
+        if filename_filter:
+            filters = {**(filters or {}), "filename": filename_filter}
+        filter_dict = build_metadata_filter(filters)
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"search_mode harus salah satu dari {SEARCH_MODES}, bukan '{search_mode}'")
+
+        if not self.vectorstore_exists():
+            logger.warning("❌ ChromaDB belum dibuat. Jalankan build_vectorstore() terlebih dahulu.")
+            return []
+
+        def _search(k: int, candidates: int):
+            vectorstore = self.get_vectorstore()
+            if search_mode == "mmr":
+                return vectorstore.max_marginal_relevance_search(
+                    query,
+                    k=k,
+                    fetch_k=max(candidates, k),
+                    lambda_mult=mmr_lambda,
+                    filter=filter_dict
+                )
+            return vectorstore.similarity_search(query, k=k, filter=filter_dict)
+
+        try:
+            generation = self.corpus_generation()
+            results = _search(top_k, fetch_k)
+            live = self.drop_tombstoned(results)
+            if len(live) < len(results):
+                # Vector yang sudah dihapus ikut terambil: ambil ulang dengan kandidat tambahan
+                dead = len(results) - len(live)
+                live = self.drop_tombstoned(_search(top_k + dead, fetch_k + dead))
+            for res in live:
+                res.metadata["corpus_generation"] = generation
+            return live[:top_k]
+        except Exception as e:
+            logger.error(f"❌ Error searching documents: {e}")
+            return []
+
+    def enhance_query(self, query: str, history: List[Dict] = None) -> str:
+        """
+        Menambahkan pertanyaan sebelumnya ke query jika terdeteksi follow-up
+        """
+        if history and is_follow_up_question(query):
+            last_question = history[-1]["question"]
+            logger.info("🔗 Detected follow-up question, enhancing context...")
+            return f"Berdasarkan pertanyaan sebelumnya '{last_question}', {query}"
+        return query
+
+    def hydrate_documents(self, doc_ids: List[str]) -> List[Dict]:
+        """
+        Mengambil chunk dari MongoDB dengan urutan sesuai ranking. Hanya HYDRATE_FIELDS
+        yang dibaca; embedding tidak disimpan di pdf_docs sehingga tidak ikut terkirim.
+        """
+        return self.chunks.find_by_ids(self.tenant_filter(), doc_ids, HYDRATE_FIELDS)
+
+    def expand_to_parents(self, children: List[Dict], top_k: int) -> List[Dict]:
+        """Child chunk (urut ranking) -> maksimal top_k parent section dari pdf_parents"""
+        def _fetch_parents(parent_ids):
+            if not parent_ids:
+                return {}
+            return {
+                doc["parent_id"]: doc
+                for doc in self.parents.find_by_ids(self.tenant_filter(), parent_ids, PARENT_FIELDS, field="parent_id")
+            }
+
+        return expand_to_parents(children, top_k, _fetch_parents)
+
+    def postprocess_documents(
+        self, docs: List[Dict], top_k: int, query: str = None, rerank: bool = False, merge: bool = None
+    ) -> List[Dict]:
+        """
+        Tahap setelah retrieval: buang near-duplicate, ambil top_k unik (setelah re-rank
+        jika aktif), lalu gabungkan chunk bertetangga menjadi span kontinu tanpa overlap ganda
+        """
+        docs = drop_near_duplicates(docs, self.near_duplicate_threshold)
+        if rerank and self.reranker is not None:
+            docs = self.reranker.rerank(query, docs, top_k)
+        else:
+            docs = docs[:top_k]
+        if self.merge_adjacent if merge is None else merge:
+            docs = merge_adjacent_chunks(docs, self.chunk_overlap)
+        return docs
+
+    def build_prompt(self, query: str, document_context: str, conversation_context: str = "") -> str:
+        """
+        Menyusun prompt lengkap dengan dokumen referensi dan conversation context
+        """
+        prompt_parts = []
+
+        if conversation_context:
+            prompt_parts.append("CONVERSATION HISTORY:")
+            prompt_parts.append(conversation_context)
+            prompt_parts.append("\n" + "="*50 + "\n")
+
+        prompt_parts.append("DOKUMEN REFERENSI:")
+        prompt_parts.append(document_context)
+        prompt_parts.append("\n" + "="*50 + "\n")
+
+        if conversation_context:
+            prompt_parts.append(f"PERTANYAAN SAAT INI: {query}")
+            prompt_parts.append("\nInstruksi: Jawab pertanyaan saat ini dengan mempertimbangkan konteks percakapan sebelumnya. Jika pertanyaan ini adalah lanjutan dari pertanyaan sebelumnya, berikan jawaban yang konsisten dan terhubung. Gunakan informasi dari dokumen referensi untuk memberikan jawaban yang akurat dan lengkap.")
+        else:
+            prompt_parts.append(f"PERTANYAAN: {query}")
+            prompt_parts.append("\nInstruksi: Berdasarkan dokumen referensi di atas, jawab pertanyaan dengan akurat dan lengkap.")
+
+        prompt_parts.append("\nJAWABAN:")
+
+        return "\n".join(prompt_parts)
+
+    def generate_answer(self, prompt: str) -> str:
+        """Generate jawaban menggunakan OpenAI chat completion"""
+        return self.generate_answer_with_usage(prompt)[0]
+
+    def generate_answer_with_usage(self, prompt: str):
+        """
+        Generate jawaban dan kembalikan (answer, usage) dengan usage token dari OpenAI
+        """
+        tokens = count_tokens(prompt, self.model_name) + self.max_tokens
+        response = self.hedger.call("chat", lambda: self.scheduler.call(
+            lambda: self.openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            ),
+            tokens=tokens,
+            call_site="chat"
+        ))
+        usage = {}
+        if getattr(response, "usage", None) is not None:
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            }
+        return response.choices[0].message.content, usage
+
+    def answer_question(
+        self,
+        query: str,
+        history: List[Dict] = None,
+        top_k: int = 3,
+        filename_filter: str = None,
+        context_window: int = CONVERSATION_CONTEXT_WINDOW,
+        search_mode: str = SEARCH_MODE,
+        fetch_k: int = MMR_FETCH_K,
+        mmr_lambda: float = MMR_LAMBDA,
+        rerank: Optional[bool] = None,
+        return_parents: Optional[bool] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Menjawab pertanyaan berdasarkan dokumen PDF dengan conversation context.
+        Mengembalikan dict {answer, sources, source_files, used_context, token_usage,
+        corpus_generation}; corpus_generation dibaca sebelum retrieval sehingga aman
+        dipakai sebagai bagian key cache jawaban.
+        rerank=None memakai re-ranker jika dikonfigurasi; False melewati tahap re-rank.
+        return_parents=None mengikuti mode parent-child engine; True mengembalikan parent
+        section dari child yang cocok. filters: facet pre-filter (lihat build_metadata_filter).
+        should_cancel: dicek sebelum retrieval dan sebelum panggilan LLM; jika True,
+        RequestCancelled dilempar agar token tidak terpakai untuk jawaban yang tidak diterima.
+        """
+        def _check_cancelled(stage: str):
+            if should_cancel is not None and should_cancel():
+                logger.info(f"🛑 Jawaban dibatalkan sebelum {stage}")
+                raise RequestCancelled(stage)
+
+        _check_cancelled("retrieval")
+        logger.info(f"🔍 Mencari dokumen relevan untuk: '{query}'")
+        generation = self.corpus_generation()
+
+        recent_history = history[-context_window:] if history and context_window > 0 else []
+        enhanced_query = self.enhance_query(query, recent_history)
+
+        use_parents = self.parent_child if return_parents is None else return_parents
+        child_k = top_k * PARENT_CHILD_FANOUT if use_parents else top_k
+
+        use_rerank = self.reranker is not None and rerank is not False
+        if use_rerank:
+            candidate_k = max(self.rerank_fetch_k, child_k)
+        elif self.near_duplicate_threshold > 0:
+            candidate_k = child_k * RETRIEVAL_OVERFETCH
+        else:
+            candidate_k = child_k
+        results = self.search_similar_documents(
+            enhanced_query, candidate_k, filename_filter,
+            search_mode=search_mode, fetch_k=fetch_k, mmr_lambda=mmr_lambda, filters=filters
+        )
+        if not results:
+            return {
+                "answer": NO_RESULTS_ANSWER, "sources": [], "source_files": [],
+                "used_context": False, "token_usage": {}, "corpus_generation": generation
+            }
+
+        doc_ids = [res.metadata["doc_id"] for res in results]
+        if use_parents:
+            children = self.postprocess_documents(
+                self.hydrate_documents(doc_ids), child_k, query=enhanced_query, rerank=use_rerank, merge=False
+            )
+            full_docs = self.expand_to_parents(children, top_k)
+        else:
+            full_docs = self.postprocess_documents(
+                self.hydrate_documents(doc_ids), top_k, query=enhanced_query, rerank=use_rerank
+            )
+
+        # Bagian tetap prompt dihitung dengan varian instruksi percakapan (lebih panjang)
+        reserved_tokens = count_tokens(
+            self.build_prompt(query, "", "-" if recent_history else ""), self.model_name
+        )
+        context = self.context_builder.build(full_docs, recent_history, reserved_tokens)
+
+        sources = []
+        source_files = []
+        for doc in context["documents"]:
+            filename = doc.get("filename", "Unknown")
+            text = doc.get("text", "")
+            sources.append({
+                "filename": filename,
+                "content": text[:200] + "..." if len(text) > 200 else text,
+                "doc_id": doc.get("doc_id", ""),
+                "page": doc.get("page", 0),
+                "chunk_id": doc.get("chunk_id", 0),
+                "chunk_ids": doc.get("chunk_ids", [doc.get("chunk_id", 0)]),
+                "section_path": doc.get("section_path", "")
+            })
+            if filename not in source_files:
+                source_files.append(filename)
+
+        prompt = self.build_prompt(query, context["document_context"], context["conversation_context"])
+        _check_cancelled("LLM")
+        answer, completion_usage = self.generate_answer_with_usage(prompt)
+
+        token_usage = dict(context["usage"])
+        token_usage.update(completion_usage)
+
+        return {
+            "answer": answer,
+            "sources": sources,
+            "source_files": source_files,
+            "used_context": bool(context["conversation_context"]),
+            "token_usage": token_usage,
+            "corpus_generation": generation
+        }
+
+    # === Utility ===
+    # === Katalog file ===
+    def _catalog_key(self, filename: str) -> Dict[str, str]:
+        return {"tenant_id": self.tenant_id, "filename": filename}
+
+    def update_file_catalog(self, filename: str, entry: Dict[str, Any], session=None):
+        """Upsert entry katalog satu file (dipanggil di dalam transaksi ingest)"""
+        self.file_collection.update_one(
+            self._catalog_key(filename),
+            {"$set": {**entry, **self._catalog_key(filename), "updated_at": datetime.now()}},
+            upsert=True,
+            session=session
+        )
+
+    def get_ingest_state(self, filename: str) -> Dict[str, Any]:
+        """Checkpoint ingest terakhir untuk file ({} jika belum ada)"""
+        entry = self.files.find_one(self._catalog_key(filename), ["ingest"])
+        return (entry or {}).get("ingest", {})
+
+    def _set_ingest_state(self, filename: str, **fields):
+        """Memperbarui sebagian field checkpoint `ingest` pada entry katalog file"""
+        self.file_collection.update_one(
+            self._catalog_key(filename),
+            {"$set": {
+                **{f"ingest.{key}": value for key, value in fields.items()},
+                **self._catalog_key(filename),
+                "updated_at": datetime.now()
+            }},
+            upsert=True
+        )
+
+    # === Lease ingest per file ===
+    @contextmanager
+    def ingest_lease(self, filename: str):
+        """
+        Lease per file di katalog pdf_files (`ingest.owner` + `ingest.heartbeat_at`):
+        hanya satu proses/thread yang meng-ingest, melanjutkan atau membersihkan file
+        yang sama. Yield True jika lease didapat (atau sudah dipegang thread ini), False
+        jika dipegang proses lain yang heartbeat-nya masih baru. Selama lease dipegang,
+        heartbeat diperbarui di background thread; lease dilepas saat keluar.
+        """
+        held = getattr(self._leases, "owners", None)
+        if held is None:
+            held = self._leases.owners = {}
+        if filename in held:
+            yield True
+            return
+
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if not self._acquire_ingest_lease(filename, owner):
+            yield False
+            return
+
+        held[filename] = owner
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_ingest_lease, args=(filename, owner, stop), name="ingest-lease", daemon=True
+        )
+        heartbeat.start()
+        try:
+            yield True
+        except Exception as e:
+            # Checkpoint dibiarkan apa adanya supaya recovery dapat melanjutkannya
+            self.file_collection.update_one(
+                {**self._catalog_key(filename), "ingest.owner": owner},
+                {"$set": {"ingest.error": str(e) or type(e).__name__}}
+            )
+            raise
+        finally:
+            stop.set()
+            heartbeat.join()
+            del held[filename]
+            self._release_ingest_lease(filename, owner)
+
+    def _lease_expiry(self) -> datetime:
+        """Heartbeat yang lebih lama dari ini berarti pemegang lease sudah mati"""
+        return datetime.now() - timedelta(seconds=self.ingest_lease_seconds)
+
+    def _acquire_ingest_lease(self, filename: str, owner: str) -> bool:
+        """
+        Mengambil lease secara atomik: entry tanpa pemilik atau dengan heartbeat kedaluwarsa
+        diambil alih. Jika lease masih dipegang, upsert menabrak index unik
+        (tenant_id, filename) sehingga hanya satu pemanggil yang menang.
+        """
+        now = datetime.now()
+        try:
+            self.file_collection.update_one(
+                {**self._catalog_key(filename), "$or": [
+                    {"ingest.owner": {"$exists": False}},
+                    {"ingest.heartbeat_at": {"$lt": self._lease_expiry()}}
+                ]},
+                {"$set": {
+                    "ingest.owner": owner,
+                    "ingest.heartbeat_at": now,
+                    **self._catalog_key(filename),
+                    "updated_at": now
+                }},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def _heartbeat_ingest_lease(self, filename: str, owner: str, stop: threading.Event):
+        while not stop.wait(self.ingest_lease_seconds / 4):
+            try:
+                result = self.file_collection.update_one(
+                    {**self._catalog_key(filename), "ingest.owner": owner},
+                    {"$set": {"ingest.heartbeat_at": datetime.now()}}
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat lease ingest {filename} gagal: {e}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"⚠️ Lease ingest {filename} sudah diambil alih proses lain")
+                return
+
+    def _release_ingest_lease(self, filename: str, owner: str):
+        key = {**self._catalog_key(filename), "ingest.owner": owner}
+        # Entry yang hanya dibuat untuk lease (file baru yang kosong atau gagal diekstrak)
+        self.file_collection.delete_one({**key, "ingest.status": {"$exists": False}, "chunks": {"$exists": False}})
+        self.file_collection.update_one(key, {"$unset": {"ingest.owner": "", "ingest.heartbeat_at": ""}})
+
+    def finish_indexing(self, filename: str) -> bool:
+        """
+        Melanjutkan ingest dari checkpoint "written": chunk sudah ada di MongoDB, jadi
+        hanya vector index yang diperbarui (embedding diambil dari pdf_chunk_vectors).
+        Mengembalikan False jika file sedang dikerjakan proses lain.
+        """
+        with self.ingest_lease(filename) as leased:
+            if not leased:
+                return False
+            state = self.get_ingest_state(filename)
+            docs = list(self.chunks.find(self._scoped({"filename": filename}), INDEX_FIELDS))
+            self.warm_embedding_cache(docs)
+            self.update_vector_index(docs, state.get("stale_ids", []))
+            self._set_ingest_state(filename, status=INGEST_INDEXED, stale_ids=[], finished_at=datetime.now())
+            return True
+
+    def _incomplete_ingest_query(self, stale_only: bool = False) -> Dict[str, Any]:
+        """
+        Checkpoint yang belum selesai atau gagal. stale_only: hanya yang tidak dipegang
+        proses hidup (tanpa pemilik atau heartbeat lebih lama dari lease)
+        """
+        query = {"ingest.status": {"$exists": True, "$nin": [INGEST_INDEXED, INGEST_ABANDONED]}}
+        if stale_only:
+            query["$or"] = [
+                {"ingest.owner": {"$exists": False}},
+                {"ingest.heartbeat_at": {"$lt": self._lease_expiry()}}
+            ]
+        return query
+
+    def _incomplete_ingest_filter(self, stale_only: bool = False) -> Dict[str, Any]:
+        return self._scoped(self._incomplete_ingest_query(stale_only))
+
+    def list_incomplete_ingests(self, stale_only: bool = False) -> List[Dict[str, Any]]:
+        """
+        File dengan ingest yang belum selesai atau gagal (untuk dilanjutkan/di-retry).
+        stale_only=True melewati file yang sedang dikerjakan proses lain.
+        """
+        return list(self.files.find(
+            self._incomplete_ingest_filter(stale_only), ["filename", "chunks", "ingest"]
+        ).sort("filename", 1))
+
+    def tenants_with_incomplete_ingests(self) -> List[str]:
+        """
+        Tenant yang memiliki ingest terputus (lintas tenant, untuk recovery saat startup);
+        ingest yang lease-nya masih hidup tidak dihitung
+        """
+        return sorted(self.file_collection.distinct("tenant_id", self._incomplete_ingest_query(stale_only=True)))
+
+    @staticmethod
+    def _find_ingest_source(filename: str, file_hash: Optional[str], folders: List[str]) -> Optional[str]:
+        """File sumber di salah satu folder: nama asli, atau arsip `<file_hash>_<nama>`"""
+        names = [filename] + ([f"{file_hash}_{filename}"] if file_hash else [])
+        for folder in folders:
+            for name in names:
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def recover_incomplete_ingests(self, folders: List[str]) -> Dict[str, int]:
+        """
+        Melanjutkan ingest yang terputus (misalnya proses berhenti di tengah upload).
+        Hanya checkpoint tanpa lease hidup yang disentuh: ingest yang masih berjalan di
+        worker lain, CLI atau folder watcher memperbarui heartbeat-nya dan dilewati.
+        - "written": hanya vector index yang diperbarui
+        - status lain: file di-ingest ulang dari folder sumber; batch embedding yang sudah
+          tersimpan dipakai ulang
+        - file sumber tidak ditemukan: lihat _abandon_ingest
+        Mengembalikan jumlah file per hasil (resumed, retried, failed, cleaned, busy).
+        """
+        summary = {"resumed": 0, "retried": 0, "failed": 0, "cleaned": 0, "busy": 0}
+        for entry in self.list_incomplete_ingests(stale_only=True):
+            filename = entry["filename"]
+            try:
+                with self.ingest_lease(filename) as leased:
+                    if not leased:
+                        summary["busy"] += 1
+                        continue
+                    # Dibaca ulang di bawah lease: proses lain bisa saja baru menyelesaikannya
+                    state = self.get_ingest_state(filename)
+                    if state.get("status") in (INGEST_INDEXED, INGEST_ABANDONED):
+                        continue
+                    if state.get("status") == INGEST_WRITTEN:
+                        self.finish_indexing(filename)
+                        summary["resumed"] += 1
+                        continue
+
+                    source = self._find_ingest_source(filename, state.get("file_hash"), folders)
+                    if source is None:
+                        self._abandon_ingest(entry, state)
+                        summary["cleaned"] += 1
+                        continue
+
+                    logger.info(f"⏯️ {filename}: ingest '{state.get('status')}' diulang dari {source}")
+                    with open(source, "rb") as f:
+                        result = self.ingest_pdf_bytes(f.read(), filename)
+                    summary["retried" if result["status"] in ("processed", "skipped", "resumed") else "failed"] += 1
+            except Exception as e:
+                logger.error(f"❌ Recovery ingest {filename} gagal: {e}")
+                summary["failed"] += 1
+        return summary
+
+    def _abandon_ingest(self, entry: Dict[str, Any], state: Dict[str, Any]):
+        """
+        File sumber tidak ditemukan (misalnya upload tanpa arsip). Jika versi sebelumnya
+        masih utuh, versi itu tetap dipakai dan checkpoint ditandai "abandoned". Tidak ada
+        versi utuh jika file belum pernah selesai, atau penulisan tanpa transaksi terputus
+        (halaman lama dan baru bisa bercampur); file tersebut dihapus dan harus di-upload ulang.
+        """
+        filename = entry["filename"]
+        if "chunks" not in entry:
+            logger.warning(f"🧹 {filename}: file sumber tidak ditemukan, ingest yang belum selesai dihapus")
+            self.delete_file(filename)
+            return
+        if state.get("status") == INGEST_WRITING and state.get("in_place"):
+            logger.warning(
+                f"🧹 {filename}: file sumber tidak ditemukan dan penulisan tanpa transaksi terputus, "
+                f"chunk yang setengah jadi dihapus; upload ulang file ini"
+            )
+            self.delete_file(filename)
+            return
+        logger.warning(f"🧹 {filename}: file sumber tidak ditemukan, versi sebelumnya tetap dipakai")
+        self._set_ingest_state(filename, status=INGEST_ABANDONED, finished_at=datetime.now())
+
+    def rebuild_file_catalog(self) -> int:
+        """
+        Membangun ulang katalog pdf_files dari chunk (satu kali scan), untuk data yang
+        di-ingest sebelum katalog ada. Mengembalikan jumlah file.
+        """
+        pipeline = [
+            {"$match": self.tenant_filter()},
+            {"$group": {
+                "_id": "$filename",
+                "chunks": {"$sum": 1},
+                "file_hash": {"$first": "$file_hash"},
+                "pages": {"$addToSet": "$page"},
+                "ingested_at": {"$max": "$ingested_at"},
+                "doc_year": {"$first": "$doc_year"},
+                "doc_revision": {"$first": "$doc_revision"}
+            }}
+        ]
+        files = list(self.collection.aggregate(pipeline))
+        for info in files:
+            self.update_file_catalog(info["_id"], {
+                "file_hash": info.get("file_hash"),
+                "chunks": info["chunks"],
+                "pages": len([page for page in info["pages"] if page is not None]),
+                "ingested_at": info.get("ingested_at"),
+                "doc_year": info.get("doc_year") or 0,
+                "doc_revision": info.get("doc_revision") or 0
+            })
+        logger.info(f"🗂️ Katalog pdf_files dibangun ulang: {len(files)} file")
+        return len(files)
+
+    def _ensure_file_catalog(self):
+        """Katalog kosong tetapi chunk ada (data lama): bangun ulang sekali"""
+        # Entry yang hanya berisi lease ingest (tanpa `chunks`) tidak dihitung
+        if not self.files.exists(self._scoped({"chunks": {"$exists": True}})) and self.chunks.exists(self.tenant_filter()):
+            self.rebuild_file_catalog()
+
+    def migrate_legacy_embeddings(self, batch_size: int = 500) -> int:
+        """
+        Memindahkan field `embedding` lama dari pdf_docs ke pdf_chunk_vectors (float32
+        binary) lalu menghapusnya dari chunk, sehingga dokumen pdf_docs tetap ringan.
+        Mengembalikan jumlah chunk yang dimigrasi.
+        """
+        migrated = 0
+        query = self._scoped({"embedding": {"$exists": True}})
+        while True:
+            batch = list(self.chunks.find(query, ["doc_id", "chunk_hash", "text", "embedding"]).limit(batch_size))
+            if not batch:
+                break
+            vectors = {}
+            updates = []
+            for doc in batch:
+                # Chunk sangat lama belum punya chunk_hash; hash dihitung dan disimpan sekarang
+                chunk_hash = doc.get("chunk_hash") or get_chunk_hash(doc["text"])
+                if doc.get("embedding"):
+                    vectors[chunk_hash] = decode_embedding(doc["embedding"])
+                updates.append(UpdateOne(
+                    self._scoped({"doc_id": doc["doc_id"]}),
+                    {"$set": {"chunk_hash": chunk_hash}, "$unset": {"embedding": ""}}
+                ))
+            self.vectors.insert_many(vectors)
+            self.collection.bulk_write(updates, ordered=False)
+            migrated += len(batch)
+        if migrated:
+            logger.info(f"📦 {migrated} embedding dipindahkan dari pdf_docs ke pdf_chunk_vectors")
+        return migrated
+
+    def list_processed_files(self) -> List[Dict[str, Any]]:
+        """
+        Daftar file PDF yang sudah diproses dari katalog pdf_files (O(jumlah file),
+        tanpa scan chunk)
+        """
+        self._ensure_file_catalog()
+        # Entry tanpa `chunks` adalah file baru yang ingest pertamanya belum selesai
+        return list(self.files.find(
+            self._scoped({"chunks": {"$exists": True}}), CATALOG_FIELDS
+        ).sort("filename", 1))
+
+    def delete_file(self, filename: str) -> int:
+        """
+        Menghapus semua chunks dari file tertentu (MongoDB dan vector index).
+        Mengembalikan jumlah chunk yang dihapus.
+        """
+        def _delete(session):
+            doc_ids = self.chunks.distinct_ids(self._scoped({"filename": filename}), session=session)
+            result = self.collection.delete_many(self._scoped({"filename": filename}), session=session)
+            self.parent_collection.delete_many(self._scoped({"filename": filename}), session=session)
+            self.file_collection.delete_one(self._catalog_key(filename), session=session)
+            generation = (
+                self.corpus.bump(self.tenant_id, f"delete:{filename}", session=session)
+                if result.deleted_count else None
+            )
+            return doc_ids, result.deleted_count, generation
+
+        doc_ids, deleted, generation = self._run_in_transaction(_delete)
+        if generation is not None:
+            self.corpus.observe(self.tenant_id, generation)
+        self.update_vector_index([], doc_ids)
+        return deleted
+
+    def _catalog_totals(self) -> Dict[str, Any]:
+        """Jumlah file, chunk, halaman dan ukuran tenant ini dari katalog pdf_files"""
+        self._ensure_file_catalog()
+        return next(self.file_collection.aggregate([
+            {"$match": self._scoped({"chunks": {"$exists": True}})},
+            {"$group": {
+                "_id": None,
+                "files": {"$sum": 1},
+                "chunks": {"$sum": "$chunks"},
+                "pages": {"$sum": "$pages"},
+                "size_bytes": {"$sum": "$size_bytes"}
+            }}
+        ]), {})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistik dasar dari katalog pdf_files (O(jumlah file)) dan vector store"""
+        totals = self._catalog_totals()
+        return {
+            "tenant_id": self.tenant_id,
+            "corpus_generation": self.corpus_generation(),
+            "total_files": totals.get("files", 0),
+            "total_documents": totals.get("chunks", 0),
+            "total_chunks": totals.get("chunks", 0),
+            "total_pages": totals.get("pages", 0),
+            "total_size_bytes": totals.get("size_bytes", 0),
+            "incomplete_ingests": self.files.count(self._incomplete_ingest_filter()),
+            "vector_store_status": "available" if self.vectorstore_exists() else "not_built",
+            "vector_index": self.vector_index_stats(),
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache is not None else None,
+            "reranker": self.reranker.stats() if self.reranker is not None else None,
+            "openai_scheduler": self.scheduler.stats(),
+            "hedging": self.hedger.stats()
+        }
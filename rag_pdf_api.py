@@ -5,14 +5,24 @@ FastAPI implementation untuk sistem RAG PDF dengan multi-turn conversation
 
 import os
 import uuid
-import shutil
+import asyncio
+import hashlib
 import logging
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Literal, Union
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+import rag_engine
+from rag_engine import RagEngine, RequestCancelled
+from folder_watcher import FolderWatcher
+from single_flight import SingleFlight, normalize_question, request_key
+from admission import AdmissionController, AdmissionRejected, ASK_DEFAULT_DEADLINE
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -23,10 +33,12 @@ mongo_client = None
 db = None
 collection = None
 conversation_manager = None
+engine = None
+folder_watcher = None
 
 def load_rag_functions():
-    """Load functions dari rag-db-pdf.py tanpa menjalankan main code"""
-    global mongo_client, db, collection, conversation_manager
+    """Initialize MongoDB connection, shared RagEngine and conversation manager"""
+    global mongo_client, db, collection, conversation_manager, engine
     
     try:
         # Import dependencies yang diperlukan
@@ -40,8 +52,8 @@ def load_rag_functions():
         # Setup configurations
         MONGO_URI = os.getenv("MONGO_URI")
         MONGO_URI_LOCAL = "mongodb://localhost:27017"
-        DB_NAME = "RAG_PDF_Demo"
-        COLLECTION_NAME = "pdf_docs"
+        DB_NAME = rag_engine.DB_NAME
+        COLLECTION_NAME = rag_engine.COLLECTION_NAME
         
         logger.info("Attempting MongoDB connection...")
         logger.info(f"Remote URI configured: {'Yes' if MONGO_URI else 'No'}")
@@ -75,6 +87,14 @@ def load_rag_functions():
             db = mongo_client[DB_NAME]
             collection = db[COLLECTION_NAME]
             logger.info(f"Database and collection initialized: {DB_NAME}.{COLLECTION_NAME}")
+            
+            engine = RagEngine(
+                collection=collection,
+                model_name=os.getenv("MODEL_NAME", "gpt-4o-mini"),
+                temperature=float(os.getenv("MODEL_TEMPERATURE", "0")),
+                max_tokens=int(os.getenv("MODEL_MAX_TOKENS", "2048"))
+            )
+            logger.info("RAG engine initialized")
         
         # Initialize conversation manager (simple version)
         conversation_manager = SimpleConversationManager()
@@ -88,19 +108,21 @@ def load_rag_functions():
         return False
 
 class SimpleConversationManager:
-    """Simplified conversation manager for API"""
+    """Simplified conversation manager for API (conversations are scoped per tenant)"""
     
     def __init__(self):
-        self.conversations = {}  # conversation_id -> history
+        self.conversations = {}  # (tenant_id, conversation_id) -> history
         
-    def get_conversation(self, conversation_id: str) -> List[Dict]:
+    def get_conversation(self, conversation_id: str, tenant_id: str = rag_engine.DEFAULT_TENANT) -> List[Dict]:
         """Get conversation history"""
-        return self.conversations.get(conversation_id, [])
+        return self.conversations.get((tenant_id, conversation_id), [])
     
-    def add_turn(self, conversation_id: str, question: str, answer: str, sources: List[str] = None):
+    def add_turn(self, conversation_id: str, question: str, answer: str, sources: List[str] = None,
+                 tenant_id: str = rag_engine.DEFAULT_TENANT):
         """Add turn to conversation"""
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
+        key = (tenant_id, conversation_id)
+        if key not in self.conversations:
+            self.conversations[key] = []
         
         turn = {
             "question": question,
@@ -109,22 +131,21 @@ class SimpleConversationManager:
             "timestamp": datetime.now().isoformat()
         }
         
-        self.conversations[conversation_id].append(turn)
+        self.conversations[key].append(turn)
         
         # Keep only last 10 turns
-        if len(self.conversations[conversation_id]) > 10:
-            self.conversations[conversation_id] = self.conversations[conversation_id][-10:]
+        if len(self.conversations[key]) > 10:
+            self.conversations[key] = self.conversations[key][-10:]
         
-        return len(self.conversations[conversation_id])
+        return len(self.conversations[key])
     
-    def clear_conversation(self, conversation_id: str):
+    def clear_conversation(self, conversation_id: str, tenant_id: str = rag_engine.DEFAULT_TENANT):
         """Clear specific conversation"""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
+        self.conversations.pop((tenant_id, conversation_id), None)
     
-    def list_conversations(self) -> List[str]:
-        """List all conversation IDs"""
-        return list(self.conversations.keys())
+    def list_conversations(self, tenant_id: str = None) -> List[str]:
+        """List conversation IDs (all tenants when tenant_id is None)"""
+        return [conv_id for tenant, conv_id in self.conversations if tenant_id is None or tenant == tenant_id]
 
 # Pydantic models
 class UploadResponse(BaseModel):
@@ -132,17 +153,42 @@ class UploadResponse(BaseModel):
     uploaded_files: List[str]
     total_files: int
     upload_id: str
+    duplicate_files: List[Dict] = []
 
 class IngestResponse(BaseModel):
     message: str
     processed_files: List[str]
     total_chunks: int
     status: str
+    duplicate_files: List[Dict] = []
+    failed_files: List[Dict] = []
+
+class SearchFilters(BaseModel):
+    """Metadata facets applied inside the vector index before similarity search"""
+    # Unknown or misspelled facets are rejected (422) instead of silently widening the search
+    model_config = ConfigDict(extra="forbid")
+    
+    filename: Optional[Union[str, List[str]]] = None
+    kategori: Optional[Union[str, List[str]]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    ingested_after: Optional[datetime] = None
+    ingested_before: Optional[datetime] = None
+    doc_year: Optional[Union[int, List[int]]] = None
+    doc_revision: Optional[Union[int, List[int]]] = None
 
 class QuestionRequest(BaseModel):
     question: str
     conversation_id: Optional[str] = None
     max_results: Optional[int] = 5
+    search_mode: Literal["similarity", "mmr"] = rag_engine.SEARCH_MODE
+    fetch_k: Optional[int] = rag_engine.MMR_FETCH_K
+    mmr_lambda: Optional[float] = rag_engine.MMR_LAMBDA
+    rerank: Optional[bool] = None
+    return_parents: Optional[bool] = None
+    filters: Optional[SearchFilters] = None
+    priority: Literal["interactive", "batch"] = "interactive"
+    deadline_ms: Optional[int] = None  # Defaults to ASK_DEFAULT_DEADLINE
 
 class AnswerResponse(BaseModel):
     answer: str
@@ -150,6 +196,9 @@ class AnswerResponse(BaseModel):
     question: str
     sources: List[Dict]
     turn_number: int
+    token_usage: Dict = {}
+    corpus_generation: Optional[int] = None
+    coalesced: bool = False
 
 # FastAPI app
 app = FastAPI(
@@ -170,6 +219,94 @@ app.add_middleware(
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Raw PDFs from /upload-and-ingest are archived in this subfolder of the tenant's upload
+# folder (not scanned by /ingest or the watcher)
+UPLOAD_ARCHIVE_DIR = "archive"
+
+# Upload folders of non-default tenants live below this folder
+TENANT_UPLOAD_ROOT = os.path.join(UPLOAD_DIR, "tenants")
+
+# Upload limits
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read/written per step while streaming an upload
+MAX_UPLOAD_SIZE_MB = float(os.getenv("MAX_UPLOAD_SIZE_MB", "50"))
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", "4"))
+UPLOAD_DUPLICATE_POLICY = os.getenv("UPLOAD_DUPLICATE_POLICY", "link")  # "link" or "reject"
+upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+# Tenant header: every request is scoped to one tenant (default tenant when absent)
+TENANT_HEADER = "X-Tenant-ID"
+
+def get_tenant_engine(x_tenant_id: Optional[str] = Header(None, alias=TENANT_HEADER)) -> RagEngine:
+    """Resolve the RagEngine for the request's tenant (503 without MongoDB, 400 for a bad id)"""
+    if engine is None:
+        raise HTTPException(status_code=503, detail="MongoDB not connected. Please check /health endpoint.")
+    try:
+        return engine.for_tenant(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def tenant_upload_dir(tenant_id: str) -> str:
+    """Uploads of the default tenant stay in UPLOAD_DIR, other tenants get a subfolder"""
+    if tenant_id == rag_engine.DEFAULT_TENANT:
+        return UPLOAD_DIR
+    path = os.path.join(TENANT_UPLOAD_ROOT, tenant_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def is_within(path: str, root: str) -> bool:
+    """True when the resolved path is root itself or inside it"""
+    path, root = os.path.realpath(path), os.path.realpath(root)
+    return os.path.commonpath([path, root]) == root
+
+def resolve_tenant_folder(tenant_id: str, folder_path: Optional[str]) -> str:
+    """
+    Resolve an ingest folder for the tenant, defaulting to its upload folder.
+    Anything outside that folder (other tenants' uploads, arbitrary server paths) is a 403.
+    """
+    upload_dir = tenant_upload_dir(tenant_id)
+    if not folder_path:
+        return upload_dir
+    
+    # The default tenant's folder is UPLOAD_DIR itself, which also holds TENANT_UPLOAD_ROOT
+    allowed = is_within(folder_path, upload_dir) and (
+        tenant_id != rag_engine.DEFAULT_TENANT or not is_within(folder_path, TENANT_UPLOAD_ROOT)
+    )
+    if not allowed:
+        raise HTTPException(status_code=403, detail="folder_path must be inside the tenant's upload folder")
+    return os.path.realpath(folder_path)
+
+# Identical concurrent /ask requests share one retrieval + LLM computation
+ASK_COALESCING = os.getenv("ASK_COALESCING", "true").lower() == "true"
+ask_flights = SingleFlight()
+
+# Bounded admission queue for /ask: overload is shed with 429/503 + Retry-After
+ask_admission = AdmissionController()
+DISCONNECT_POLL_INTERVAL = 0.25  # Seconds between client disconnect checks while waiting
+
+async def await_unless_disconnected(http_request: Request, awaitable):
+    """Await the result, cancelling the work as soon as the client disconnects"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("🔌 Client disconnected, cancelling /ask")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+# Comma-separated folders to auto-ingest, e.g. WATCH_FOLDERS=uploads,pdf_documents
+WATCH_FOLDERS = [f.strip() for f in os.getenv("WATCH_FOLDERS", "").split(",") if f.strip()]
+
+# Resume or clean up ingests interrupted by a restart (background thread on startup)
+INGEST_RECOVERY_ON_STARTUP = os.getenv("INGEST_RECOVERY_ON_STARTUP", "true").lower() == "true"
+
+# Move inline `embedding` arrays of old pdf_docs rows into pdf_chunk_vectors on startup
+LEGACY_EMBEDDING_MIGRATION_ON_STARTUP = os.getenv("LEGACY_EMBEDDING_MIGRATION_ON_STARTUP", "true").lower() == "true"
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize system on startup"""
@@ -180,120 +317,61 @@ async def startup_event():
         # Try to continue with basic functionality
     else:
         logger.info("RAG system initialized successfully")
-
-# Helper functions
-def extract_text_from_pdf_api(pdf_path: str) -> str:
-    """Extract text from PDF file"""
-    try:
-        import fitz
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text() + "\n"
-        doc.close()
-        return text
-    except Exception as e:
-        logger.error(f"Error extracting text from {pdf_path}: {e}")
-        return ""
-
-def split_text_into_chunks_api(text: str, filename: str) -> List[Dict]:
-    """Split text into chunks"""
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
+        # Every worker follows corpus changes made by other workers (ingest, delete, index swap)
+        engine.corpus.start()
+        start_folder_watcher()
+        if LEGACY_EMBEDDING_MIGRATION_ON_STARTUP or INGEST_RECOVERY_ON_STARTUP:
+            threading.Thread(target=run_startup_maintenance, name="startup-maintenance", daemon=True).start()
+
+def start_folder_watcher():
+    """Start background folder watcher when WATCH_FOLDERS is configured"""
+    global folder_watcher
     
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
+    if not WATCH_FOLDERS or engine is None or folder_watcher is not None:
+        return
     
-    chunks = text_splitter.split_text(text)
-    
-    documents = []
-    for i, chunk in enumerate(chunks):
-        doc = {
-            "text": chunk,
-            "filename": filename,
-            "chunk_id": i,
-            "source": "pdf",
-            "chunk_size": len(chunk)
-        }
-        documents.append(doc)
-    
-    return documents
-
-def get_embedding_api(text: str) -> List[float]:
-    """Get embedding for text"""
+    folder_watcher = FolderWatcher(engine, WATCH_FOLDERS)
+    folder_watcher.start()
+
+def run_startup_maintenance():
+    """Legacy embedding migration first, so recovered ingests can reuse the migrated vectors"""
+    if LEGACY_EMBEDDING_MIGRATION_ON_STARTUP:
+        migrate_legacy_embeddings()
+    if INGEST_RECOVERY_ON_STARTUP:
+        recover_incomplete_ingests()
+
+def migrate_legacy_embeddings():
+    """Legacy rows predate tenants, so only the default tenant can still hold inline embeddings"""
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        result = client.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
-        )
-        return result.data[0].embedding
+        migrated = engine.migrate_legacy_embeddings()
+        if migrated:
+            logger.info(f"Migrated {migrated} legacy embeddings to pdf_chunk_vectors")
     except Exception as e:
-        logger.error(f"Error creating embedding: {e}")
-        return []
+        logger.error(f"Legacy embedding migration failed: {e}")
 
-def search_similar_documents_api(query: str, top_k: int = 5) -> List:
-    """Search similar documents"""
+def recover_incomplete_ingests():
+    """
+    Resume interrupted ingests of every tenant from its upload folder, archive or watch folders.
+    Ingests still holding a live lease (another worker, the CLI or the watcher) are left alone.
+    """
     try:
-        from langchain_chroma import Chroma
-        from langchain_openai import OpenAIEmbeddings
-        
-        os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        
-        if not os.path.exists("chroma_pdf_db"):
-            return []
-        
-        chroma = Chroma(persist_directory="chroma_pdf_db", embedding_function=embeddings)
-        results = chroma.similarity_search(query, k=top_k)
-        
-        return results
+        for tenant_id in engine.tenants_with_incomplete_ingests():
+            upload_dir = tenant_upload_dir(tenant_id)
+            folders = [upload_dir, os.path.join(upload_dir, UPLOAD_ARCHIVE_DIR)]
+            if tenant_id == rag_engine.DEFAULT_TENANT:
+                folders += WATCH_FOLDERS
+            summary = engine.for_tenant(tenant_id).recover_incomplete_ingests(folders)
+            logger.info(f"Ingest recovery for tenant '{tenant_id}': {summary}")
     except Exception as e:
-        logger.error(f"Error searching documents: {e}")
-        return []
+        logger.error(f"Ingest recovery failed: {e}")
 
-def generate_answer_api(query: str, context: str, conversation_history: List[Dict] = None) -> str:
-    """Generate answer using OpenAI"""
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        # Build prompt with conversation context
-        prompt_parts = []
-        
-        if conversation_history:
-            prompt_parts.append("CONVERSATION HISTORY:")
-            for turn in conversation_history[-3:]:  # Last 3 turns
-                prompt_parts.append(f"Q: {turn['question']}")
-                prompt_parts.append(f"A: {turn['answer']}")
-            prompt_parts.append("\n" + "="*50 + "\n")
-        
-        prompt_parts.append("DOKUMEN REFERENSI:")
-        prompt_parts.append(context)
-        prompt_parts.append("\n" + "="*50 + "\n")
-        prompt_parts.append(f"PERTANYAAN: {query}")
-        prompt_parts.append("\nInstruksi: Berdasarkan dokumen referensi dan konteks percakapan (jika ada), jawab pertanyaan dengan akurat dan lengkap.")
-        prompt_parts.append("\nJAWABAN:")
-        
-        full_prompt = "\n".join(prompt_parts)
-        
-        response = client.chat.completions.create(
-            model=os.getenv("MODEL_NAME", "gpt-4o-mini"),
-            messages=[{"role": "user", "content": full_prompt}],
-            temperature=float(os.getenv("MODEL_TEMPERATURE", "0")),
-            max_tokens=int(os.getenv("MODEL_MAX_TOKENS", "2048"))
-        )
-        
-        return response.choices[0].message.content
-        
-    except Exception as e:
-        logger.error(f"Error generating answer: {e}")
-        return f"Error generating answer: {str(e)}"
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers on shutdown"""
+    if folder_watcher is not None:
+        folder_watcher.stop()
+    if engine is not None:
+        engine.corpus.stop()
 
 # API Endpoints
 
@@ -323,7 +401,7 @@ async def health_check():
             components["conversation_manager"] = "healthy"
             
         # Test ChromaDB
-        if os.path.exists("chroma_pdf_db"):
+        if engine is not None and engine.vectorstore_exists():
             components["chromadb"] = "available"
             
         status = "healthy" if all(v == "healthy" or v == "available" for v in components.values()) else "degraded"
@@ -332,7 +410,9 @@ async def health_check():
             "status": status,
             "timestamp": datetime.now().isoformat(),
             "version": "1.0.0",
-            "components": components
+            "components": components,
+            "corpus_generation": engine.corpus_generation() if engine is not None else None,
+            "corpus_watcher": engine.corpus.stats()["mode"] if engine is not None else None
         }
         
     except Exception as e:
@@ -344,93 +424,233 @@ async def health_check():
             "error": str(e)
         }
 
+def find_existing_upload(
+    file_hash: str, filename: str, tenant_id: str, tenant_engine: Optional[RagEngine] = None
+) -> Optional[str]:
+    """
+    Return the path of a stored copy with the same content hash: the file already saved
+    under this name, or the upload/archive copy of a file the tenant ingested under another
+    name. A different hash under the same name is a new revision and is not a duplicate;
+    a catalog match without a copy on disk is stored again (ingest then skips its chunks).
+    """
+    upload_dir = tenant_upload_dir(tenant_id)
+    file_path = os.path.join(upload_dir, filename)
+    if os.path.isfile(file_path) and rag_engine.get_file_hash(file_path) == file_hash:
+        return file_path
+    if tenant_engine is None:
+        return None
+    
+    existing = tenant_engine.find_filename_by_hash(file_hash)
+    if not existing or existing == filename:
+        return None
+    for path in (
+        os.path.join(upload_dir, existing),
+        os.path.join(upload_dir, UPLOAD_ARCHIVE_DIR, f"{file_hash}_{existing}")
+    ):
+        if os.path.isfile(path) and rag_engine.get_file_hash(path) == file_hash:
+            return path
+    return None
+
+def check_upload_size(filename: str, size: int):
+    """Raise 413 when an upload is larger than MAX_UPLOAD_SIZE_MB"""
+    if size > MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{filename} exceeds the {MAX_UPLOAD_SIZE_MB:g} MB upload limit"
+        )
+
+async def stream_upload_to_disk(file: UploadFile, tmp_path: str):
+    """
+    Stream an upload to tmp_path in chunks without blocking the event loop.
+    Returns (md5 hex digest, size in bytes); raises 413 when MAX_UPLOAD_SIZE_MB is exceeded.
+    """
+    hash_md5 = hashlib.md5()
+    size = 0
+    
+    buffer = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            data = await file.read(UPLOAD_CHUNK_SIZE)
+            if not data:
+                break
+            size += len(data)
+            check_upload_size(file.filename, size)
+            hash_md5.update(data)
+            await run_in_threadpool(buffer.write, data)
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(os.remove, tmp_path)
+        raise
+    
+    await run_in_threadpool(buffer.close)
+    return hash_md5.hexdigest(), size
+
 @app.post("/upload", response_model=UploadResponse)
-async def upload_files(files: List[UploadFile] = File(...)):
-    """Upload multiple PDF files"""
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    x_tenant_id: Optional[str] = Header(None, alias=TENANT_HEADER)
+):
+    """Upload multiple PDF files (streamed, hashed and deduplicated by content)"""
+    try:
+        tenant_id = rag_engine.validate_tenant_id(x_tenant_id or rag_engine.DEFAULT_TENANT)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tenant_engine = engine.for_tenant(tenant_id) if engine is not None else None
+    upload_dir = tenant_upload_dir(tenant_id)
     upload_id = str(uuid.uuid4())
     uploaded_files = []
+    duplicate_files = []
+    
+    if upload_semaphore.locked():
+        raise HTTPException(
+            status_code=429,
+            detail="Too many concurrent uploads, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
     
     try:
-        for file in files:
-            if not file.filename or not file.filename.lower().endswith('.pdf'):
-                continue
-            
-            # Save file
-            file_path = os.path.join(UPLOAD_DIR, f"{upload_id}_{file.filename}")
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            uploaded_files.append(file_path)
+        # One slot per request, so a multi-file request cannot exceed the bound
+        async with upload_semaphore:
+            for file in files:
+                if not file.filename or not file.filename.lower().endswith('.pdf'):
+                    continue
+                
+                filename = os.path.basename(file.filename)
+                if getattr(file, "size", None) is not None:
+                    check_upload_size(filename, file.size)
+                
+                # Partial files end with .part so the folder watcher and /ingest ignore them
+                tmp_path = os.path.join(upload_dir, f".{upload_id}_{filename}.part")
+                file_hash, size = await stream_upload_to_disk(file, tmp_path)
+                
+                existing = await run_in_threadpool(find_existing_upload, file_hash, filename, tenant_id, tenant_engine)
+                if existing:
+                    await run_in_threadpool(os.remove, tmp_path)
+                    duplicate_files.append({
+                        "filename": filename,
+                        "file_hash": file_hash,
+                        "existing": existing,
+                        "action": "rejected" if UPLOAD_DUPLICATE_POLICY == "reject" else "linked"
+                    })
+                    if UPLOAD_DUPLICATE_POLICY != "reject":
+                        uploaded_files.append(existing)
+                    continue
+                
+                # Original name: a new revision replaces the old file, so re-ingest
+                # only re-embeds the pages that changed
+                file_path = os.path.join(upload_dir, filename)
+                await run_in_threadpool(os.replace, tmp_path, file_path)
+                logger.info(f"Uploaded {filename} ({size} bytes, md5 {file_hash})")
+                
+                uploaded_files.append(file_path)
         
         return UploadResponse(
             message=f"Successfully uploaded {len(uploaded_files)} PDF files",
             uploaded_files=uploaded_files,
             total_files=len(uploaded_files),
-            upload_id=upload_id
+            upload_id=upload_id,
+            duplicate_files=duplicate_files
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-@app.post("/ingest", response_model=IngestResponse)
-async def ingest_documents(folder_path: str = Form(UPLOAD_DIR)):
-    """Ingest PDF documents"""
+async def read_upload(file: UploadFile):
+    """Read an upload into memory in chunks, returning (bytes, md5 hex digest)"""
+    hash_md5 = hashlib.md5()
+    data = bytearray()
+    
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        data.extend(chunk)
+        check_upload_size(file.filename, len(data))
+        hash_md5.update(chunk)
+    
+    return bytes(data), hash_md5.hexdigest()
+
+def archive_upload(data: bytes, file_hash: str, filename: str, tenant_id: str) -> str:
+    """Write the raw PDF to the tenant's UPLOAD_ARCHIVE_DIR (once per content hash)"""
+    archive_dir = os.path.join(tenant_upload_dir(tenant_id), UPLOAD_ARCHIVE_DIR)
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(archive_dir, f"{file_hash}_{filename}")
+    if not os.path.exists(archive_path):
+        with open(archive_path, "wb") as buffer:
+            buffer.write(data)
+    return archive_path
+
+@app.post("/upload-and-ingest", response_model=IngestResponse)
+async def upload_and_ingest(
+    files: List[UploadFile] = File(...),
+    archive: bool = Form(False),
+    tenant_engine: RagEngine = Depends(get_tenant_engine)
+):
+    """
+    Ingest uploaded PDFs straight from memory (PyMuPDF stream) without writing them
+    to uploads/ or rescanning the folder. Only the files in this request are processed.
+    """
+    if upload_semaphore.locked():
+        raise HTTPException(
+            status_code=429,
+            detail="Too many concurrent uploads, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    
     try:
-        # Check if MongoDB is connected
-        if collection is None:
-            raise HTTPException(status_code=503, detail="MongoDB not connected. Please check /health endpoint.")
-        
-        if not os.path.exists(folder_path):
-            raise HTTPException(status_code=404, detail=f"Folder not found: {folder_path}")
-        
-        # Get PDF files
-        pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')]
-        if not pdf_files:
-            raise HTTPException(status_code=404, detail="No PDF files found")
-        
         processed_files = []
+        duplicate_files = []
+        failed_files = []
         total_chunks = 0
+        ingested = 0
         
-        for filename in pdf_files:
-            pdf_path = os.path.join(folder_path, filename)
-            
-            # Extract text
-            text = extract_text_from_pdf_api(pdf_path)
-            if not text.strip():
-                continue
-            
-            # Split into chunks
-            documents = split_text_into_chunks_api(text, filename)
-            
-            # Process each chunk
-            for doc in documents:
-                # Create embedding
-                embedding = get_embedding_api(doc["text"])
-                if not embedding:
+        # One slot per request, so a multi-file request cannot exceed the bound
+        async with upload_semaphore:
+            for file in files:
+                if not file.filename or not file.filename.lower().endswith('.pdf'):
                     continue
                 
-                # Save to MongoDB
-                mongo_doc = {
-                    "doc_id": f"{filename}_chunk_{doc['chunk_id']}",
-                    "filename": filename,
-                    "text": doc["text"],
-                    "chunk_id": doc["chunk_id"],
-                    "source": "pdf",
-                    "embedding": embedding,
-                    "kategori": "pdf_document"
-                }
+                filename = os.path.basename(file.filename)
+                data, file_hash = await read_upload(file)
                 
-                collection.insert_one(mongo_doc)
-                total_chunks += 1
-            
-            processed_files.append(pdf_path)
+                existing = await run_in_threadpool(tenant_engine.find_filename_by_hash, file_hash)
+                if existing and existing != filename:
+                    logger.info(f"Skipping {filename}: same content already ingested as {existing}")
+                    duplicate_files.append({"filename": filename, "file_hash": file_hash, "existing": existing})
+                    continue
+                
+                if archive:
+                    await run_in_threadpool(archive_upload, data, file_hash, filename, tenant_engine.tenant_id)
+                
+                try:
+                    result = await run_in_threadpool(tenant_engine.ingest_pdf_bytes, data, filename, file_hash)
+                except Exception as e:
+                    logger.error(f"Ingestion of {filename} failed: {e}")
+                    failed_files.append({"filename": filename, "status": "failed", "error": str(e)})
+                    continue
+                
+                if result["status"] in ("processed", "resumed"):
+                    processed_files.append(filename)
+                    total_chunks += result["chunks"]
+                if result["status"] in ("processed", "resumed", "skipped"):
+                    ingested += 1
+                else:
+                    failed_files.append({"filename": filename, "status": result["status"]})
+        
+        if not duplicate_files and not failed_files:
+            status = "completed"
+        else:
+            status = "partial" if ingested else "failed"
         
         return IngestResponse(
             message=f"Successfully processed {len(processed_files)} PDF files",
             processed_files=processed_files,
             total_chunks=total_chunks,
-            status="completed"
+            status=status,
+            duplicate_files=duplicate_files,
+            failed_files=failed_files
         )
         
     except HTTPException:
@@ -438,114 +658,220 @@ async def ingest_documents(folder_path: str = Form(UPLOAD_DIR)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
-@app.post("/build-vectorstore")
-async def build_vectorstore():
-    """Build ChromaDB vector store"""
+@app.post("/ingest", response_model=IngestResponse)
+async def ingest_documents(
+    folder_path: Optional[str] = Form(None),
+    tenant_engine: RagEngine = Depends(get_tenant_engine)
+):
+    """Ingest PDF documents from the tenant's upload folder or a folder inside it"""
     try:
-        from langchain_chroma import Chroma
-        from langchain_openai import OpenAIEmbeddings
+        folder_path = resolve_tenant_folder(tenant_engine.tenant_id, folder_path)
         
-        # Get documents from MongoDB
-        docs = list(collection.find({}, {"doc_id": 1, "text": 1, "filename": 1, "kategori": 1}))
-        if not docs:
-            raise HTTPException(status_code=400, detail="No documents found in MongoDB")
+        if not os.path.exists(folder_path):
+            raise HTTPException(status_code=404, detail=f"Folder not found: {folder_path}")
         
-        texts = [doc["text"] for doc in docs]
-        metadatas = [
-            {
-                "doc_id": doc["doc_id"], 
-                "filename": doc["filename"],
-                "kategori": doc["kategori"]
-            } for doc in docs
+        # Ingest blocks on PDF parsing and scheduler backoff, so keep it off the event loop
+        results = await run_in_threadpool(tenant_engine.ingest_pdf_documents, folder_path)
+        if not results:
+            raise HTTPException(status_code=404, detail="No PDF files found")
+        
+        processed_files = [r["path"] for r in results if r["status"] in ("processed", "resumed")]
+        failed_files = [
+            {"filename": r["filename"], "status": r["status"], "error": r.get("error")}
+            for r in results if r["status"] not in ("processed", "resumed", "skipped")
         ]
+        total_chunks = sum(r["chunks"] for r in results if r["status"] in ("processed", "resumed"))
         
-        # Set OpenAI API key
-        os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        if not failed_files:
+            status = "completed"
+        else:
+            status = "partial" if len(failed_files) < len(results) else "failed"
         
-        # Create ChromaDB
-        Chroma.from_texts(
-            texts, 
-            embeddings, 
-            metadatas=metadatas, 
-            persist_directory="chroma_pdf_db"
+        return IngestResponse(
+            message=f"Successfully processed {len(processed_files)} PDF files",
+            processed_files=processed_files,
+            total_chunks=total_chunks,
+            status=status,
+            failed_files=failed_files
         )
         
-        return {"message": "Vector store built successfully", "status": "completed"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
+
+@app.post("/build-vectorstore")
+async def build_vectorstore(background: bool = False, tenant_engine: RagEngine = Depends(get_tenant_engine)):
+    """
+    Build a new ChromaDB version and switch to it atomically (blue/green).
+    Queries keep using the active version during the build.
+    """
+    try:
+        if background:
+            started = tenant_engine.start_vectorstore_build()
+            return {
+                "message": "Vector store build started" if started else "Vector store build already running",
+                "status": "started" if started else "running"
+            }
+
+        if not await run_in_threadpool(tenant_engine.build_vectorstore):
+            raise HTTPException(status_code=400, detail="No documents found in MongoDB")
+        
+        return {
+            "message": "Vector store built successfully",
+            "status": "completed",
+            "version": tenant_engine.read_index_pointer()["version"]
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Vector store build failed: {str(e)}")
 
+@app.post("/rollback-vectorstore")
+async def rollback_vectorstore(tenant_engine: RagEngine = Depends(get_tenant_engine)):
+    """Switch back to the previous vector index version"""
+    try:
+        directory = await run_in_threadpool(tenant_engine.rollback_vectorstore)
+        return {"message": "Vector store rolled back", "status": "completed", "directory": directory}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Vector store rollback failed: {str(e)}")
+
+@app.post("/compact-vectorstore")
+async def compact_vectorstore(tenant_engine: RagEngine = Depends(get_tenant_engine)):
+    """Rewrite the vector index without deleted vectors (runs in the background)"""
+    if not tenant_engine.vectorstore_exists():
+        raise HTTPException(status_code=400, detail="Vector store has not been built")
+    started = tenant_engine.maybe_compact_vector_index(force=True)
+    return {
+        "message": "Compaction started" if started else "Compaction already running",
+        "status": "started" if started else "running",
+        "vector_index": tenant_engine.vector_index_stats()
+    }
+
 @app.post("/ask", response_model=AnswerResponse)
-async def ask_question(request: QuestionRequest):
+async def ask_question(
+    request: QuestionRequest,
+    http_request: Request,
+    tenant_engine: RagEngine = Depends(get_tenant_engine)
+):
     """Ask question with optional conversation context"""
     try:
+        tenant_id = tenant_engine.tenant_id
+        deadline_seconds = request.deadline_ms / 1000.0 if request.deadline_ms else ASK_DEFAULT_DEADLINE
+        deadline = time.monotonic() + deadline_seconds
+        
         # Get or create conversation ID
         conversation_id = request.conversation_id or str(uuid.uuid4())
         
         # Get conversation history
-        conversation_history = conversation_manager.get_conversation(conversation_id)
+        conversation_history = conversation_manager.get_conversation(conversation_id, tenant_id)
         
-        # Search similar documents
-        results = search_similar_documents_api(request.question, request.max_results)
+        filters = request.filters.model_dump(exclude_none=True) if request.filters else None
         
-        if not results:
-            answer = "No relevant documents found for your question."
-            turn_number = conversation_manager.add_turn(conversation_id, request.question, answer, [])
-            
-            return AnswerResponse(
-                answer=answer,
-                conversation_id=conversation_id,
-                question=request.question,
-                sources=[],
-                turn_number=turn_number
+        # Search, hydrate and generate answer via the tenant's engine (off the event loop);
+        # if every waiter goes away the engine stops before its next stage
+        async def compute():
+            cancelled = threading.Event()
+            try:
+                return await run_in_threadpool(
+                    tenant_engine.answer_question,
+                    request.question,
+                    history=conversation_history,
+                    top_k=request.max_results,
+                    search_mode=request.search_mode,
+                    fetch_k=request.fetch_k,
+                    mmr_lambda=request.mmr_lambda,
+                    rerank=request.rerank,
+                    return_parents=request.return_parents,
+                    filters=filters,
+                    should_cancel=cancelled.is_set
+                )
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        # Only the computation takes an admission slot: coalesced callers wait for it
+        # without queueing, so a burst of identical questions is admitted once
+        def lead():
+            return ask_admission.run(compute, priority=request.priority, deadline=deadline)
+        
+        async def respond():
+            if not ASK_COALESCING:
+                return await lead(), False
+            # Only the history the engine actually uses is part of the key, so fresh
+            # conversations asking the same question share one computation
+            recent_history = conversation_history[-rag_engine.CONVERSATION_CONTEXT_WINDOW:]
+            key = request_key(
+                tenant_id=tenant_id,
+                question=normalize_question(request.question),
+                history=[(turn["question"], turn["answer"]) for turn in recent_history],
+                max_results=request.max_results,
+                search_mode=request.search_mode,
+                fetch_k=request.fetch_k,
+                mmr_lambda=request.mmr_lambda,
+                rerank=request.rerank,
+                return_parents=request.return_parents,
+                filters=filters,
+                priority=request.priority,
+                corpus_generation=tenant_engine.corpus_generation()
             )
+            # A leader shed for its own deadline or queue position does not fail the
+            # coalesced callers: one of them retries as the new leader
+            return await ask_flights.do(key, lead, retry_on=(AdmissionRejected,))
         
-        # Prepare context
-        context_parts = []
-        sources = []
-        
-        for result in results:
-            filename = result.metadata.get("filename", "Unknown")
-            text = result.page_content
-            context_parts.append(f"[File: {filename}]\n{text}")
-            sources.append({
-                "filename": filename,
-                "content": text[:200] + "..." if len(text) > 200 else text,
-                "doc_id": result.metadata.get("doc_id", "")
-            })
-        
-        document_context = "\n\n---\n\n".join(context_parts)
-        
-        # Generate answer
-        answer = generate_answer_api(request.question, document_context, conversation_history)
+        # Every caller, leader or coalesced, is timed against its own deadline
+        try:
+            result, coalesced = await await_unless_disconnected(
+                http_request, asyncio.wait_for(respond(), timeout=max(0.0, deadline - time.monotonic()))
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Deadline exceeded before the answer was ready")
         
-        # Save to conversation history
+        # Save to conversation history (every caller records its own turn)
         turn_number = conversation_manager.add_turn(
             conversation_id, 
             request.question, 
-            answer, 
-            [s["filename"] for s in sources]
+            result["answer"], 
+            result["source_files"],
+            tenant_id=tenant_id
         )
         
         return AnswerResponse(
-            answer=answer,
+            answer=result["answer"],
             conversation_id=conversation_id,
             question=request.question,
-            sources=sources,
-            turn_number=turn_number
+            sources=result["sources"],
+            turn_number=turn_number,
+            token_usage=result["token_usage"],
+            corpus_generation=result.get("corpus_generation"),
+            coalesced=coalesced
         )
         
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code, detail=f"Server overloaded: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except RequestCancelled:
+        raise HTTPException(status_code=503, detail="Answer was cancelled", headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Question answering failed: {str(e)}")
 
 @app.get("/conversations")
-async def list_conversations():
-    """List all conversations"""
+async def list_conversations(x_tenant_id: Optional[str] = Header(None, alias=TENANT_HEADER)):
+    """List all conversations of the tenant"""
     try:
+        tenant_id = x_tenant_id or rag_engine.DEFAULT_TENANT
         conversations = []
-        for conv_id in conversation_manager.list_conversations():
-            history = conversation_manager.get_conversation(conv_id)
+        for conv_id in conversation_manager.list_conversations(tenant_id):
+            history = conversation_manager.get_conversation(conv_id, tenant_id)
             conversations.append({
                 "conversation_id": conv_id,
                 "turn_count": len(history),
@@ -559,10 +885,10 @@ async def list_conversations():
         raise HTTPException(status_code=500, detail=f"Failed to list conversations: {str(e)}")
 
 @app.get("/conversations/{conversation_id}")
-async def get_conversation_history(conversation_id: str):
+async def get_conversation_history(conversation_id: str, x_tenant_id: Optional[str] = Header(None, alias=TENANT_HEADER)):
     """Get conversation history by ID"""
     try:
-        history = conversation_manager.get_conversation(conversation_id)
+        history = conversation_manager.get_conversation(conversation_id, x_tenant_id or rag_engine.DEFAULT_TENANT)
         if not history:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
@@ -578,33 +904,37 @@ async def get_conversation_history(conversation_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get conversation: {str(e)}")
 
 @app.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: str):
+async def delete_conversation(conversation_id: str, x_tenant_id: Optional[str] = Header(None, alias=TENANT_HEADER)):
     """Delete a conversation"""
     try:
-        conversation_manager.clear_conversation(conversation_id)
+        conversation_manager.clear_conversation(conversation_id, x_tenant_id or rag_engine.DEFAULT_TENANT)
         return {"message": f"Conversation {conversation_id} deleted successfully"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete conversation: {str(e)}")
 
 @app.get("/stats")
-async def get_stats():
-    """Get system statistics"""
+async def get_stats(tenant_engine: RagEngine = Depends(get_tenant_engine)):
+    """Get system statistics for the tenant"""
     try:
-        # Check if collection is available
-        if collection is None:
-            raise HTTPException(status_code=503, detail="MongoDB not connected. Please check /health endpoint.")
-        
-        total_documents = collection.count_documents({})
-        total_chunks = collection.count_documents({"chunk_id": {"$exists": True}})
-        total_conversations = len(conversation_manager.list_conversations()) if conversation_manager else 0
+        stats = tenant_engine.get_stats()
+        stats["total_conversations"] = (
+            len(conversation_manager.list_conversations(tenant_engine.tenant_id)) if conversation_manager else 0
+        )
+        stats["ask_coalescing"] = {"enabled": ASK_COALESCING, **ask_flights.stats()}
+        stats["ask_admission"] = ask_admission.stats()
+        stats["incomplete_ingest_files"] = [
+            {
+                "filename": entry["filename"],
+                "status": entry["ingest"].get("status"),
+                "error": entry["ingest"].get("error"),
+                "owner": entry["ingest"].get("owner"),
+                "heartbeat_at": entry["ingest"].get("heartbeat_at")
+            }
+            for entry in tenant_engine.list_incomplete_ingests()
+        ]
         
-        return {
-            "total_documents": total_documents,
-            "total_chunks": total_chunks,
-            "total_conversations": total_conversations,
-            "vector_store_status": "available" if os.path.exists("chroma_pdf_db") else "not_built"
-        }
+        return stats
         
     except HTTPException:
         raise
@@ -641,9 +971,17 @@ async def debug_info():
         "database": "available" if db is not None else "not_available", 
         "collection": "available" if collection is not None else "not_available",
         "conversation_manager": "available" if conversation_manager is not None else "not_available",
+        "folder_watcher": {
+            "folders": WATCH_FOLDERS,
+            "running": folder_watcher is not None,
+            "queued": folder_watcher.events.qsize() if folder_watcher is not None else 0,
+            "processed": folder_watcher.processed if folder_watcher is not None else 0
+        },
         "upload_dir_exists": os.path.exists(UPLOAD_DIR),
         "upload_dir_contents": os.listdir(UPLOAD_DIR) if os.path.exists(UPLOAD_DIR) else [],
-        "chromadb_exists": os.path.exists("chroma_pdf_db"),
+        "engine": "available" if engine is not None else "not_available",
+        "chromadb_exists": engine.vectorstore_exists() if engine is not None else False,
+        "chromadb_directory": engine.active_vector_directory() if engine is not None else None,
         "env_vars": {
             "MONGO_URI": "set" if os.getenv("MONGO_URI") else "not_set",
             "OPENAI_API_KEY": "set" if os.getenv("OPENAI_API_KEY") else "not_set"
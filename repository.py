@@ -0,0 +1,129 @@
+"""
+Repository
+Akses baca MongoDB untuk chunk, parent section, dan vector embedding. Setiap query
+wajib menyebut field yang dibutuhkan (projection), sehingga field berat seperti
+embedding atau teks penuh tidak ikut terkirim lewat jaringan tanpa sengaja
+"""
+
+import logging
+from array import array
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+from bson.binary import Binary
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# Field per use case; tambahkan field di sini, bukan dengan find() tanpa projection
+HYDRATE_FIELDS = ("doc_id", "parent_id", "filename", "text", "page", "chunk_id", "section_path")
+INDEX_FIELDS = (
+    "doc_id", "text", "filename", "kategori", "chunk_hash", "page", "chunk_id",
+    "section_path", "ingested_at", "doc_year", "doc_revision"
+)
+PAGE_HASH_FIELDS = ("page", "page_hash")
+FACET_FIELDS = ("doc_year", "doc_revision")
+PARENT_FIELDS = ("parent_id", "filename", "page", "text")
+CATALOG_FIELDS = (
+    "filename", "file_hash", "chunks", "pages", "size_bytes", "ingested_at",
+    "ingest_seconds", "doc_year", "doc_revision", "ingest"
+)
+
+
+def projection(fields: Iterable[str]) -> Dict[str, int]:
+    """Projection MongoDB yang hanya mengambil field tertentu (tanpa _id)"""
+    fields = list(fields)
+    if not fields:
+        raise ValueError("Projection tidak boleh kosong")
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+def encode_embedding(embedding: List[float]) -> Binary:
+    """Embedding sebagai float32 BSON binary (~6 KB untuk 1536 dimensi, bukan ~20 KB array double)"""
+    return Binary(array("f", embedding).tobytes())
+
+
+def decode_embedding(value) -> List[float]:
+    """Kebalikan encode_embedding; format lama (array BSON) tetap didukung"""
+    if isinstance(value, (bytes, bytearray)):
+        return array("f", bytes(value)).tolist()
+    return list(value)
+
+
+class DocumentRepository:
+    """
+    Query baca untuk satu collection dokumen (pdf_docs, pdf_parents atau pdf_files).
+    Semua helper memerlukan daftar field; tidak ada jalur find() tanpa projection.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, query: Dict[str, Any], fields: Iterable[str], session=None) -> Iterator[Dict[str, Any]]:
+        return self.collection.find(query, projection(fields), session=session)
+
+    def find_one(self, query: Dict[str, Any], fields: Iterable[str]) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one(query, projection(fields))
+
+    def exists(self, query: Dict[str, Any]) -> bool:
+        return self.collection.find_one(query, {"_id": 1}) is not None
+
+    def distinct_ids(self, query: Dict[str, Any], field: str = "doc_id", session=None) -> List[str]:
+        return [doc[field] for doc in self.find(query, [field], session=session)]
+
+    def find_by_ids(
+        self, scope: Dict[str, Any], ids: List[str], fields: Iterable[str], field: str = "doc_id"
+    ) -> List[Dict[str, Any]]:
+        """Dokumen untuk id tertentu dengan urutan sama seperti `ids` (urutan ranking)"""
+        fields = list(fields)
+        if field not in fields:
+            fields.append(field)
+        found = {doc[field]: doc for doc in self.find({**scope, field: {"$in": list(ids)}}, fields)}
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def count(self, query: Dict[str, Any]) -> int:
+        return self.collection.count_documents(query)
+
+
+class VectorRepository:
+    """
+    Store embedding content-addressed (chunk_hash, embedding_model) -> embedding.
+    Embedding baru disimpan sebagai float32 binary; dokumen lama berupa array tetap terbaca.
+    """
+
+    def __init__(self, collection, embedding_model: str):
+        self.collection = collection
+        self.embedding_model = embedding_model
+
+    def get_many(self, chunk_hashes: Iterable[str]) -> Dict[str, List[float]]:
+        chunk_hashes = list(chunk_hashes)
+        if not chunk_hashes:
+            return {}
+        return {
+            item["chunk_hash"]: decode_embedding(item["embedding"])
+            for item in self.collection.find(
+                {"chunk_hash": {"$in": chunk_hashes}, "embedding_model": self.embedding_model},
+                projection(("chunk_hash", "embedding"))
+            )
+        }
+
+    def insert_many(self, vectors: Dict[str, List[float]]):
+        """Menyimpan embedding baru; duplicate key dari ingest paralel diabaikan"""
+        if not vectors:
+            return
+        now = datetime.now()
+        entries = [
+            {
+                "chunk_hash": chunk_hash,
+                "embedding_model": self.embedding_model,
+                "embedding": encode_embedding(embedding),
+                "created_at": now
+            }
+            for chunk_hash, embedding in vectors.items()
+        ]
+        try:
+            self.collection.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            # Hash yang sama = embedding yang sama, jadi duplikat aman diabaikan
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
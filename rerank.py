@@ -0,0 +1,182 @@
+"""
+Re-Ranking
+Tahap re-rank opsional setelah retrieval: skor pasangan (query, chunk) dengan
+cross-encoder lokal di CPU, atau scorer leksikal (BM25) sebagai fallback
+"""
+
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from typing import List, Dict, Optional
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+logger = logging.getLogger(__name__)
+
+RERANKER = os.getenv("RERANKER", "none")  # none | lexical | cross-encoder | auto
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # Multilingual, termasuk Indonesia
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "50"))  # Kandidat yang diambil dari vector search
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))  # Jumlah skor pasangan yang disimpan
+
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class Reranker(ABC):
+    """
+    Base class re-ranker. Subclass mengimplementasikan `score_pairs`; skor pasangan
+    disimpan di cache LRU berdasarkan hash (query, teks) jika `cacheable`.
+    """
+
+    name = "base"
+    cacheable = True
+
+    def __init__(self, cache_size: int = RERANK_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _pair_key(query: str, text: str) -> str:
+        return hashlib.sha256(f"{query}\0{text}".encode("utf-8")).hexdigest()
+
+    @abstractmethod
+    def score_pairs(self, query: str, texts: List[str]) -> List[float]:
+        """Skor mentah untuk setiap pasangan (query, teks), tanpa cache"""
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Skor relevansi untuk setiap teks terhadap query (lebih tinggi = lebih relevan)"""
+        if not self.cacheable:
+            return self.score_pairs(query, texts)
+
+        keys = [self._pair_key(query, text) for text in texts]
+        scores = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+            missing = [i for i, score in enumerate(scores) if score is None]
+            self.cache_hits += len(texts) - len(missing)
+            self.cache_misses += len(missing)
+
+        if missing:
+            new_scores = self.score_pairs(query, [texts[i] for i in missing])
+            with self._lock:
+                for i, score in zip(missing, new_scores):
+                    scores[i] = score
+                    self._cache[keys[i]] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def rerank(self, query: str, docs: List[Dict], top_n: int) -> List[Dict]:
+        """Mengurutkan ulang dokumen berdasarkan skor dan mengembalikan top_n teratas"""
+        if not docs:
+            return []
+        scores = self.score(query, [doc.get("text", "") for doc in docs])
+        ranked = sorted(zip(scores, range(len(docs))), key=lambda item: (-item[0], item[1]))
+        return [{**docs[i], "rerank_score": float(score)} for score, i in ranked[:top_n]]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "reranker": self.name,
+                "cache_entries": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses
+            }
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Cross-encoder kecil (sentence-transformers) di CPU; pasangan diproses per batch
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        if CrossEncoder is None:
+            raise ImportError("sentence-transformers belum terpasang: pip install sentence-transformers")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, device="cpu")
+        logger.info(f"✅ Cross-encoder re-ranker dimuat: {model_name}")
+
+    def score_pairs(self, query: str, texts: List[str]) -> List[float]:
+        scores = self.model.predict(
+            [(query, text) for text in texts],
+            batch_size=self.batch_size,
+            show_progress_bar=False
+        )
+        return [float(score) for score in scores]
+
+
+class LexicalReranker(Reranker):
+    """
+    BM25 atas kumpulan kandidat. IDF bergantung pada kandidat lain, jadi skor tidak di-cache.
+    """
+
+    name = "lexical"
+    cacheable = False
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, **kwargs):
+        super().__init__(**kwargs)
+        self.k1 = k1
+        self.b = b
+
+    def score_pairs(self, query: str, texts: List[str]) -> List[float]:
+        docs = [_tokenize(text) for text in texts]
+        query_terms = set(_tokenize(query))
+        if not docs or not query_terms:
+            return [0.0] * len(texts)
+
+        avg_len = sum(len(doc) for doc in docs) / len(docs) or 1.0
+        doc_freq = Counter(term for doc in docs for term in set(doc) if term in query_terms)
+        scores = []
+        for doc in docs:
+            tf = Counter(doc)
+            score = 0.0
+            for term in query_terms:
+                if not tf[term]:
+                    continue
+                idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                norm = tf[term] + self.k1 * (1 - self.b + self.b * len(doc) / avg_len)
+                score += idf * tf[term] * (self.k1 + 1) / norm
+            scores.append(score)
+        return scores
+
+
+def create_reranker(kind: str = RERANKER) -> Optional[Reranker]:
+    """
+    Membuat re-ranker sesuai konfigurasi: "none", "lexical", "cross-encoder", atau
+    "auto" (cross-encoder jika sentence-transformers tersedia, selain itu lexical)
+    """
+    kind = (kind or "none").lower()
+    if kind == "none":
+        return None
+    if kind == "lexical":
+        return LexicalReranker()
+    if kind in ("cross-encoder", "auto"):
+        try:
+            return CrossEncoderReranker()
+        except Exception as e:
+            if kind == "cross-encoder":
+                raise
+            logger.warning(f"⚠️ Cross-encoder tidak tersedia ({e}), memakai lexical re-ranker")
+            return LexicalReranker()
+    raise ValueError(f"RERANKER tidak dikenal: {kind}")
@@ -0,0 +1,143 @@
+"""
+Retrieval Post-Processing
+Tahap setelah vector search: buang chunk yang hampir identik dan gabungkan chunk
+bertetangga dari file/halaman yang sama supaya overlap tidak terkirim dua kali
+"""
+
+import os
+import re
+import logging
+from typing import Callable, Iterable, List, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))  # Jaccard shingle, 0 = nonaktif
+SHINGLE_SIZE = 3  # Jumlah kata per shingle
+
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard_similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def drop_near_duplicates(docs: List[Dict], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Dict]:
+    """
+    Membuang chunk yang kemiripan Jaccard word-shingle-nya dengan chunk berperingkat
+    lebih tinggi >= threshold (misalnya pasal boilerplate yang sama di dua revisi).
+    Urutan ranking dipertahankan.
+    """
+    if threshold <= 0:
+        return list(docs)
+
+    kept = []
+    kept_shingles = []
+    for doc in docs:
+        shingles = _shingles(doc.get("text", ""))
+        if any(jaccard_similarity(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+
+    if len(kept) < len(docs):
+        logger.info(f"🧹 {len(docs) - len(kept)} chunk hampir duplikat dibuang dari hasil retrieval")
+    return kept
+
+
+def find_overlap(left: str, right: str, max_overlap: int) -> int:
+    """
+    Panjang suffix terpanjang dari `left` yang sama dengan prefix dari `right`
+    (overlap hasil RecursiveCharacterTextSplitter), dibatasi max_overlap karakter
+    """
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_adjacent_chunks(docs: List[Dict], max_overlap: int) -> List[Dict]:
+    """
+    Menggabungkan chunk dengan chunk_id berurutan dari file dan halaman yang sama
+    menjadi satu span kontinu; teks overlap hanya disertakan sekali. Span ditempatkan
+    pada peringkat terbaik anggotanya dan menyimpan semua doc_id di `doc_ids`.
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        groups.setdefault((doc.get("filename"), doc.get("page", 0)), []).append((rank, doc))
+
+    spans = []
+    for members in groups.values():
+        members.sort(key=lambda item: item[1].get("chunk_id", 0))
+        current = None
+        for rank, doc in members:
+            if current is not None and doc.get("chunk_id", 0) == current["chunk_ids"][-1] + 1:
+                overlap = find_overlap(current["text"], doc.get("text", ""), max_overlap)
+                joiner = "" if overlap else "\n"
+                current["text"] = current["text"] + joiner + doc.get("text", "")[overlap:]
+                current["chunk_ids"].append(doc.get("chunk_id", 0))
+                current["doc_ids"].append(doc.get("doc_id", ""))
+                current["rank"] = min(current["rank"], rank)
+                continue
+            current = {
+                **doc,
+                "chunk_ids": [doc.get("chunk_id", 0)],
+                "doc_ids": [doc.get("doc_id", "")],
+                "rank": rank
+            }
+            spans.append(current)
+
+    spans.sort(key=lambda span: span["rank"])
+    for span in spans:
+        del span["rank"]
+
+    if len(spans) < len(docs):
+        logger.info(f"🔗 {len(docs)} chunk digabung menjadi {len(spans)} span kontinu")
+    return spans
+
+
+def expand_to_parents(
+    children: List[Dict], top_k: int, fetch_parents: Callable[[Iterable[str]], Dict[str, Dict]]
+) -> List[Dict]:
+    """
+    Small-to-big: memetakan child chunk (urut ranking) ke parent section-nya,
+    deduplikasi, lalu mengembalikan maksimal top_k parent. fetch_parents menerima
+    parent_id dan mengembalikan mapping parent_id -> parent. Child tanpa parent
+    (data lama atau di-ingest tanpa parent-child) dipakai apa adanya.
+    """
+    order = []
+    matched = {}
+    for child in children:
+        key = child.get("parent_id") or child["doc_id"]
+        if key not in matched:
+            order.append((key, child))
+            matched[key] = []
+        matched[key].append(child.get("chunk_id", 0))
+    order = order[:top_k]
+
+    parents = fetch_parents([key for key, child in order if child.get("parent_id")])
+
+    results = []
+    for key, child in order:
+        parent = parents.get(key)
+        if parent is None:
+            results.append(child)
+            continue
+        results.append({
+            "doc_id": key,
+            "filename": parent["filename"],
+            "page": parent["page"],
+            "text": parent["text"],
+            # Hierarchy path (structure chunking) dari child berperingkat terbaik
+            "section_path": child.get("section_path", ""),
+            "chunk_id": matched[key][0],
+            "chunk_ids": sorted(matched[key])
+        })
+    return results
@@ -0,0 +1,104 @@
+"""
+Single-Flight
+Menggabungkan request identik yang sedang berjalan bersamaan menjadi satu komputasi
+upstream (embedding, search, LLM); semua pemanggil menerima hasil yang sama
+"""
+
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Bentuk kanonik pertanyaan untuk key coalescing: NFKC, huruf kecil, whitespace
+    diseragamkan, tanda baca di akhir dibuang ("Kapan UTS?" == "kapan uts")
+    """
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+def request_key(**parts: Any) -> str:
+    """Hash stabil dari komponen key (urutan argumen tidak berpengaruh)"""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Request dengan key sama yang datang saat komputasi untuk key tersebut masih berjalan
+    menunggu hasil komputasi itu alih-alih memulai komputasi baru. Hasil tidak di-cache:
+    setelah komputasi selesai, request berikutnya memulai komputasi baru.
+
+    Komputasi berjalan sebagai task terpisah, sehingga pemanggil yang dibatalkan (misalnya
+    client disconnect) tidak membatalkan pemanggil lain; task baru dibatalkan jika semua
+    pemanggilnya sudah pergi.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Any]], retry_on: Tuple[Type[BaseException], ...] = ()
+    ) -> Tuple[Any, bool]:
+        """
+        Menjalankan fn() sekali per key yang sedang berjalan. Mengembalikan (hasil, shared)
+        dengan shared=True jika hasil berasal dari komputasi pemanggil lain.
+        retry_on: error yang hanya berlaku untuk leader (misalnya ditolak admission karena
+        deadline-nya sendiri). Error ini tidak diteruskan ke pemanggil lain; mereka mengulang
+        dan yang pertama menjadi leader baru dengan fn() miliknya sendiri.
+        """
+        while True:
+            flight = self._flights.get(key)
+            shared = flight is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                self.leaders += 1
+                flight = _Flight(asyncio.ensure_future(fn()))
+                self._flights[key] = flight
+                flight.task.add_done_callback(lambda _task, flight=flight: self._forget(key, flight))
+
+            flight.waiters += 1
+            try:
+                return await asyncio.shield(flight.task), shared
+            except retry_on:
+                if not shared:
+                    raise
+                logger.info("🔁 Leader single-flight gagal karena batasnya sendiri, pemanggil lain mengulang")
+            except asyncio.CancelledError:
+                if flight.waiters == 1 and not flight.task.done():
+                    flight.task.cancel()
+                    logger.info("🛑 Semua pemanggil pergi, komputasi single-flight dibatalkan")
+                raise
+            finally:
+                flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight):
+        # Pemanggil yang mengulang bisa sudah memulai flight baru untuk key yang sama
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,236 @@
+"""
+Structure-Aware Chunker
+Chunking berbasis struktur dokumen peraturan (BAB, Bagian, Paragraf, Pasal, ayat)
+memakai informasi block dan font dari PyMuPDF, dengan hierarchy path sebagai metadata
+"""
+
+import os
+import re
+import logging
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "recursive")  # recursive | structure
+CHUNKING_STRATEGIES = ("recursive", "structure")
+
+BOLD_FLAG = 16  # Bit flag span bold di PyMuPDF
+HEADING_SIZE_RATIO = 1.05  # Font >= 105% ukuran body dianggap lebih besar
+MAX_TITLE_LENGTH = 120  # Baris judul setelah heading (misalnya "KETENTUAN UMUM")
+PATH_SEPARATOR = " > "
+
+# Level hierarki dari atas ke bawah; heading harus berdiri sendiri dalam satu baris
+# supaya rujukan seperti "Pasal 5 ayat (2) menyatakan ..." tidak dianggap heading
+HEADING_PATTERNS = [
+    ("bab", re.compile(r"^BAB\s+([IVXLCDM]+|\d+)$", re.IGNORECASE)),
+    ("bagian", re.compile(r"^Bagian\s+(Ke\w+|\d+)$", re.IGNORECASE)),
+    ("paragraf", re.compile(r"^Paragraf\s+\d+$", re.IGNORECASE)),
+    ("pasal", re.compile(r"^Pasal\s+\d+[A-Z]?$", re.IGNORECASE)),
+]
+HEADING_LEVELS = [level for level, _ in HEADING_PATTERNS]
+TITLED_LEVELS = ("bab", "bagian", "paragraf")  # Level yang biasanya diikuti baris judul
+AYAT_PATTERN = re.compile(r"^\(\d+[a-z]?\)\s*\S")
+
+
+class LayoutLine(NamedTuple):
+    """Satu baris teks PDF beserta informasi layout-nya"""
+    text: str
+    size: float
+    bold: bool
+    block: int
+    first_in_block: bool
+
+
+def extract_layout_lines(page) -> List[LayoutLine]:
+    """
+    Mengambil baris teks dari satu halaman PyMuPDF (`page.get_text("dict")`) dengan
+    ukuran font, status bold, dan nomor block
+    """
+    lines = []
+    for block_no, block in enumerate(page.get_text("dict")["blocks"]):
+        if block.get("type") != 0:
+            continue  # Block gambar
+        first = True
+        for line in block["lines"]:
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            text = " ".join("".join(span["text"] for span in line["spans"]).split())
+            lines.append(LayoutLine(
+                text=text,
+                size=max(span["size"] for span in spans),
+                bold=all(span["flags"] & BOLD_FLAG or "bold" in span["font"].lower() for span in spans),
+                block=block_no,
+                first_in_block=first
+            ))
+            first = False
+    return lines
+
+
+def layout_text(lines: List[LayoutLine]) -> str:
+    """Teks halaman dari baris layout (baris kosong di antara block)"""
+    parts = []
+    previous_block = None
+    for line in lines:
+        if previous_block is not None and line.block != previous_block:
+            parts.append("")
+        parts.append(line.text)
+        previous_block = line.block
+    return "\n".join(parts)
+
+
+def _body_font_size(pages: List[List[LayoutLine]]) -> float:
+    """Ukuran font yang paling banyak dipakai (berdasarkan jumlah karakter)"""
+    weights = {}
+    for lines in pages:
+        for line in lines:
+            size = round(line.size, 1)
+            weights[size] = weights.get(size, 0) + len(line.text)
+    return max(weights, key=weights.get) if weights else 0.0
+
+
+def format_path(path: Dict[str, str]) -> str:
+    """Hierarchy path, misalnya "BAB II KETENTUAN AKADEMIK > Bagian Kesatu > Pasal 5" """
+    return PATH_SEPARATOR.join(path[level] for level in HEADING_LEVELS if path.get(level))
+
+
+class StructureChunker:
+    """
+    Memecah dokumen pada batas struktural, bukan karakter:
+    - heading BAB/Bagian/Paragraf/Pasal dikenali dari pola teks yang berdiri sendiri,
+      dikonfirmasi oleh layout (bold, font lebih besar, atau baris pertama block)
+    - satu Pasal menjadi satu chunk jika muat dalam chunk_size; jika tidak, dipecah
+      per ayat / block, dan hanya unit yang masih terlalu besar yang dipotong per karakter
+    - hierarchy path dibawa lintas halaman, sehingga Pasal yang berlanjut ke halaman
+      berikutnya tetap memiliki path yang benar
+
+    Chunk tetap dibuat per halaman supaya re-ingest per halaman dan doc_id tetap stabil.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._fallback_splitter = None
+
+    @property
+    def fallback_splitter(self):
+        """Splitter karakter untuk unit yang lebih panjang dari chunk_size (dibuat saat pertama dipakai)"""
+        if self._fallback_splitter is None:
+            # langchain hanya dibutuhkan di sini; parsing struktur tidak bergantung padanya
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._fallback_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+            )
+        return self._fallback_splitter
+
+    def _heading_level(self, line: LayoutLine, body_size: float) -> Optional[str]:
+        for level, pattern in HEADING_PATTERNS:
+            if pattern.match(line.text):
+                emphasized = line.bold or (body_size and line.size >= body_size * HEADING_SIZE_RATIO)
+                return level if emphasized or line.first_in_block else None
+        return None
+
+    @staticmethod
+    def _is_title(line: LayoutLine, heading: LayoutLine) -> bool:
+        if line.block != heading.block and not line.bold:
+            return False
+        if len(line.text) > MAX_TITLE_LENGTH or AYAT_PATTERN.match(line.text):
+            return False
+        return line.bold or line.text.isupper()
+
+    def parse_pages(self, pages: List[List[LayoutLine]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Mengelompokkan baris menjadi section per halaman. Mengembalikan list
+        (path di awal halaman, sections) dengan section berisi {path, units}; unit
+        adalah potongan teks yang tidak boleh dipecah (block atau ayat).
+        """
+        body_size = _body_font_size(pages)
+        path: Dict[str, str] = {}
+        parsed = []
+
+        for lines in pages:
+            page_path = format_path(path)
+            sections = []
+            current = {"path": dict(path), "units": []}
+            unit: List[str] = []
+            heading_only = False  # Unit saat ini baru berisi heading; isi pertama ikut menempel
+            previous_block = None
+            i = 0
+
+            while i < len(lines):
+                line = lines[i]
+                level = self._heading_level(line, body_size)
+
+                if level is not None:
+                    # Heading berturut-turut (BAB lalu Pasal) digabung ke unit berikutnya
+                    carried = unit if heading_only else []
+                    if unit and not heading_only:
+                        current["units"].append("\n".join(unit))
+                    if current["units"]:
+                        sections.append(current)
+                    heading = [line.text]
+                    if level in TITLED_LEVELS and i + 1 < len(lines) and self._is_title(lines[i + 1], line) \
+                            and self._heading_level(lines[i + 1], body_size) is None:
+                        i += 1
+                        heading.append(lines[i].text)
+                    unit = carried + heading
+                    depth = HEADING_LEVELS.index(level)
+                    path = {key: value for key, value in path.items() if HEADING_LEVELS.index(key) < depth}
+                    path[level] = " ".join(heading)
+                    current = {"path": dict(path), "units": []}
+                    heading_only = True
+                    previous_block = lines[i].block
+                    i += 1
+                    continue
+
+                # Unit baru dimulai di block baru atau di awal ayat
+                if unit and not heading_only and (line.block != previous_block or AYAT_PATTERN.match(line.text)):
+                    current["units"].append("\n".join(unit))
+                    unit = []
+                unit.append(line.text)
+                heading_only = False
+                previous_block = line.block
+                i += 1
+
+            if unit:
+                current["units"].append("\n".join(unit))
+            if current["units"]:
+                sections.append(current)
+            parsed.append((page_path, sections))
+
+        return parsed
+
+    def _pack_units(self, units: List[str]) -> List[str]:
+        """Menggabungkan unit berurutan selama muat dalam chunk_size"""
+        chunks = []
+        current = ""
+        for unit in units:
+            pieces = [unit] if len(unit) <= self.chunk_size else self.fallback_splitter.split_text(unit)
+            for piece in pieces:
+                if current and len(current) + 1 + len(piece) > self.chunk_size:
+                    chunks.append(current)
+                    current = ""
+                current = f"{current}\n{piece}" if current else piece
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def chunk_pages(self, pages: List[List[LayoutLine]]) -> Tuple[List[str], Dict[int, List[Dict[str, Any]]]]:
+        """
+        Chunk seluruh dokumen. Mengembalikan (path di awal setiap halaman,
+        {nomor halaman: [chunk]}) dengan chunk berisi text, section_path dan section.
+        """
+        page_paths = []
+        chunks_by_page = {}
+        for page_num, (page_path, sections) in enumerate(self.parse_pages(pages), 1):
+            page_paths.append(page_path)
+            chunks = []
+            for section in sections:
+                section_path = format_path(section["path"])
+                leaf = next((section["path"][level] for level in reversed(HEADING_LEVELS) if section["path"].get(level)), "")
+                for text in self._pack_units(section["units"]):
+                    chunks.append({"text": text, "section_path": section_path, "section": leaf})
+            chunks_by_page[page_num] = chunks
+        return page_paths, chunks_by_page
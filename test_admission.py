@@ -0,0 +1,173 @@
+"""
+Unit test untuk admission.AdmissionController (antrian /ask, prioritas, load shedding, deadline)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def _controller(**kwargs):
+    controller = AdmissionController(**{"max_concurrent": 1, "max_queue": 4, "target_delay": 5.0, **kwargs})
+    controller.service_time = 0.01  # Estimasi waktu tunggu kecil agar hanya aturan yang diuji yang berlaku
+    return controller
+
+
+async def _hold(controller, release: asyncio.Event, priority="interactive", deadline=None):
+    async def work():
+        await release.wait()
+        return priority
+
+    return await controller.run(work, priority=priority, deadline=deadline)
+
+
+def _rejection(coroutine) -> AdmissionRejected:
+    with pytest.raises(AdmissionRejected) as info:
+        asyncio.run(coroutine)
+    return info.value
+
+
+def test_idle_controller_admits_immediately():
+    async def scenario():
+        controller = _controller()
+        result = await controller.run(lambda: asyncio.sleep(0, result="ok"))
+        return result, controller.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "ok"
+    assert stats["admitted"] == 1 and stats["in_flight"] == 0 and stats["queued"] == 0
+
+
+def test_interactive_waiters_go_before_batch():
+    async def scenario():
+        controller = _controller()
+        release = asyncio.Event()
+        order = []
+
+        async def record(priority):
+            await controller.run(lambda: asyncio.sleep(0, result=order.append(priority)), priority=priority)
+
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(record(p)) for p in ("batch", "interactive", "batch", "interactive")]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(busy, *waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "interactive", "batch", "batch"]
+
+
+def test_full_queue_is_rejected_with_503_and_retry_after():
+    async def scenario():
+        controller = _controller(max_queue=1)
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        try:
+            await _hold(controller, release)
+        finally:
+            release.set()
+            await asyncio.gather(busy, queued)
+
+    rejected = _rejection(scenario())
+    assert rejected.status_code == 503
+    assert rejected.retry_after >= 1
+
+
+def test_batch_is_limited_to_its_share_of_the_queue():
+    async def scenario():
+        controller = _controller(max_queue=2)
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(_hold(controller, release, priority="batch"))
+        await asyncio.sleep(0)
+        try:
+            await _hold(controller, release, priority="batch")
+        finally:
+            release.set()
+            await asyncio.gather(busy, queued)
+
+    assert _rejection(scenario()).status_code == 429
+
+
+@pytest.mark.parametrize("priority, status_code", [("batch", 429), ("interactive", 503)])
+def test_queue_delay_over_target_sheds_new_requests(priority, status_code):
+    async def scenario():
+        controller = _controller(target_delay=0.02)
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.05)
+        try:
+            await _hold(controller, release, priority=priority)
+        finally:
+            release.set()
+            await asyncio.gather(busy, queued)
+
+    rejected = _rejection(scenario())
+    assert rejected.status_code == status_code
+    assert rejected.reason == "queue delay exceeds target"
+
+
+def test_deadline_that_cannot_be_met_is_rejected_up_front():
+    async def scenario():
+        controller = _controller()
+        controller.service_time = 10.0
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        try:
+            await _hold(controller, release, deadline=time.monotonic() + 1.0)
+        finally:
+            release.set()
+            await busy
+
+    rejected = _rejection(scenario())
+    assert rejected.status_code == 503
+    assert "deadline" in rejected.reason
+
+
+def test_waiter_expires_at_its_deadline_without_leaking_a_slot():
+    async def scenario():
+        controller = _controller()
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as info:
+            await _hold(controller, release, deadline=time.monotonic() + 0.05)
+        release.set()
+        await busy
+        after = await controller.run(lambda: asyncio.sleep(0, result="ok"))
+        return info.value, after, controller.stats()
+
+    rejected, after, stats = asyncio.run(scenario())
+    assert rejected.status_code == 503 and rejected.reason == "deadline exceeded while queued"
+    assert after == "ok"
+    assert stats["expired"] == 1 and stats["in_flight"] == 0 and stats["queued"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = _controller()
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        await busy
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["cancelled"] == 1 and stats["queued"] == 0 and stats["in_flight"] == 0
@@ -0,0 +1,57 @@
+"""
+Unit test untuk context_builder.ContextBuilder (pembagian budget token dokumen dan history)
+"""
+
+from context_builder import ContextBuilder, format_conversation_context
+
+
+def _doc(i, words=200):
+    return {"filename": f"doc{i}.pdf", "doc_id": f"doc{i}", "text": " ".join(f"kata{i}" for _ in range(words))}
+
+
+def _history(turns):
+    return [{"question": f"Pertanyaan {i}?", "answer": f"Jawaban nomor {i}."} for i in range(turns)]
+
+
+def test_everything_fits_in_a_large_budget():
+    builder = ContextBuilder(budget=100000)
+    context = builder.build([_doc(1, 20), _doc(2, 20)], _history(2), reserved_tokens=50)
+
+    usage = context["usage"]
+    assert [doc["doc_id"] for doc in context["documents"]] == ["doc1", "doc2"]
+    assert usage["documents_dropped"] == 0 and usage["history_turns_dropped"] == 0
+    assert usage["estimated_prompt_tokens"] == 50 + usage["document_tokens"] + usage["history_tokens"]
+
+
+def test_documents_are_cut_in_rank_order_within_the_budget():
+    builder = ContextBuilder(budget=1000, history_min_tokens=0)
+    documents = [_doc(i) for i in range(1, 6)]
+    context = builder.build(documents, reserved_tokens=100)
+
+    usage = context["usage"]
+    assert usage["document_tokens"] <= 1000 - 100
+    assert usage["documents_dropped"] > 0
+    included = [doc["doc_id"] for doc in context["documents"]]
+    assert included == [doc["doc_id"] for doc in documents[:len(included)]]
+
+
+def test_last_document_is_truncated_instead_of_dropped():
+    builder = ContextBuilder(budget=600, history_min_tokens=0)
+    context = builder.build([_doc(1, 100), _doc(2, 2000)])
+
+    assert context["usage"]["documents_truncated"] == 1
+    assert context["documents"][-1]["truncated"] is True
+    assert context["usage"]["document_tokens"] <= 600
+
+
+def test_history_keeps_its_minimum_and_drops_oldest_turns_first():
+    history = _history(20)
+    builder = ContextBuilder(budget=800, history_min_tokens=60)
+    context = builder.build([_doc(i) for i in range(1, 10)], history)
+
+    usage = context["usage"]
+    assert usage["history_turns_included"] > 0
+    assert usage["history_turns_dropped"] > 0
+    kept = history[-usage["history_turns_included"]:]
+    assert context["conversation_context"] == format_conversation_context(kept, len(kept))
+    assert usage["document_tokens"] + usage["history_tokens"] <= 800
@@ -0,0 +1,106 @@
+"""
+Unit test untuk corpus_generation.CorpusGeneration (generation per tenant, listener, watcher polling)
+"""
+
+import threading
+
+import pytest
+
+from corpus_generation import CorpusGeneration
+
+
+class FakeStateCollection:
+    """Collection pdf_corpus_state di memori: {tenant_id: generation}"""
+
+    def __init__(self, **generations):
+        self.generations = dict(generations)
+        self.reads = 0
+
+    def find_one(self, query, projection=None):
+        self.reads += 1
+        tenant_id = query["tenant_id"]
+        if tenant_id not in self.generations:
+            return None
+        return {"generation": self.generations[tenant_id]}
+
+    def find(self, query, projection=None):
+        self.reads += 1
+        return [{"tenant_id": tenant_id, "generation": generation} for tenant_id, generation in self.generations.items()]
+
+    def find_one_and_update(self, query, update, **kwargs):
+        tenant_id = query["tenant_id"]
+        self.generations[tenant_id] = self.generations.get(tenant_id, 0) + update["$inc"]["generation"]
+        return {"generation": self.generations[tenant_id]}
+
+
+def test_current_reads_mongodb_without_a_watcher():
+    collection = FakeStateCollection(default=3)
+    corpus = CorpusGeneration(collection)
+
+    assert corpus.current("default") == 3
+    assert corpus.current("kampus-b") == 0
+    collection.generations["default"] = 4
+    assert corpus.current("default") == 4
+    assert collection.reads == 3
+
+
+def test_listeners_only_hear_increases():
+    corpus = CorpusGeneration(FakeStateCollection())
+    heard = []
+
+    def failing(tenant_id, generation):
+        raise RuntimeError("listener rusak")
+
+    corpus.subscribe(failing)
+    corpus.subscribe(lambda tenant_id, generation: heard.append((tenant_id, generation)))
+
+    corpus.observe("default", 5)  # Nilai pertama hanya dicatat
+    corpus.observe("default", 4)  # Polling terlambat: generation tidak pernah turun
+    corpus.observe("default", 5)
+    corpus.observe("default", 7)
+
+    assert heard == [("default", 7)]
+    assert corpus.stats()["generations"] == {"default": 7}
+
+
+def test_watcher_serves_current_from_the_local_value():
+    collection = FakeStateCollection(default=1)
+    corpus = CorpusGeneration(collection, poll_interval=60, change_stream="false")
+
+    corpus.start()
+    try:
+        reads = collection.reads
+        assert corpus.current("default") == 1
+        assert collection.reads == reads
+    finally:
+        corpus.stop()
+
+
+def test_polling_watcher_follows_other_workers():
+    collection = FakeStateCollection(default=1)
+    corpus = CorpusGeneration(collection, poll_interval=0.01, change_stream="false")
+    changed = threading.Event()
+    corpus.subscribe(lambda tenant_id, generation: changed.set())
+
+    corpus.start()
+    try:
+        collection.generations["default"] = 2  # bump dari worker lain
+        assert changed.wait(timeout=1)
+        assert corpus.current("default") == 2
+        assert corpus.stats()["mode"] == "polling"
+    finally:
+        corpus.stop()
+    assert corpus.stats()["mode"] is None
+
+
+def test_bump_increments_and_notifies_locally():
+    pytest.importorskip("pymongo")  # ReturnDocument dari pymongo
+    collection = FakeStateCollection()
+    corpus = CorpusGeneration(collection)
+    heard = []
+    corpus.subscribe(lambda tenant_id, generation: heard.append(generation))
+
+    assert corpus.bump("default", "ingest:a.pdf") == 1
+    assert corpus.bump("default", "delete:a.pdf") == 2
+    assert heard == [2]
+    assert corpus.current("default") == 2
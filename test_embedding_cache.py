@@ -0,0 +1,60 @@
+"""
+Unit test untuk embedding_cache.EmbeddingCache (SQLite, key (model, hash teks), eviction LRU)
+"""
+
+import pytest
+
+from embedding_cache import EmbeddingCache, EVICTION_TARGET_RATIO
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_mb=1)
+    yield cache
+    cache.close()
+
+
+def test_round_trip_is_keyed_by_model_and_text(cache):
+    cache.put_many("model-a", ["satu", "dua"], [[0.5, 1.0], [0.25, -1.0]])
+
+    assert cache.get_many("model-a", ["dua", "tiga", "satu"]) == [[0.25, -1.0], None, [0.5, 1.0]]
+    assert cache.get("model-b", "satu") is None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 2 and stats["misses"] == 2 and stats["hit_rate"] == 0.5
+
+
+def test_empty_embeddings_are_not_stored(cache):
+    cache.put_many("model-a", ["gagal", "ok"], [[], [1.0]])
+    assert cache.get("model-a", "gagal") is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = EmbeddingCache(path=path)
+    first.put("model-a", "teks", [1.0, 2.0])
+    first.close()
+
+    reopened = EmbeddingCache(path=path)
+    assert reopened.get("model-a", "teks") == [1.0, 2.0]
+    assert reopened.stats()["entries"] == 1
+    reopened.close()
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    vector = [0.0] * 256  # 1 KB float32
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_mb=4 / 1024)
+    cache.put("model-a", "lama", vector)
+    cache.put("model-a", "dipakai", vector)
+    cache.put("model-a", "baru", vector)
+    cache.get("model-a", "lama")  # Akses ulang: "dipakai" sekarang yang paling lama tidak diakses
+    cache.put("model-a", "pemicu", vector)
+    cache.put("model-a", "pemicu-2", vector)
+
+    assert cache.get("model-a", "dipakai") is None
+    assert cache.get("model-a", "lama") == vector
+    stats = cache.stats()
+    assert stats["evictions"] >= 1
+    assert stats["size_mb"] <= stats["max_size_mb"] * EVICTION_TARGET_RATIO + 0.001
+    cache.close()
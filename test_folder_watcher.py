@@ -0,0 +1,102 @@
+"""
+Unit test untuk folder_watcher.FolderWatcher (polling stat, debounce, event upsert/delete)
+"""
+
+import os
+import time
+
+from folder_watcher import EVENT_DELETE, EVENT_UPSERT, FolderWatcher
+
+DEBOUNCE = 0.05
+
+
+class RecordingEngine:
+    def __init__(self):
+        self.calls = []
+
+    def ingest_pdf_file(self, path):
+        self.calls.append(("ingest", path))
+        return {"status": "processed", "chunks": 1}
+
+    def delete_file(self, filename):
+        self.calls.append(("delete", filename))
+        return 1
+
+
+def _watcher(*folders, engine=None):
+    watcher = FolderWatcher(engine, [str(folder) for folder in folders], debounce=DEBOUNCE, initial_sync=False)
+    watcher._snapshot = watcher._scan()
+    return watcher
+
+
+def _drain(watcher):
+    events = []
+    while not watcher.events.empty():
+        events.append(watcher.events.get_nowait())
+    return events
+
+
+def _settle(watcher):
+    time.sleep(DEBOUNCE * 1.5)
+    watcher.poll()
+    return _drain(watcher)
+
+
+def test_new_file_is_queued_only_after_it_is_stable(tmp_path):
+    watcher = _watcher(tmp_path)
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1")
+    (tmp_path / "catatan.txt").write_text("bukan pdf")
+    (tmp_path / ".x_b.pdf.part").write_bytes(b"upload belum selesai")
+
+    watcher.poll()
+    assert _drain(watcher) == []
+    assert _settle(watcher) == [(EVENT_UPSERT, str(pdf))]
+
+    watcher.poll()  # Tidak berubah lagi: tidak ada event ulang
+    assert _drain(watcher) == []
+
+
+def test_file_still_being_written_restarts_the_debounce(tmp_path):
+    watcher = _watcher(tmp_path)
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1")
+    watcher.poll()
+    time.sleep(DEBOUNCE * 1.5)
+    pdf.write_bytes(b"%PDF-1 masih ditulis")
+
+    watcher.poll()
+    assert _drain(watcher) == []
+    assert _settle(watcher) == [(EVENT_UPSERT, str(pdf))]
+
+
+def test_deleted_file_is_queued_and_short_lived_file_is_ignored(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1")
+    watcher = _watcher(tmp_path)
+
+    pdf.unlink()
+    temp = tmp_path / "sementara.pdf"
+    temp.write_bytes(b"%PDF-1")
+    watcher.poll()
+    temp.unlink()
+
+    assert _settle(watcher) == [(EVENT_DELETE, str(pdf))]
+
+
+def test_delete_is_skipped_while_another_folder_has_the_same_name(tmp_path):
+    first, second = tmp_path / "uploads", tmp_path / "pdf_documents"
+    first.mkdir()
+    second.mkdir()
+    (second / "a.pdf").write_bytes(b"%PDF-1")
+    engine = RecordingEngine()
+    watcher = _watcher(first, second, engine=engine)
+
+    watcher.handle(EVENT_DELETE, os.path.join(str(first), "a.pdf"))
+    assert engine.calls == []
+
+    (second / "a.pdf").unlink()
+    watcher.handle(EVENT_DELETE, os.path.join(str(first), "a.pdf"))
+    watcher.handle(EVENT_UPSERT, os.path.join(str(first), "b.pdf"))
+    assert engine.calls == [("delete", "a.pdf"), ("ingest", os.path.join(str(first), "b.pdf"))]
+    assert watcher.processed == 2
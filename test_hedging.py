@@ -0,0 +1,79 @@
+"""
+Unit test untuk hedging.Hedger (duplikat setelah delay persentil, dibatasi budget)
+"""
+
+import threading
+import time
+
+import pytest
+
+from hedging import HEDGE_BURST, Hedger
+
+
+def _hedger(**kwargs):
+    return Hedger(**{"enabled": True, "call_sites": ("chat",), "default_delay": 0.05, "max_workers": 8, **kwargs})
+
+
+def test_disabled_or_unlisted_call_site_runs_directly():
+    caller = threading.current_thread()
+    seen = []
+
+    def fn():
+        seen.append(threading.current_thread())
+        return "ok"
+
+    assert Hedger(enabled=False).call("chat", fn) == "ok"
+    assert _hedger().call("embedding", fn) == "ok"
+    assert seen == [caller, caller]
+
+
+def test_fast_call_is_not_hedged():
+    hedger = _hedger()
+    assert hedger.call("chat", lambda: "ok") == "ok"
+    assert hedger.stats()["call_sites"]["chat"]["hedged"] == 0
+
+
+def test_slow_primary_loses_to_the_hedge():
+    hedger = _hedger()
+    attempts = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            attempts.append(len(attempts))
+            attempt = attempts[-1]
+        time.sleep(0.5 if attempt == 0 else 0.01)
+        return attempt
+
+    started = time.monotonic()
+    assert hedger.call("chat", fn) == 1
+    assert time.monotonic() - started < 0.4
+    chat = hedger.stats()["call_sites"]["chat"]
+    assert chat["hedged"] == 1 and chat["hedge_wins"] == 1
+
+
+def test_hedges_are_capped_by_the_budget():
+    hedger = _hedger(budget=0.0)
+
+    def slow():
+        time.sleep(0.1)
+        return "ok"
+
+    for _ in range(HEDGE_BURST + 3):
+        assert hedger.call("chat", slow) == "ok"
+
+    chat = hedger.stats()["call_sites"]["chat"]
+    assert chat["calls"] == HEDGE_BURST + 3
+    assert chat["hedged"] == HEDGE_BURST
+
+
+def test_error_from_both_attempts_is_raised():
+    hedger = _hedger()
+
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("upstream gagal")
+
+    with pytest.raises(RuntimeError, match="upstream gagal"):
+        hedger.call("chat", failing)
+    assert hedger.stats()["call_sites"]["chat"]["hedged"] == 1
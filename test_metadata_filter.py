@@ -0,0 +1,44 @@
+"""
+Unit test untuk metadata_filter (facet dokumen dan facet filter -> where ChromaDB)
+"""
+
+from datetime import datetime
+
+import pytest
+
+from metadata_filter import build_metadata_filter, extract_document_facets
+
+
+def test_empty_filters_mean_no_where_clause():
+    assert build_metadata_filter(None) is None
+    assert build_metadata_filter({"filename": None, "kategori": []}) is None
+
+
+def test_single_facet_is_not_wrapped_in_and():
+    assert build_metadata_filter({"doc_year": 2023}) == {"doc_year": 2023}
+
+
+def test_list_values_and_ranges_are_combined():
+    where = build_metadata_filter({"doc_revision": [1, 2], "page_from": 1, "page_to": 20})
+    assert where == {"$and": [
+        {"doc_revision": {"$in": [1, 2]}},
+        {"page": {"$gte": 1}},
+        {"page": {"$lte": 20}},
+    ]}
+
+
+def test_ingested_dates_become_epoch_seconds():
+    after = datetime(2024, 1, 1)
+    assert build_metadata_filter({"ingested_after": after}) == {"ingested_at": {"$gte": int(after.timestamp())}}
+
+
+def test_unknown_facet_is_rejected():
+    with pytest.raises(ValueError):
+        build_metadata_filter({"year": 2023, "revisi": 2})
+
+
+def test_document_facets_from_filename_and_first_page():
+    assert extract_document_facets("peraturan_2021_rev3.pdf") == {"doc_year": 2021, "doc_revision": 3}
+    text = "PERATURAN REKTOR NOMOR 5 TAHUN 2023 TENTANG PERUBAHAN KEDUA ATAS PERATURAN AKADEMIK"
+    assert extract_document_facets("akademik.pdf", text) == {"doc_year": 2023, "doc_revision": 2}
+    assert extract_document_facets("panduan.pdf") == {"doc_year": 0, "doc_revision": 0}
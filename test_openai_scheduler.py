@@ -0,0 +1,100 @@
+"""
+Unit test untuk openai_scheduler (token bucket, concurrency AIMD, retry dengan backoff)
+"""
+
+import time
+
+import pytest
+
+from openai_scheduler import AIMDLimiter, OpenAIScheduler, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+
+def _scheduler(**kwargs):
+    return OpenAIScheduler(**{"rpm": 0, "tpm": 0, "max_concurrency": 4, "max_retries": 3,
+                              "base_delay": 0.001, "max_delay": 0.01, **kwargs})
+
+
+def _flaky(*errors, result="ok"):
+    remaining = list(errors)
+
+    def fn():
+        if remaining:
+            raise remaining.pop(0)
+        return result
+
+    return fn
+
+
+def test_transient_errors_are_retried_until_success():
+    scheduler = _scheduler()
+    assert scheduler.call(_flaky(FakeAPIError(429), FakeAPIError(503)), call_site="chat") == "ok"
+
+    chat = scheduler.stats()["call_sites"]["chat"]
+    assert chat["calls"] == 3 and chat["retries"] == 2
+    assert chat["rate_limited"] == 1 and chat["failures"] == 0
+
+
+def test_non_retryable_error_is_raised_immediately():
+    scheduler = _scheduler()
+    with pytest.raises(FakeAPIError):
+        scheduler.call(_flaky(FakeAPIError(400)), call_site="embedding")
+
+    embedding = scheduler.stats()["call_sites"]["embedding"]
+    assert embedding["calls"] == 1 and embedding["retries"] == 0 and embedding["failures"] == 1
+
+
+def test_retries_stop_after_max_retries():
+    scheduler = _scheduler(max_retries=2)
+    with pytest.raises(FakeAPIError):
+        scheduler.call(_flaky(*[FakeAPIError(500)] * 5))
+
+    default = scheduler.stats()["call_sites"]["default"]
+    assert default["calls"] == 3 and default["retries"] == 2 and default["failures"] == 1
+
+
+def test_backoff_follows_retry_after_and_is_capped():
+    scheduler = _scheduler(base_delay=0.001, max_delay=5)
+    assert 2.0 <= scheduler._backoff(0, FakeAPIError(429, {"retry-after": "2"})) <= 2.001
+    assert 0.25 <= scheduler._backoff(0, FakeAPIError(429, {"retry-after-ms": "250"})) <= 0.251
+    assert scheduler._backoff(0, FakeAPIError(429, {"retry-after": "60"})) <= 5.001
+    assert all(0 <= scheduler._backoff(10, FakeAPIError(500)) <= 5 for _ in range(20))
+
+
+def test_aimd_limit_halves_on_rate_limit_and_grows_on_success():
+    limiter = AIMDLimiter(maximum=16)
+    assert limiter.limit == 8
+
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(throttled=True)  # Masih dalam cooldown: tidak turun dua kali
+    assert limiter.limit == 4
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert 4.9 < limiter.limit < 5.1
+    assert limiter.in_flight == 0
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(per_minute=600)  # 10 token per detik
+    assert bucket.acquire(600) == 0.0
+    started = time.monotonic()
+    waited = bucket.acquire(1)
+    assert 0.05 <= waited and time.monotonic() - started >= 0.05
+    assert TokenBucket(per_minute=0).acquire(10 ** 9) == 0.0
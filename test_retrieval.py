@@ -0,0 +1,103 @@
+"""
+Unit test untuk retrieval.py (near-duplicate filter, penggabungan chunk bertetangga, small-to-big)
+"""
+
+from retrieval import drop_near_duplicates, expand_to_parents, find_overlap, merge_adjacent_chunks
+
+
+def _chunk(chunk_id, text, filename="a.pdf", page=1):
+    return {"doc_id": f"{filename}_{page}_{chunk_id}", "filename": filename, "page": page,
+            "chunk_id": chunk_id, "text": text}
+
+
+def test_drop_near_duplicates_keeps_higher_ranked_copy():
+    docs = [
+        {"doc_id": "rev2", "text": "Mahasiswa wajib mengikuti ujian tengah semester sesuai jadwal fakultas"},
+        {"doc_id": "other", "text": "Biaya kuliah dibayar setiap awal semester melalui bank"},
+        {"doc_id": "rev1", "text": "Mahasiswa wajib mengikuti ujian tengah semester sesuai jadwal fakultas."},
+    ]
+    kept = drop_near_duplicates(docs, threshold=0.85)
+    assert [doc["doc_id"] for doc in kept] == ["rev2", "other"]
+
+
+def test_drop_near_duplicates_disabled_with_zero_threshold():
+    docs = [{"text": "sama persis"}, {"text": "sama persis"}]
+    assert drop_near_duplicates(docs, threshold=0) == docs
+
+
+def test_find_overlap_is_bounded_by_max_overlap():
+    assert find_overlap("abcdef", "defghi", max_overlap=10) == 3
+    assert find_overlap("abcdef", "defghi", max_overlap=2) == 0
+    assert find_overlap("abc", "xyz", max_overlap=10) == 0
+
+
+def test_merge_adjacent_chunks_joins_consecutive_chunks_once():
+    docs = [
+        _chunk(2, "kedua dan ketiga"),
+        _chunk(1, "pertama lalu kedua"),
+        _chunk(5, "terpisah"),
+    ]
+    spans = merge_adjacent_chunks(docs, max_overlap=10)
+
+    assert len(spans) == 2
+    merged, separate = spans
+    assert merged["chunk_ids"] == [1, 2]
+    assert merged["doc_ids"] == ["a.pdf_1_1", "a.pdf_1_2"]
+    assert merged["text"] == "pertama lalu kedua dan ketiga"
+    assert separate["chunk_ids"] == [5]
+
+
+def test_merge_adjacent_chunks_keeps_best_rank_and_separates_pages():
+    docs = [
+        _chunk(1, "halaman dua", page=2),
+        _chunk(2, "bagian b", page=1),
+        _chunk(1, "bagian a", page=1),
+    ]
+    spans = merge_adjacent_chunks(docs, max_overlap=0)
+
+    assert [span["page"] for span in spans] == [2, 1]
+    assert spans[1]["text"] == "bagian a\nbagian b"
+    assert "rank" not in spans[0]
+
+
+def _child(chunk_id, page, section_path=""):
+    chunk = _chunk(chunk_id, f"child {chunk_id}", page=page)
+    return {**chunk, "parent_id": f"a.pdf_page_{page}", "section_path": section_path}
+
+
+def _fetch(parents):
+    requested = []
+
+    def fetch(parent_ids):
+        requested.append(list(parent_ids))
+        return {parent_id: parents[parent_id] for parent_id in parent_ids if parent_id in parents}
+
+    return fetch, requested
+
+
+def test_expand_to_parents_dedupes_children_in_rank_order():
+    parents = {f"a.pdf_page_{page}": {"filename": "a.pdf", "page": page, "text": f"halaman {page}"} for page in (1, 2)}
+    fetch, requested = _fetch(parents)
+    children = [_child(3, 2, "BAB II > Pasal 5"), _child(1, 1), _child(1, 2, "BAB II > Pasal 4")]
+
+    results = expand_to_parents(children, top_k=5, fetch_parents=fetch)
+
+    assert requested == [["a.pdf_page_2", "a.pdf_page_1"]]
+    assert [result["doc_id"] for result in results] == ["a.pdf_page_2", "a.pdf_page_1"]
+    assert results[0]["text"] == "halaman 2"
+    assert results[0]["chunk_ids"] == [1, 3] and results[0]["chunk_id"] == 3
+    assert results[0]["section_path"] == "BAB II > Pasal 5"
+
+
+def test_expand_to_parents_limits_to_top_k_and_keeps_children_without_parent():
+    parents = {"a.pdf_page_1": {"filename": "a.pdf", "page": 1, "text": "halaman 1"}}
+    fetch, requested = _fetch(parents)
+    legacy = _chunk(7, "chunk lama tanpa parent", page=3)
+    orphan = _child(1, 2)
+    children = [legacy, orphan, _child(2, 1), _child(1, 4)]
+
+    results = expand_to_parents(children, top_k=3, fetch_parents=fetch)
+
+    assert requested == [["a.pdf_page_2", "a.pdf_page_1"]]
+    assert results[0] is legacy and results[1] is orphan
+    assert results[2]["text"] == "halaman 1"
@@ -0,0 +1,209 @@
+"""
+Unit test untuk single_flight.SingleFlight (coalescing request /ask yang identik, termasuk dengan admission)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+from single_flight import SingleFlight, normalize_question, request_key
+
+
+def test_normalize_question_and_request_key():
+    assert normalize_question("  Kapan   UTS?? ") == normalize_question("kapan uts")
+    assert request_key(a=1, b=[1, 2]) == request_key(b=[1, 2], a=1)
+    assert request_key(a=1, priority="batch") != request_key(a=1, priority="interactive")
+
+
+def test_concurrent_callers_share_one_computation():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "jawaban"
+
+        results = await asyncio.gather(*[flights.do("key", compute) for _ in range(3)])
+        return calls, results, flights.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert [result for result, _ in results] == ["jawaban"] * 3
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert stats == {"in_flight": 0, "leaders": 1, "coalesced": 2}
+
+
+def test_finished_flight_is_not_cached():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        first = await flights.do("key", compute)
+        second = await flights.do("key", compute)
+        return first, second
+
+    assert asyncio.run(scenario()) == ((1, False), (2, False))
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream gagal")
+
+        return await asyncio.gather(*[flights.do("key", compute) for _ in range(2)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelling_one_caller_keeps_the_computation_for_the_others():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "jawaban"
+
+        leader = asyncio.ensure_future(flights.do("key", compute))
+        follower = asyncio.ensure_future(flights.do("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await follower
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return result
+
+    assert asyncio.run(scenario()) == ("jawaban", True)
+
+
+def test_last_caller_leaving_cancels_the_computation():
+    async def scenario():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def compute():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flights.do("key", compute)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        return flights.stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == 0
+
+
+class LeaderRejected(Exception):
+    pass
+
+
+def test_leader_specific_error_makes_a_waiting_caller_the_new_leader():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        def leader(name, fail):
+            async def compute():
+                calls.append(name)
+                await asyncio.sleep(0.02)
+                if fail:
+                    raise LeaderRejected(name)
+                return name
+            return compute
+
+        first = asyncio.ensure_future(flights.do("key", leader("pertama", True), retry_on=(LeaderRejected,)))
+        await asyncio.sleep(0)
+        others = [
+            asyncio.ensure_future(flights.do("key", leader(f"ke-{i}", False), retry_on=(LeaderRejected,)))
+            for i in range(3)
+        ]
+        with pytest.raises(LeaderRejected):
+            await first
+        return calls, await asyncio.gather(*others), flights.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == ["pertama", "ke-0"]
+    assert results == [("ke-0", False), ("ke-0", True), ("ke-0", True)]
+    assert stats["in_flight"] == 0 and stats["leaders"] == 2
+
+
+def _admitted_leader(controller, compute, deadline):
+    return lambda: controller.run(compute, deadline=deadline)
+
+
+def test_burst_of_identical_callers_takes_one_admission_slot():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=2, target_delay=5.0)
+        flights = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "jawaban"
+
+        async def caller():
+            deadline = time.monotonic() + 2
+            return await asyncio.wait_for(
+                flights.do("key", _admitted_leader(controller, compute, deadline), retry_on=(AdmissionRejected,)),
+                timeout=deadline - time.monotonic()
+            )
+
+        results = await asyncio.gather(*[caller() for _ in range(100)])
+        return calls, results, controller.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert {result for result, _ in results} == {"jawaban"}
+    assert stats["admitted"] == 1 and stats["rejected"] == 0
+
+
+def test_leader_expiring_in_the_queue_hands_over_to_a_waiting_caller():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, target_delay=5.0)
+        controller.service_time = 0.01
+        flights = SingleFlight()
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(controller.run(release.wait))
+        await asyncio.sleep(0)
+
+        async def compute():
+            return "jawaban"
+
+        def call(deadline_seconds):
+            leader = _admitted_leader(controller, compute, time.monotonic() + deadline_seconds)
+            return asyncio.ensure_future(flights.do("key", leader, retry_on=(AdmissionRejected,)))
+
+        short = call(0.05)
+        await asyncio.sleep(0)
+        patient = call(5)
+        with pytest.raises(AdmissionRejected):
+            await short
+        release.set()
+        result = await patient
+        await busy
+        return result, controller.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == ("jawaban", False)
+    assert stats["expired"] == 1 and stats["in_flight"] == 0 and stats["queued"] == 0
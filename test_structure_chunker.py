@@ -0,0 +1,60 @@
+"""
+Unit test untuk structure_chunker.StructureChunker (chunk per BAB/Pasal/ayat dengan hierarchy path)
+"""
+
+from structure_chunker import LayoutLine, StructureChunker, layout_text
+
+
+def _line(text, block, first_in_block=False, bold=False, size=10.0):
+    return LayoutLine(text=text, size=size, bold=bold, block=block, first_in_block=first_in_block)
+
+
+PAGE_1 = [
+    _line("BAB I", 0, first_in_block=True, bold=True, size=12.0),
+    _line("KETENTUAN UMUM", 0, bold=True, size=12.0),
+    _line("Pasal 1", 1, first_in_block=True, bold=True),
+    _line("Dalam peraturan ini yang dimaksud dengan:", 2, first_in_block=True),
+    _line("(1) Universitas adalah perguruan tinggi.", 2),
+    _line("(2) Rektor adalah pimpinan universitas.", 2),
+]
+PAGE_2 = [
+    _line("sambungan ayat dua di halaman berikut.", 0, first_in_block=True),
+    _line("Pasal 2", 1, first_in_block=True, bold=True),
+    _line("Sesuai Pasal 1 ayat (2) rektor menetapkan kalender akademik.", 2, first_in_block=True),
+    _line("Pasal 3", 2),
+]
+
+
+def test_pasal_that_fits_is_one_chunk_with_its_hierarchy_path():
+    page_paths, chunks = StructureChunker(chunk_size=1000).chunk_pages([PAGE_1])
+
+    assert page_paths == [""]
+    assert len(chunks[1]) == 1
+    chunk = chunks[1][0]
+    assert chunk["section_path"] == "BAB I KETENTUAN UMUM > Pasal 1"
+    assert chunk["section"] == "Pasal 1"
+    assert chunk["text"].startswith("BAB I\nKETENTUAN UMUM\nPasal 1\nDalam peraturan")
+
+
+def test_long_pasal_is_split_on_ayat_boundaries():
+    _, chunks = StructureChunker(chunk_size=70).chunk_pages([PAGE_1])
+
+    texts = [chunk["text"] for chunk in chunks[1]]
+    assert texts[1:] == ["(1) Universitas adalah perguruan tinggi.", "(2) Rektor adalah pimpinan universitas."]
+    assert all(len(text) <= 70 for text in texts)
+    assert {chunk["section_path"] for chunk in chunks[1]} == {"BAB I KETENTUAN UMUM > Pasal 1"}
+
+
+def test_path_carries_across_pages_and_references_are_not_headings():
+    page_paths, chunks = StructureChunker(chunk_size=1000).chunk_pages([PAGE_1, PAGE_2])
+
+    assert page_paths == ["", "BAB I KETENTUAN UMUM > Pasal 1"]
+    continued, pasal_2 = chunks[2]
+    assert continued["section_path"] == "BAB I KETENTUAN UMUM > Pasal 1"
+    # "Pasal 3" tanpa penekanan di tengah block bukan heading
+    assert pasal_2["section_path"] == "BAB I KETENTUAN UMUM > Pasal 2"
+    assert pasal_2["text"].endswith("kalender akademik.\nPasal 3")
+
+
+def test_layout_text_separates_blocks_with_a_blank_line():
+    assert layout_text(PAGE_1[:4]) == "BAB I\nKETENTUAN UMUM\n\nPasal 1\n\nDalam peraturan ini yang dimaksud dengan:"